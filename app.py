@@ -1,7 +1,52 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
-import json
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import logging
+import math
+import os
+import time
+
+from ifs_eligibilite.questionnaire import questionnaire_actif, questionnaire_par_empreinte
+from ifs_eligibilite.moteur import (
+    SEUILS_CATEGORIES,
+    determiner_eligibilite,
+    score_initial,
+    mettre_a_jour_score,
+    resultats_score_courant,
+    ReponsesCompactes,
+    compacter_reponses,
+    developper_reponses,
+    libelle_reponse,
+)
+from ifs_eligibilite.sessions import RegistreSessions, memoire_objet
+from ifs_eligibilite.stockage import (
+    sauvegarder_evaluation,
+    charger_evaluation,
+    charger_evaluation_jeton,
+    nouveau_jeton,
+    position_population,
+)
+from ifs_eligibilite.rapports import FORMATS
+from ifs_eligibilite.cache import rapport_formate_en_cache
+from ifs_eligibilite.amelioration import plans_amelioration
+from ifs_eligibilite.instrumentation import METRIQUES, demarrer_mesure, mesure_courante, phase
+from ifs_eligibilite import evenements, reprise
+
+debut_rerun = time.perf_counter()
+# Durées par phase, étape et taille de session (si IFS_METRIQUES_* ou IFS_PROFILEUR_* est défini)
+mesure = demarrer_mesure()
+
+# Mode de rendu des pages de questions :
+# - "fragments" (défaut) : une réponse ne réexécute que le bloc de questions de la page
+# - "complet" : chaque réponse réexécute tout le script
+# - "formulaire" : les réponses de la page sont validées en une seule exécution par "Suivant"
+MODE_RENDU = os.environ.get("IFS_MODE_RENDU", "fragments")
+
+# Inactivité (minutes) au-delà de laquelle l'évaluation d'une session est
+# enregistrée puis effacée de la mémoire du serveur
+INACTIVITE_SESSION = float(os.environ.get("IFS_INACTIVITE_SESSION_MIN", "30")) * 60
+
+# Nombre d'évaluations enregistrées à partir duquel la position dans la population est affichée
+POPULATION_MINIMALE = 20
 
 # Configuration de la page
 st.set_page_config(
@@ -10,8 +55,57 @@ st.set_page_config(
     layout="wide"
 )
 
+def charger_questionnaire():
+    """Questionnaire et tables de points compilées de la session
+    
+    Les formes compilées sont partagées par toutes les sessions du processus.
+    Une session garde la version active à son ouverture jusqu'à la fin de
+    l'évaluation, même si une nouvelle version est publiée entre-temps.
+    """
+    definition = questionnaire_par_empreinte(st.session_state.get("empreinte_questionnaire"))
+    if definition is None:
+        definition = questionnaire_actif()
+        st.session_state.empreinte_questionnaire = definition["empreinte"]
+    return definition["questions"], definition["compile"]
+
+@st.cache_resource
+def journal_rendu():
+    """Journal des temps d'exécution du script, configuré une fois par processus"""
+    logger = logging.getLogger("ifs_eligibilite.rendu")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+@st.cache_resource
+def registre_sessions():
+    """Activité des sessions du processus, partagée par toutes les sessions"""
+    registre = RegistreSessions(INACTIVITE_SESSION)
+    
+    def jauges():
+        statistiques = registre.statistiques(memoire_etat)
+        return {
+            "ifs_sessions_suivies": statistiques["sessions"],
+            "ifs_sessions_memoire_octets": statistiques["memoire_octets"],
+        }
+    
+    METRIQUES.ajouter_jauges(jauges)
+    return registre
+
+def memoire_etat(etat):
+    """Mémoire de l'état d'une session : valeurs enregistrées et widgets nommés"""
+    try:
+        return memoire_objet(etat.filtered_state, questionnaire_actif()["compile"])
+    except RuntimeError:
+        # État modifié pendant la mesure par l'exécution en cours de la session
+        return 0
+
 # Styles CSS personnalisés
-st.markdown("""
+with phase("css"):
+    st.markdown("""
 <style>
     .big-font {
         font-size:20px !important;
@@ -36,388 +130,339 @@ st.markdown("""
         border: 1px solid #f5c6cb;
     }
 </style>
-""", unsafe_allow_html=True)
+    """, unsafe_allow_html=True)
+
+def journaliser(encoder, *args):
+    """Ajoute un événement au journal des réponses, si IFS_EVENEMENTS est défini ; n'attend jamais le disque"""
+    journal = evenements.journal()
+    if journal is not None:
+        journal.ajouter(encoder(SESSION_EVENEMENTS, *args))
+
+def reprendre_evaluation(jeton):
+    """Recharge dans la session l'évaluation enregistrée d'un jeton ; retourne False si elle n'existe pas"""
+    evaluation = charger_evaluation_jeton(jeton)
+    if evaluation is None:
+        return False
+    evaluation_id = evaluation["id"]
+    
+    # L'évaluation reprend avec sa version du questionnaire si elle est encore chargée
+    definition = questionnaire_par_empreinte(evaluation["empreinte_questionnaire"]) or questionnaire_actif()
+    score = score_initial(definition["compile"])
+    for question_id, valeur in evaluation["reponses"].items():
+        mettre_a_jour_score(score, question_id, None, valeur, definition["compile"])
+    
+    # Les évaluations importées en lot n'ont pas d'étape : elles s'ouvrent sur les résultats
+    st.session_state.empreinte_questionnaire = definition["empreinte"]
+    st.session_state.etape = evaluation["etape"] or len(definition["questions"]) + 1
+    st.session_state.reponses = compacter_reponses(evaluation["reponses"], definition["compile"])
+    st.session_state.score_courant = score
+    st.session_state.evaluation_id = evaluation_id
+    st.session_state.jeton_evaluation = jeton
+    journaliser(evenements.encoder_debut, definition["empreinte"], evaluation_id)
+    return True
+
+def reprendre_point(jeton):
+    """Recharge dans la session un point de reprise ; retourne False s'il n'existe pas ou n'est pas lisible ici"""
+    point = reprise.charger_point(jeton)
+    if point is None:
+        return False
+    
+    definition = questionnaire_par_empreinte(point["empreinte"])
+    score = score_initial(definition["compile"])
+    for question_id, valeur in developper_reponses(point["reponses"], definition["compile"]).items():
+        mettre_a_jour_score(score, question_id, None, valeur, definition["compile"])
+    
+    st.session_state.empreinte_questionnaire = point["empreinte"]
+    st.session_state.etape = point["etape"]
+    st.session_state.reponses = point["reponses"]
+    st.session_state.score_courant = score
+    st.session_state.evaluation_id = point["evaluation_id"]
+    # Le lien de l'évaluation reste celui de son premier enregistrement
+    evaluation = charger_evaluation(point["evaluation_id"]) if point["evaluation_id"] is not None else None
+    st.session_state.jeton_evaluation = evaluation["jeton"] if evaluation else None
+    st.session_state.jeton_session = jeton
+    journaliser(evenements.encoder_debut, point["empreinte"], point["evaluation_id"])
+    return True
+
+def liberer_session(etat):
+    """Enregistre la page en cours d'une session inactive puis efface son état
+    
+    Au retour de l'auditeur, l'évaluation est reprise depuis le lien
+    ?evaluation=<jeton> (ou ?session=<jeton>) de sa page, comme après un
+    rechargement.
+    """
+    try:
+        evaluation_id, etape = etat["evaluation_id"], etat["etape"]
+        definition = questionnaire_par_empreinte(etat["empreinte_questionnaire"])
+        # Une évaluation sans identifiant n'est pas joignable depuis la page ;
+        # une évaluation terminée a été enregistrée en atteignant les résultats
+        if evaluation_id is not None and definition and etape <= len(definition["questions"]):
+            sauvegarder_evaluation(
+                developper_reponses(etat["reponses"], definition["compile"]), etape,
+                evaluation_id=evaluation_id, questionnaire=definition["compile"]
+            )
+            if reprise.actif():
+                reprise.enregistrer_point(
+                    etat["jeton_session"], definition["empreinte"], etape, etat["reponses"], evaluation_id
+                )
+    except KeyError:
+        pass
+    etat.clear()
+
+# Libération des sessions inactives, puis activité de la session courante.
+# Le registre garde l'état interne de la session : celui exposé par
+# st.session_state ne vit que le temps d'une exécution.
+contexte = get_script_run_ctx()
+for etat_inactif in registre_sessions().inactives():
+    liberer_session(etat_inactif)
+registre_sessions().signaler(contexte.session_id, contexte.session_state._state)
+SESSION_EVENEMENTS = evenements.identifiant_session(contexte.session_id)
 
 # Initialisation de l'état de session
+if 'evaluation_id' not in st.session_state:
+    st.session_state.evaluation_id = None
+    st.session_state.jeton_evaluation = None
+    # Reprise depuis le lien : point de reprise ?session=<jeton> (si IFS_SESSIONS
+    # est défini), sinon évaluation enregistrée ?evaluation=<jeton>. Les jetons
+    # sont aléatoires : l'identifiant séquentiel d'une évaluation n'est jamais
+    # dans le lien, qui ne permet pas d'atteindre celles des autres
+    if not (reprise.actif() and reprendre_point(st.query_params.get("session", ""))):
+        evaluation_demandee = st.query_params.get("evaluation", "")
+        if not (evaluation_demandee and reprendre_evaluation(evaluation_demandee)):
+            st.query_params.clear()
+
+QUESTIONS, QUESTIONNAIRE_COMPILE = charger_questionnaire()
+
 if 'etape' not in st.session_state:
     st.session_state.etape = 1
 if 'reponses' not in st.session_state:
-    st.session_state.reponses = {}
+    # Réponses compactes : indice de l'option pour les questions à choix,
+    # valeur saisie pour les autres ; les libellés ne sont reconstruits
+    # que pour l'affichage, l'enregistrement et les rapports
+    st.session_state.reponses = ReponsesCompactes(QUESTIONNAIRE_COMPILE)
+    journaliser(evenements.encoder_debut, st.session_state.empreinte_questionnaire)
+if 'score_courant' not in st.session_state:
+    st.session_state.score_courant = score_initial(QUESTIONNAIRE_COMPILE)
 
 # Titre principal
 st.title("🎯 Outil d'Éligibilité IFS Food Version 8")
 st.markdown("*Évaluez rapidement si votre entreprise est prête pour la certification IFS Food v8*")
 st.markdown("---")
 
-# Définition des questions par catégorie
-QUESTIONS = {
-    "informations": {
-        "titre": "📋 Informations Générales",
-        "questions": [
-            {
-                "id": "nom_entreprise",
-                "question": "Nom de l'entreprise",
-                "type": "text",
-                "obligatoire": True
-            },
-            {
-                "id": "activite",
-                "question": "Type d'activité",
-                "type": "select",
-                "options": ["Transformation de produits alimentaires", "Conditionnement de produits nus", "Production de produits combinés", "Autre"],
-                "obligatoire": True
-            },
-            {
-                "id": "nb_employes",
-                "question": "Nombre d'employés",
-                "type": "number",
-                "obligatoire": True
-            },
-            {
-                "id": "production_annee",
-                "question": "Depuis combien de temps l'entreprise est-elle en production ?",
-                "type": "select",
-                "options": ["Moins de 3 mois", "3-6 mois", "6-12 mois", "Plus d'un an"],
-                "points": [0, 5, 10, 15],
-                "obligatoire": True
-            }
-        ]
-    },
-    "prerequis_ko": {
-        "titre": "⚠️ Prérequis Essentiels (Exigences KO)",
-        "description": "Ces éléments sont **OBLIGATOIRES** pour la certification IFS Food",
-        "questions": [
-            {
-                "id": "ko_1",
-                "question": "Avez-vous un responsable qualité/sécurité alimentaire identifié avec des responsabilités documentées ?",
-                "reference": "KO n°1 - 1.2.1",
-                "type": "radio",
-                "options": ["Oui", "Non"],
-                "points": [100, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_2",
-                "question": "Disposez-vous d'un système de surveillance documenté pour chaque CCP (Point Critique de Contrôle) ?",
-                "reference": "KO n°2 - 2.3.9.1",
-                "type": "radio",
-                "options": ["Oui, tous les CCP sont surveillés", "Partiellement", "Non", "Nous n'avons pas de CCP identifiés"],
-                "points": [100, 30, 0, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_3",
-                "question": "Avez-vous des exigences d'hygiène personnelle documentées et appliquées par tous ?",
-                "reference": "KO n°3 - 3.2.2",
-                "type": "radio",
-                "options": ["Oui", "Partiellement", "Non"],
-                "points": [100, 40, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_4",
-                "question": "Les accords avec les clients (recettes, procédés, conditionnement) sont-ils respectés ?",
-                "reference": "KO n°4 - 4.1.3",
-                "type": "radio",
-                "options": ["Oui, systématiquement", "La plupart du temps", "Non applicable - pas d'accords clients", "Non"],
-                "points": [100, 50, 100, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_5",
-                "question": "Disposez-vous de spécifications documentées pour toutes vos matières premières ?",
-                "reference": "KO n°5 - 4.2.1.3",
-                "type": "radio",
-                "options": ["Oui, pour toutes", "Pour la majorité", "Pour quelques-unes", "Non"],
-                "points": [100, 50, 20, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_6",
-                "question": "Avez-vous des procédures pour empêcher la contamination par des corps étrangers ?",
-                "reference": "KO n°6 - 4.12.1",
-                "type": "radio",
-                "options": ["Oui, documentées et appliquées", "Oui, mais non documentées", "Partiellement", "Non"],
-                "points": [100, 40, 20, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_7",
-                "question": "Avez-vous un système de traçabilité documenté (du fournisseur au client) ?",
-                "reference": "KO n°7 - 4.18.1",
-                "type": "radio",
-                "options": ["Oui, complet et testé", "Oui, mais non testé", "Partiellement", "Non"],
-                "points": [100, 60, 20, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_8",
-                "question": "Réalisez-vous des audits internes couvrant toutes les exigences IFS au moins une fois par an ?",
-                "reference": "KO n°8 - 5.1.1",
-                "type": "radio",
-                "options": ["Oui, régulièrement", "Occasionnellement", "Non, jamais"],
-                "points": [100, 30, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_9",
-                "question": "Avez-vous une procédure documentée pour gérer les rappels et retraits de produits ?",
-                "reference": "KO n°9 - 5.9.1",
-                "type": "radio",
-                "options": ["Oui, documentée et testée", "Oui, mais non testée", "Non"],
-                "points": [100, 50, 0],
-                "ko": True
-            },
-            {
-                "id": "ko_10",
-                "question": "Mettez-vous en place des actions correctives pour éviter la réapparition des non-conformités ?",
-                "reference": "KO n°10 - 5.11.3",
-                "type": "radio",
-                "options": ["Oui, systématiquement", "Parfois", "Non"],
-                "points": [100, 40, 0],
-                "ko": True
-            }
-        ]
-    },
-    "systeme_qualite": {
-        "titre": "📊 Système de Management Qualité",
-        "questions": [
-            {
-                "id": "politique_qualite",
-                "question": "Disposez-vous d'une politique qualité et sécurité alimentaire documentée ?",
-                "reference": "1.1.1",
-                "type": "radio",
-                "options": ["Oui, communiquée à tous", "Oui, mais non communiquée", "Non"],
-                "points": [20, 10, 0]
-            },
-            {
-                "id": "revue_direction",
-                "question": "Réalisez-vous une revue de direction au moins une fois par an ?",
-                "reference": "1.3.1",
-                "type": "radio",
-                "options": ["Oui, régulièrement", "Occasionnellement", "Non"],
-                "points": [20, 10, 0]
-            },
-            {
-                "id": "haccp",
-                "question": "Avez-vous un plan HACCP complet et documenté ?",
-                "reference": "2.2.1.1",
-                "type": "radio",
-                "options": ["Oui, conforme Codex Alimentarius", "Oui, mais incomplet", "En cours d'élaboration", "Non"],
-                "points": [30, 15, 5, 0]
-            },
-            {
-                "id": "gestion_doc",
-                "question": "Avez-vous un système de gestion documentaire (procédures, enregistrements) ?",
-                "reference": "2.1.1",
-                "type": "radio",
-                "options": ["Oui, système complet", "Partiellement", "Non"],
-                "points": [15, 8, 0]
-            },
-            {
-                "id": "reclamations",
-                "question": "Avez-vous une procédure de gestion des réclamations clients ?",
-                "reference": "5.8.1",
-                "type": "radio",
-                "options": ["Oui, documentée et appliquée", "Oui, mais informelle", "Non"],
-                "points": [15, 7, 0]
-            }
-        ]
-    },
-    "ressources": {
-        "titre": "👥 Ressources et Compétences",
-        "questions": [
-            {
-                "id": "formation",
-                "question": "Disposez-vous d'un programme de formation documenté pour le personnel ?",
-                "reference": "3.3.1",
-                "type": "radio",
-                "options": ["Oui, avec plan annuel", "Oui, mais informel", "Non"],
-                "points": [20, 10, 0]
-            },
-            {
-                "id": "formation_haccp",
-                "question": "Votre personnel clé a-t-il été formé à l'HACCP ?",
-                "reference": "2.3.1.2",
-                "type": "radio",
-                "options": ["Oui, formation externe certifiée", "Oui, formation interne", "Non"],
-                "points": [15, 10, 0]
-            },
-            {
-                "id": "installations",
-                "question": "Vos installations sont-elles adaptées à la production alimentaire (locaux, équipements) ?",
-                "reference": "4.9.1.1",
-                "type": "radio",
-                "options": ["Oui, conformes", "Partiellement conformes", "Non conformes"],
-                "points": [20, 10, 0]
-            },
-            {
-                "id": "nettoyage",
-                "question": "Avez-vous un plan de nettoyage et désinfection documenté ?",
-                "reference": "4.10.1",
-                "type": "radio",
-                "options": ["Oui, documenté et validé", "Oui, mais non validé", "Non"],
-                "points": [15, 8, 0]
-            }
-        ]
-    },
-    "controles": {
-        "titre": "🔬 Contrôles et Analyses",
-        "questions": [
-            {
-                "id": "analyses",
-                "question": "Réalisez-vous des analyses de produits (internes ou externes) ?",
-                "reference": "5.6.1",
-                "type": "radio",
-                "options": ["Oui, plan d'analyses complet", "Oui, analyses ponctuelles", "Non"],
-                "points": [20, 10, 0]
-            },
-            {
-                "id": "maitrise_quantite",
-                "question": "Avez-vous un système de maîtrise des quantités ?",
-                "reference": "5.5.1",
-                "type": "radio",
-                "options": ["Oui", "Partiellement", "Non"],
-                "points": [15, 8, 0]
-            },
-            {
-                "id": "etalonnage",
-                "question": "Vos appareils de mesure sont-ils étalonnés régulièrement ?",
-                "reference": "5.4.2",
-                "type": "radio",
-                "options": ["Oui, programme d'étalonnage", "Occasionnellement", "Non"],
-                "points": [15, 5, 0]
-            },
-            {
-                "id": "produits_nc",
-                "question": "Avez-vous une procédure pour gérer les produits non conformes ?",
-                "reference": "5.10.1",
-                "type": "radio",
-                "options": ["Oui, documentée", "Oui, mais informelle", "Non"],
-                "points": [15, 7, 0]
-            }
-        ]
-    }
-}
-
-def calculer_score(reponses):
-    """Calcule le score total et par catégorie"""
-    score_total = 0
-    score_max = 0
-    scores_categories = {}
-    ko_manquants = []
-    
-    for categorie, data in QUESTIONS.items():
-        if categorie == "informations":
-            continue
-            
-        score_cat = 0
-        max_cat = 0
-        
-        for q in data["questions"]:
-            if q["type"] in ["radio", "select"] and "points" in q:
-                max_points = max(q["points"])
-                max_cat += max_points
-                
-                if q["id"] in reponses:
-                    idx = q["options"].index(reponses[q["id"]])
-                    points = q["points"][idx]
-                    score_cat += points
-                    
-                    # Vérifier les KO
-                    if q.get("ko", False) and points < 100:
-                        ko_manquants.append({
-                            "question": q["question"],
-                            "reference": q.get("reference", ""),
-                            "reponse": reponses[q["id"]]
-                        })
-        
-        if max_cat > 0:
-            scores_categories[categorie] = {
-                "score": score_cat,
-                "max": max_cat,
-                "pourcentage": (score_cat / max_cat) * 100
-            }
-            score_total += score_cat
-            score_max += max_cat
-    
-    pourcentage_total = (score_total / score_max * 100) if score_max > 0 else 0
-    
-    return {
-        "score": score_total,
-        "max": score_max,
-        "pourcentage": pourcentage_total,
-        "categories": scores_categories,
-        "ko_manquants": ko_manquants
-    }
+def enregistrer_reponse(question_id, valeur):
+    """Enregistre une réponse et reporte son changement sur le score courant"""
+    ancienne = st.session_state.reponses.get(question_id)
+    if valeur == ancienne:
+        return
+    st.session_state.reponses[question_id] = valeur
+    journaliser(evenements.encoder_reponse, question_id, valeur, question_id not in QUESTIONNAIRE_COMPILE["options"])
+    mettre_a_jour_score(
+        st.session_state.score_courant, question_id,
+        libelle_reponse(question_id, ancienne, QUESTIONNAIRE_COMPILE),
+        libelle_reponse(question_id, valeur, QUESTIONNAIRE_COMPILE),
+        QUESTIONNAIRE_COMPILE
+    )
 
-def determiner_eligibilite(resultats):
-    """Détermine l'éligibilité basée sur le score"""
-    pourcentage = resultats["pourcentage"]
-    ko_manquants = len(resultats["ko_manquants"])
-    
-    if ko_manquants > 0:
-        return {
-            "statut": "NON_ELIGIBLE",
-            "niveau": "❌ NON ÉLIGIBLE",
-            "couleur": "danger",
-            "message": f"**{ko_manquants} exigence(s) KO manquante(s)**. Ces prérequis essentiels sont OBLIGATOIRES pour la certification IFS Food."
-        }
-    elif pourcentage >= 90:
-        return {
-            "statut": "ELIGIBLE",
-            "niveau": "✅ ÉLIGIBLE",
-            "couleur": "success",
-            "message": "Votre entreprise semble prête pour entamer le processus de certification IFS Food v8."
-        }
-    elif pourcentage >= 75:
-        return {
-            "statut": "ELIGIBLE_RESERVE",
-            "niveau": "⚠️ ÉLIGIBLE AVEC RÉSERVES",
-            "couleur": "warning",
-            "message": "Votre entreprise a les bases nécessaires, mais des améliorations sont recommandées avant l'audit."
-        }
-    elif pourcentage >= 50:
-        return {
-            "statut": "AMELIORATIONS_REQUISES",
-            "niveau": "⚠️ AMÉLIORATIONS IMPORTANTES REQUISES",
-            "couleur": "warning",
-            "message": "Une mise à niveau significative de votre système qualité est nécessaire avant de pouvoir envisager la certification."
-        }
-    else:
-        return {
-            "statut": "NON_ELIGIBLE",
-            "niveau": "❌ NON ÉLIGIBLE",
-            "couleur": "danger",
-            "message": "Les prérequis fondamentaux ne sont pas en place. Un accompagnement est fortement recommandé."
-        }
+def reponse_donnee(question_id, valeur):
+    """Indique si la valeur d'un widget est une réponse à enregistrer
+    
+    Une réponse à choix est un indice d'option, 0 compris ; un texte vide ou
+    un nombre nul ne sont pas enregistrés.
+    """
+    if question_id in QUESTIONNAIRE_COMPILE["options"]:
+        return valeur is not None
+    return bool(valeur)
+
+def sur_changement_reponse(question_id, key):
+    """Callback des widgets : enregistre la nouvelle réponse avant la réexécution"""
+    valeur = st.session_state[key]
+    if reponse_donnee(question_id, valeur):
+        enregistrer_reponse(question_id, valeur)
 
-def afficher_question(question, categorie_id):
+def afficher_question(question, categorie_id, formulaire=False):
     """Affiche une question selon son type"""
     key = f"{categorie_id}_{question['id']}"
+    # Dans un formulaire, seuls les boutons de validation acceptent un callback
+    if formulaire:
+        sur_changement = {}
+    else:
+        sur_changement = {"on_change": sur_changement_reponse, "args": (question["id"], key)}
     
     # Affichage de la question avec référence
     st.markdown(f"**{question['question']}**")
     if "reference" in question:
         st.caption(f"📖 Référence IFS: {question['reference']}")
     
+    # Réponse déjà enregistrée (page revisitée ou évaluation reprise)
+    precedente = st.session_state.reponses.get(question["id"])
+    
+    # Les widgets à choix ont pour valeur l'indice de l'option : les libellés
+    # ne sont pas recopiés dans l'état de session
+    if "options" in question:
+        choix = {
+            "options": range(len(question["options"])),
+            "index": precedente or 0,
+            "format_func": question["options"].__getitem__
+        }
+    
     # Gestion selon le type de question
     if question["type"] == "text":
-        valeur = st.text_input("", key=key, label_visibility="collapsed")
+        valeur = st.text_input("", value=precedente or "", key=key, **sur_changement, label_visibility="collapsed")
     elif question["type"] == "number":
-        valeur = st.number_input("", min_value=0, key=key, label_visibility="collapsed")
+        valeur = st.number_input("", min_value=0, value=int(precedente or 0), key=key, **sur_changement, label_visibility="collapsed")
     elif question["type"] == "select":
-        valeur = st.selectbox("", question["options"], key=key, label_visibility="collapsed")
+        valeur = st.selectbox("", **choix, key=key, **sur_changement, label_visibility="collapsed")
     elif question["type"] == "radio":
-        valeur = st.radio("", question["options"], key=key, label_visibility="collapsed")
+        valeur = st.radio("", **choix, key=key, **sur_changement, label_visibility="collapsed")
     else:
         valeur = None
     
-    if valeur:
-        st.session_state.reponses[question["id"]] = valeur
+    # Les valeurs par défaut affichées ne déclenchent pas de callback
+    if reponse_donnee(question["id"], valeur):
+        enregistrer_reponse(question["id"], valeur)
     
     st.markdown("---")
 
+def afficher_questions(questions, categorie_id, formulaire=False):
+    """Affiche les questions d'une catégorie"""
+    debut = time.perf_counter()
+    
+    with phase("questions"):
+        for question in questions:
+            afficher_question(question, categorie_id, formulaire)
+    
+    journal_rendu().info(
+        "questions categorie=%s mode=%s duree_ms=%.1f",
+        categorie_id, MODE_RENDU, (time.perf_counter() - debut) * 1000
+    )
+
+@st.fragment
+def afficher_questions_fragment(questions, categorie_id):
+    """Affiche les questions d'une catégorie ; seul ce bloc est réexécuté quand une réponse change"""
+    # Réexécution du fragment seul : le script n'a pas ouvert de mesure
+    mesure_fragment = None if mesure_courante() else demarrer_mesure("fragment")
+    afficher_questions(questions, categorie_id)
+    
+    # Un fragment ne peut pas écrire dans la barre latérale : rappel du score sous les questions
+    with phase("score"):
+        resultats = resultats_score_courant(st.session_state.score_courant, QUESTIONNAIRE_COMPILE)
+    st.caption(
+        f"📊 Score en cours : {resultats['pourcentage']:.1f}% "
+        f"· {len(resultats['ko_manquants'])} exigence(s) KO manquante(s)"
+    )
+    
+    if mesure_fragment:
+        mesure_fragment.terminer(st.session_state.etape, st.session_state)
+
+def afficher_formulaire(questions, categorie_id, nb_categories):
+    """Affiche les questions d'une catégorie dans un formulaire validé par la navigation
+    
+    Aucune réponse ne provoque de réexécution : les valeurs de la page sont
+    transmises ensemble lors du clic sur un bouton de navigation, et
+    enregistrées par afficher_question pendant cette unique exécution.
+    """
+    with st.form(f"formulaire_{categorie_id}", border=False):
+        afficher_questions(questions, categorie_id, formulaire=True)
+        
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            precedent = st.session_state.etape > 1 and st.form_submit_button("⬅️ Précédent")
+        with col3:
+            if st.session_state.etape < nb_categories:
+                suivant = st.form_submit_button("Suivant ➡️")
+            else:
+                suivant = st.form_submit_button("🎯 Voir les résultats")
+    
+    if precedent:
+        changer_etape(st.session_state.etape - 1)
+    if suivant:
+        changer_etape(st.session_state.etape + 1)
+
+def sauvegarder_session():
+    """Enregistre l'évaluation de la session, terminée une fois les résultats atteints"""
+    resultats = eligibilite = None
+    if st.session_state.etape > len(QUESTIONS):
+        resultats = resultats_score_courant(st.session_state.score_courant, QUESTIONNAIRE_COMPILE)
+        eligibilite = determiner_eligibilite(resultats)
+    
+    if st.session_state.jeton_evaluation is None:
+        st.session_state.jeton_evaluation = nouveau_jeton()
+    st.session_state.evaluation_id = sauvegarder_evaluation(
+        developper_reponses(st.session_state.reponses, QUESTIONNAIRE_COMPILE), st.session_state.etape, resultats, eligibilite,
+        evaluation_id=st.session_state.evaluation_id, questionnaire=QUESTIONNAIRE_COMPILE,
+        jeton=st.session_state.jeton_evaluation
+    )
+    # Le lien de la page permet de reprendre l'évaluation
+    st.query_params["evaluation"] = st.session_state.jeton_evaluation
+
+def ecrire_point_reprise():
+    """Écrit le point de reprise de la session, si IFS_SESSIONS est défini"""
+    if not reprise.actif():
+        return
+    if "jeton_session" not in st.session_state:
+        st.session_state.jeton_session = reprise.nouveau_jeton()
+    with phase("reprise"):
+        reprise.enregistrer_point(
+            st.session_state.jeton_session, st.session_state.empreinte_questionnaire,
+            st.session_state.etape, st.session_state.reponses, st.session_state.evaluation_id
+        )
+    # Tout processus reprend la session depuis le lien de la page
+    st.query_params["session"] = st.session_state.jeton_session
+
+def changer_etape(etape):
+    """Passe à une autre étape en enregistrant la progression"""
+    st.session_state.etape = etape
+    sauvegarder_session()
+    ecrire_point_reprise()
+    journaliser(evenements.encoder_etape, etape, st.session_state.evaluation_id)
+    # st.rerun() interrompt le script avant la fin de la mesure
+    mesure.terminer(etape, st.session_state)
+    st.rerun()
+
+def afficher_score_courant():
+    """Affiche le score courant dans la barre latérale"""
+    with phase("score"):
+        resultats = resultats_score_courant(st.session_state.score_courant, QUESTIONNAIRE_COMPILE)
+    
+    with st.sidebar:
+        st.markdown("### 📊 Score en cours")
+        st.metric("Score global", f"{resultats['pourcentage']:.1f}%")
+        
+        nb_ko = len(resultats["ko_manquants"])
+        if nb_ko:
+            st.error(f"{nb_ko} exigence(s) KO manquante(s)")
+        else:
+            st.success("Aucune exigence KO manquante")
+        
+        for cat_id, cat_data in resultats["categories"].items():
+            st.caption(f"{QUESTIONS[cat_id]['titre']} : {cat_data['pourcentage']:.0f}%")
+
+def afficher_plans(plans):
+    """Affiche, pour chaque seuil non atteint, les changements minimaux pour l'atteindre"""
+    st.markdown("### 🎯 Chemin vers l'éligibilité")
+    
+    for plan in plans:
+        with st.expander(f"{plan['niveau']} ({plan['seuil']}%)", expanded=plan["statut"] == plans[0]["statut"]):
+            if not plan["atteignable"]:
+                st.write("Ce seuil ne peut pas être atteint.")
+                continue
+            st.write(
+                f"**{len(plan['changements'])} réponse(s) à faire évoluer** : "
+                f"{plan['score_actuel']} → {plan['score_atteint']} points "
+                f"(objectif {plan['score_cible']}/{QUESTIONNAIRE_COMPILE['max']})"
+            )
+            for changement in plan["changements"]:
+                marque = "🚨 " if changement["ko"] else ""
+                st.markdown(
+                    f"- {marque}**{changement['question']}**  \n"
+                    f"  *{changement['actuelle'] or 'Sans réponse'}* → **{changement['cible']}** "
+                    f"(+{changement['points']} points · {changement['reference']})"
+                )
+
+def libelle_position(part):
+    """« top X % » : part des évaluations qui font mieux (ex aequo pour moitié), au pour cent supérieur"""
+    return f"top {max(1, math.ceil(part))} %"
+
 def afficher_resultats(resultats, eligibilite, reponses):
     """Affiche les résultats de l'évaluation"""
     st.markdown("## 📊 Résultats de l'Évaluation")
@@ -434,11 +479,17 @@ def afficher_resultats(resultats, eligibilite, reponses):
     
     st.markdown("---")
     
+    # Position dans la population des évaluations enregistrées, lue dans un histogramme tenu à jour
+    position = position_population(resultats)
+    if position["population"] < POPULATION_MINIMALE:
+        position = {"total": None, "categories": {}}
+    population = f" · {libelle_position(position['total'])} des évaluations" if position["total"] is not None else ""
+    
     # Résultat principal
     st.markdown(f"""
     <div class='{eligibilite["couleur"]}-box'>
         <h2 style='margin:0;'>{eligibilite["niveau"]}</h2>
-        <p style='font-size:24px; margin:10px 0;'><strong>Score: {resultats['pourcentage']:.1f}%</strong> ({resultats['score']}/{resultats['max']} points)</p>
+        <p style='font-size:24px; margin:10px 0;'><strong>Score: {resultats['pourcentage']:.1f}%</strong> ({resultats['score']}/{resultats['max']} points){population}</p>
         <p style='margin:0;'>{eligibilite["message"]}</p>
     </div>
     """, unsafe_allow_html=True)
@@ -466,9 +517,9 @@ def afficher_resultats(resultats, eligibilite, reponses):
         pourcentage = cat_data["pourcentage"]
         
         # Couleur selon le score
-        if pourcentage >= 80:
+        if pourcentage >= SEUILS_CATEGORIES["BON"]:
             couleur = "🟢"
-        elif pourcentage >= 50:
+        elif pourcentage >= SEUILS_CATEGORIES["MOYEN"]:
             couleur = "🟡"
         else:
             couleur = "🔴"
@@ -480,7 +531,8 @@ def afficher_resultats(resultats, eligibilite, reponses):
             st.markdown(f"**{pourcentage:.0f}%**")
         
         st.progress(pourcentage / 100)
-        st.caption(f"{cat_data['score']}/{cat_data['max']} points")
+        part = position["categories"].get(cat_id)
+        st.caption(f"{cat_data['score']}/{cat_data['max']} points" + (f" · {libelle_position(part)}" if part is not None else ""))
         st.markdown("")
     
     # Recommandations
@@ -516,32 +568,25 @@ def afficher_resultats(resultats, eligibilite, reponses):
         5. ❌ Délai minimum avant certification: 6-12 mois
         """)
     
+    # Changements de réponses les moins nombreux menant aux seuils supérieurs
+    if eligibilite["statut"] != "ELIGIBLE":
+        afficher_plans(plans_amelioration(reponses, questionnaire=QUESTIONNAIRE_COMPILE))
+    
     # Bouton de téléchargement du rapport
     st.markdown("---")
     
-    rapport_json = {
-        "date_evaluation": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "entreprise": reponses.get("nom_entreprise", "N/A"),
-        "resultats": {
-            "score_total": f"{resultats['pourcentage']:.1f}%",
-            "eligibilite": eligibilite["niveau"],
-            "statut": eligibilite["statut"]
-        },
-        "categories": {
-            cat_id: {
-                "titre": QUESTIONS[cat_id]["titre"],
-                "score": f"{data['pourcentage']:.0f}%"
-            }
-            for cat_id, data in resultats["categories"].items()
-        },
-        "ko_manquants": resultats["ko_manquants"]
-    }
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        format = st.selectbox("Format du rapport", list(FORMATS), format_func=str.upper)
+    
+    # Seul le format choisi est construit, dans le cache partagé par toutes les sessions
+    contenu, nom = rapport_formate_en_cache(reponses, format, questionnaire=QUESTIONNAIRE_COMPILE)
     
     st.download_button(
-        label="📥 Télécharger le rapport (JSON)",
-        data=json.dumps(rapport_json, indent=2, ensure_ascii=False),
-        file_name=f"evaluation_ifs_{reponses.get('nom_entreprise', 'entreprise').replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.json",
-        mime="application/json"
+        label=f"📥 Télécharger le rapport ({format.upper()})",
+        data=contenu,
+        file_name=nom,
+        mime=FORMATS[format]
     )
 
 # ========== INTERFACE PRINCIPALE ==========
@@ -556,9 +601,10 @@ if st.session_state.etape > total_etapes:
 if st.session_state.etape < 1:
     st.session_state.etape = 1
 
-progress = (st.session_state.etape - 1) / (total_etapes - 1) if total_etapes > 1 else 0
-st.progress(progress)
-st.caption(f"Étape {st.session_state.etape}/{total_etapes}")
+with phase("progression"):
+    progress = (st.session_state.etape - 1) / (total_etapes - 1) if total_etapes > 1 else 0
+    st.progress(progress)
+    st.caption(f"Étape {st.session_state.etape}/{total_etapes}")
 
 # Navigation
 if st.session_state.etape <= len(categories_list):
@@ -574,49 +620,69 @@ if st.session_state.etape <= len(categories_list):
     st.markdown("---")
     
     # Affichage des questions
-    for question in cat_data["questions"]:
-        afficher_question(question, categorie_actuelle)
-    
-    # Boutons de navigation
-    col1, col2, col3 = st.columns([1, 1, 1])
-    
-    with col1:
-        if st.session_state.etape > 1:
-            if st.button("⬅️ Précédent"):
-                st.session_state.etape -= 1
-                st.rerun()
-    
-    with col3:
-        if st.session_state.etape < len(categories_list):
-            if st.button("Suivant ➡️"):
-                st.session_state.etape += 1
-                st.rerun()
+    if MODE_RENDU == "formulaire":
+        afficher_formulaire(cat_data["questions"], categorie_actuelle, len(categories_list))
+    else:
+        if MODE_RENDU == "fragments":
+            afficher_questions_fragment(cat_data["questions"], categorie_actuelle)
         else:
-            if st.button("🎯 Voir les résultats"):
-                st.session_state.etape += 1
-                st.rerun()
+            afficher_questions(cat_data["questions"], categorie_actuelle)
+        
+        # Boutons de navigation
+        col1, col2, col3 = st.columns([1, 1, 1])
+        
+        with col1:
+            if st.session_state.etape > 1:
+                if st.button("⬅️ Précédent"):
+                    changer_etape(st.session_state.etape - 1)
+        
+        with col3:
+            if st.session_state.etape < len(categories_list):
+                if st.button("Suivant ➡️"):
+                    changer_etape(st.session_state.etape + 1)
+            else:
+                if st.button("🎯 Voir les résultats"):
+                    changer_etape(st.session_state.etape + 1)
 
 else:
     # Page de résultats
-    resultats = calculer_score(st.session_state.reponses)
-    eligibilite = determiner_eligibilite(resultats)
-    afficher_resultats(resultats, eligibilite, st.session_state.reponses)
+    with phase("score"):
+        resultats = resultats_score_courant(st.session_state.score_courant, QUESTIONNAIRE_COMPILE)
+        eligibilite = determiner_eligibilite(resultats)
+    with phase("resultats"):
+        afficher_resultats(resultats, eligibilite, developper_reponses(st.session_state.reponses, QUESTIONNAIRE_COMPILE))
     
     st.markdown("---")
     
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("⬅️ Retour au questionnaire"):
-            st.session_state.etape = len(categories_list)
-            st.rerun()
+            changer_etape(len(categories_list))
     
     with col2:
         if st.button("🔄 Nouvelle évaluation"):
             st.session_state.etape = 1
-            st.session_state.reponses = {}
+            # La nouvelle évaluation utilise la version active du questionnaire
+            del st.session_state.reponses
+            del st.session_state.empreinte_questionnaire
+            del st.session_state.score_courant
+            st.session_state.evaluation_id = None
+            st.session_state.jeton_evaluation = None
+            st.session_state.pop("jeton_session", None)
+            st.query_params.clear()
+            mesure.terminer(1, st.session_state)
             st.rerun()
 
+# Score en cours, après l'enregistrement des réponses de la page
+afficher_score_courant()
+
 # Footer
 st.markdown("---")
 st.caption("🔒 Cet outil est fourni à titre indicatif. Une évaluation complète sera réalisée lors de l'audit officiel.")
 st.caption("📧 Contact: contact@votre-organisme.fr | 📞 01 23 45 67 89")
+
+journal_rendu().info(
+    "script etape=%d mode=%s duree_ms=%.1f",
+    st.session_state.etape, MODE_RENDU, (time.perf_counter() - debut_rerun) * 1000
+)
+mesure.terminer(st.session_state.etape, st.session_state)
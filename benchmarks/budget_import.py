@@ -0,0 +1,66 @@
+"""Contrôle du temps d'import à froid du moteur de calcul
+
+Usage :
+    python benchmarks/budget_import.py [--budget-ms 50] [--repetitions 15]
+
+Chaque mesure est faite dans un interpréteur neuf : on chronomètre
+`import ifs_eligibilite` et on vérifie qu'aucun module lourd (Streamlit,
+pandas) n'a été chargé au passage. Le script échoue si la médiane dépasse
+le budget, ce qui protège le démarrage des processus de calcul éphémères.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules qui ne doivent jamais être chargés par l'import du moteur
+MODULES_INTERDITS = ["streamlit", "pandas", "numpy"]
+
+SONDE = """
+import json, sys, time
+debut = time.perf_counter()
+import ifs_eligibilite
+duree = time.perf_counter() - debut
+print(json.dumps({
+    "ms": duree * 1000,
+    "interdits": [m for m in %r if m in sys.modules]
+}))
+""" % (MODULES_INTERDITS,)
+
+def mesurer_import():
+    """Mesure un import du moteur dans un interpréteur neuf"""
+    sortie = subprocess.run(
+        [sys.executable, "-c", SONDE],
+        cwd=RACINE, capture_output=True, text=True, check=True
+    )
+    return json.loads(sortie.stdout)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérifie le budget de temps d'import du moteur.")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="budget sur la médiane (ms)")
+    parser.add_argument("--repetitions", type=int, default=15, help="nombre d'interpréteurs lancés")
+    args = parser.parse_args(argv)
+    
+    mesures = [mesurer_import() for _ in range(args.repetitions)]
+    durees = [m["ms"] for m in mesures]
+    interdits = sorted({nom for m in mesures for nom in m["interdits"]})
+    mediane = statistics.median(durees)
+    
+    print(f"import ifs_eligibilite : médiane {mediane:.1f} ms, max {max(durees):.1f} ms "
+          f"(budget {args.budget_ms:.0f} ms, {args.repetitions} mesures)")
+    
+    if interdits:
+        print(f"ÉCHEC : modules chargés à l'import : {', '.join(interdits)}")
+        return 1
+    if mediane > args.budget_ms:
+        print("ÉCHEC : budget d'import dépassé")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
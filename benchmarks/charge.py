@@ -0,0 +1,232 @@
+"""Test de charge : auditeurs simulés en parallèle sur l'assistant complet
+
+Usage :
+    python benchmarks/charge.py [--processus 4] [--auditeurs 10] [--evaluations 3]
+                                [--mode fragments] [--json resultats.json]
+
+Chaque processus de travail fait vivre `--auditeurs` sessions en même temps,
+au moyen du harnais de test intégré de Streamlit (AppTest, sans navigateur) :
+les sessions avancent à tour de rôle d'une exécution du script, de sorte que
+toutes occupent la mémoire du processus pendant la mesure. Un auditeur répond
+à toutes les catégories du questionnaire, affiche les résultats puis clique
+« 🔄 Nouvelle évaluation », `--evaluations` fois de suite. Les évaluations
+sont enregistrées dans une base jetable, partagée par les processus.
+
+On relève la latence de chaque exécution (50e, 95e et 99e centiles, au total
+et par type d'action), le nombre d'exécutions par évaluation terminée, le
+débit d'exécutions par seconde et la croissance de la mémoire résidente par
+session ouverte, puis par évaluation au-delà de la première de chaque session.
+Les auditeurs n'observent aucun temps de réflexion : le débit mesuré est la
+capacité maximale des processus. La mémoire par session comprend celle
+qu'AppTest garde pour chaque application simulée : c'est un majorant.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+# Les évaluations simulées sont enregistrées dans une base jetable
+os.environ.setdefault("IFS_BASE", os.path.join(tempfile.mkdtemp(), "evaluations.db"))
+
+from ifs_eligibilite.questionnaire import QUESTIONS
+from modes_rendu import MODES, BOUTONS_SUIVANT, repondre_page
+
+BOUTON_NOUVELLE = "🔄 Nouvelle évaluation"
+CENTILES = (50, 95, 99)
+
+def memoire_residente():
+    """Mémoire résidente du processus, en octets (pic du processus hors Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def centiles(valeurs):
+    """50e, 95e et 99e centiles d'une liste de durées"""
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return {f"p{c}": None for c in CENTILES}
+    return {f"p{c}": valeurs[min(len(valeurs) - 1, int(len(valeurs) * c / 100))] for c in CENTILES}
+
+def executer(app, element, action, latences):
+    """Exécute le script pour une action et relève sa latence en millisecondes"""
+    debut = time.perf_counter()
+    (element or app).run()
+    latences[action].append((time.perf_counter() - debut) * 1000)
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+def neutraliser(app):
+    """Donne une valeur aux widgets de la page de résultats dont AppTest a perdu l'état
+    
+    Comme dans repondre_page : après un st.rerun(), AppTest garde en fin
+    d'arbre des widgets de la dernière page de questions, et le format du
+    rapport, affiché juste après, n'a pas d'état ; aucun ne pourrait être
+    sérialisé à l'exécution suivante.
+    """
+    questions = tuple(f"{categorie}_" for categorie in QUESTIONS)
+    for widget in list(app.radio) + list(app.selectbox) + list(app.number_input):
+        if widget.key and widget.key.startswith(questions):
+            widget.set_value(0)
+        elif widget.type == "selectbox":
+            widget.select_index(0)
+    for widget in app.text_input:
+        if widget.key and widget.key.startswith(questions):
+            widget.input("")
+
+def parcourir(app, alea, evaluations, formulaire, latences, terminees):
+    """Déroule les évaluations d'un auditeur ; rend la main après chaque exécution"""
+    executer(app, None, "ouverture", latences)
+    yield
+    for _ in range(evaluations):
+        while not any(b.label == BOUTON_NOUVELLE for b in app.button):
+            if formulaire:
+                # Les valeurs restent dans le formulaire jusqu'à la validation
+                repondre_page(app, alea)
+            else:
+                for widget in repondre_page(app, alea):
+                    executer(app, widget, "reponse", latences)
+                    yield
+            suivant = next(b for b in app.button if b.label in BOUTONS_SUIVANT)
+            action = "resultats" if suivant.label == BOUTONS_SUIVANT[-1] else "navigation"
+            executer(app, suivant.click(), action, latences)
+            yield
+        neutraliser(app)
+        nouvelle = next(b for b in app.button if b.label == BOUTON_NOUVELLE)
+        executer(app, nouvelle.click(), "nouvelle_evaluation", latences)
+        terminees[0] += 1
+        yield
+
+def travailleur(numero, auditeurs, evaluations, mode, graine):
+    """Fait vivre des sessions simultanées dans un processus et retourne ses mesures"""
+    os.environ["IFS_MODE_RENDU"] = mode
+    logging.getLogger("ifs_eligibilite.rendu").disabled = True
+    # Avertissements répétés sur les libellés masqués des questions
+    logging.getLogger("streamlit.elements.lib.policies").disabled = True
+    from streamlit.testing.v1 import AppTest
+    
+    def nouvelle_app():
+        return AppTest.from_file(os.path.join(RACINE, "app.py"), default_timeout=60)
+    
+    # Une première exécution charge les modules et le questionnaire, hors mesure
+    nouvelle_app().run()
+    gc.collect()
+    memoire_initiale = memoire_residente()
+    
+    alea = random.Random(graine * 1000 + numero)
+    latences = defaultdict(list)
+    terminees = [0]
+    sessions = [
+        parcourir(nouvelle_app(), alea, evaluations, mode == "formulaire", latences, terminees)
+        for _ in range(auditeurs)
+    ]
+    
+    # Mémoire relevée quand chaque session a terminé sa première évaluation
+    memoire_premiere = None
+    debut = time.perf_counter()
+    while sessions:
+        for session in list(sessions):
+            try:
+                next(session)
+            except StopIteration:
+                sessions.remove(session)
+        if memoire_premiere is None and terminees[0] >= auditeurs:
+            gc.collect()
+            memoire_premiere = memoire_residente()
+    duree = time.perf_counter() - debut
+    gc.collect()
+    
+    return {
+        "latences": dict(latences),
+        "evaluations": terminees[0],
+        "duree_s": duree,
+        "memoire_initiale": memoire_initiale,
+        "memoire_premiere": memoire_premiere,
+        "memoire_finale": memoire_residente()
+    }
+
+def synthese(resultats, auditeurs, evaluations):
+    """Agrège les mesures des processus"""
+    latences = defaultdict(list)
+    for resultat in resultats:
+        for action, valeurs in resultat["latences"].items():
+            latences[action].extend(valeurs)
+    toutes = [valeur for valeurs in latences.values() for valeur in valeurs]
+    terminees = sum(r["evaluations"] for r in resultats)
+    duree = max(r["duree_s"] for r in resultats)
+    
+    par_session = [(r["memoire_premiere"] - r["memoire_initiale"]) / auditeurs for r in resultats]
+    par_evaluation = [
+        (r["memoire_finale"] - r["memoire_premiere"]) / (auditeurs * (evaluations - 1))
+        for r in resultats if evaluations > 1
+    ]
+    return {
+        "processus": len(resultats),
+        "sessions": len(resultats) * auditeurs,
+        "evaluations_terminees": terminees,
+        "executions": len(toutes),
+        "executions_par_evaluation": len(toutes) / terminees,
+        "executions_par_seconde": len(toutes) / duree,
+        "evaluations_par_minute": terminees / duree * 60,
+        "latence_ms": {"toutes": centiles(toutes), **{action: centiles(v) for action, v in sorted(latences.items())}},
+        "executions_par_action": {action: len(v) for action, v in sorted(latences.items())},
+        "memoire_par_session_ko": sum(par_session) / len(par_session) / 1024,
+        "memoire_par_evaluation_ko": sum(par_evaluation) / len(par_evaluation) / 1024 if par_evaluation else None
+    }
+
+def afficher(mesures):
+    print(f"{mesures['sessions']} sessions sur {mesures['processus']} processus, "
+          f"{mesures['evaluations_terminees']} évaluations terminées")
+    print(f"{mesures['executions_par_evaluation']:.1f} exécutions par évaluation, "
+          f"{mesures['executions_par_seconde']:.1f} exécutions/s, "
+          f"{mesures['evaluations_par_minute']:.1f} évaluations/min")
+    print(f"\n{'action':<22}{'exécutions':>11}" + "".join(f"{f'p{c} (ms)':>12}" for c in CENTILES))
+    for action, valeurs in mesures["latence_ms"].items():
+        nombre = mesures["executions"] if action == "toutes" else mesures["executions_par_action"][action]
+        print(f"{action:<22}{nombre:>11}" + "".join(f"{valeurs[f'p{c}']:>12.1f}" for c in CENTILES))
+    print(f"\nMémoire résidente : {mesures['memoire_par_session_ko']:.0f} Ko par session ouverte", end="")
+    if mesures["memoire_par_evaluation_ko"] is not None:
+        print(f", {mesures['memoire_par_evaluation_ko']:+.0f} Ko par évaluation suivante")
+    else:
+        print()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge de l'assistant par auditeurs simulés.")
+    parser.add_argument("--processus", type=int, default=os.cpu_count() or 1, help="processus de travail")
+    parser.add_argument("--auditeurs", type=int, default=10, help="sessions simultanées par processus")
+    parser.add_argument("--evaluations", type=int, default=3, help="évaluations successives par session")
+    parser.add_argument("--mode", choices=MODES, default=os.environ.get("IFS_MODE_RENDU", "fragments"),
+                        help="mode de rendu (IFS_MODE_RENDU)")
+    parser.add_argument("--graine", type=int, default=0, help="graine des réponses simulées")
+    parser.add_argument("--json", help="fichier où écrire les mesures")
+    args = parser.parse_args(argv)
+    
+    with ProcessPoolExecutor(max_workers=args.processus) as pool:
+        resultats = list(pool.map(
+            travailleur, range(args.processus), [args.auditeurs] * args.processus,
+            [args.evaluations] * args.processus, [args.mode] * args.processus, [args.graine] * args.processus
+        ))
+    
+    mesures = synthese(resultats, args.auditeurs, args.evaluations)
+    afficher(mesures)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametres": vars(args), **mesures}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Mémoire occupée par l'état d'une session d'évaluation
+
+Usage :
+    python benchmarks/memoire_sessions.py [--sessions 20] [--json resultats.json]
+
+Des auditeurs simulés remplissent le questionnaire au moyen d'AppTest. On
+mesure l'état de chaque session (valeurs enregistrées et widgets nommés) sur
+la dernière page de questions puis sur la page de résultats, en octets
+occupés en mémoire, par groupe de clés.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+from collections import defaultdict
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+# Les évaluations simulées sont enregistrées dans une base jetable
+os.environ.setdefault("IFS_BASE", os.path.join(tempfile.mkdtemp(), "evaluations.db"))
+
+from streamlit.testing.v1 import AppTest
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.sessions import memoire_objet
+from modes_rendu import BOUTONS_SUIVANT, repondre_page
+
+def mesurer_etat(app, categories):
+    """Mémoire de l'état de la session, au total et par groupe de clés
+    
+    Les objets du questionnaire compilé, partagés par toutes les sessions,
+    ne sont pas comptés.
+    """
+    partages = questionnaire_actif()["compile"]
+    etat = app.session_state.filtered_state
+    groupes = defaultdict(int)
+    for cle, valeur in etat.items():
+        # Les widgets des questions sont nommés <categorie>_<question>
+        if any(cle.startswith(f"{categorie}_") for categorie in categories):
+            groupe = "widgets"
+        elif cle in ("reponses", "score_courant"):
+            groupe = cle
+        else:
+            groupe = "autres"
+        groupes[groupe] += memoire_objet(cle, partages) + memoire_objet(valeur, partages)
+    return memoire_objet(etat, partages), dict(groupes)
+
+def evaluer(alea, categories):
+    """Déroule une évaluation ; retourne les mesures de la dernière page et des résultats"""
+    app = AppTest.from_file(os.path.join(RACINE, "app.py"), default_timeout=60).run()
+    mesures = {}
+    while not any(b.label == "🔄 Nouvelle évaluation" for b in app.button):
+        repondre_page(app, alea)
+        app.run()
+        if app.session_state["etape"] == len(categories):
+            mesures["derniere_page"] = mesurer_etat(app, categories)
+        suivant = next(b for b in app.button if b.label in BOUTONS_SUIVANT)
+        suivant.click().run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    mesures["resultats"] = mesurer_etat(app, categories)
+    return mesures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure la mémoire de l'état d'une session.")
+    parser.add_argument("--sessions", type=int, default=20, help="évaluations simulées")
+    parser.add_argument("--graine", type=int, default=0, help="graine des réponses simulées")
+    parser.add_argument("--json", help="fichier où écrire les mesures")
+    args = parser.parse_args(argv)
+    
+    logging.getLogger("ifs_eligibilite.rendu").disabled = True
+    logging.getLogger("streamlit.elements.lib.policies").disabled = True
+    os.environ["IFS_MODE_RENDU"] = "formulaire"
+    
+    categories = list(questionnaire_actif()["questions"])
+    alea = random.Random(args.graine)
+    runs = [evaluer(alea, categories) for _ in range(args.sessions)]
+    
+    resultats = {}
+    for page in ("derniere_page", "resultats"):
+        groupes = defaultdict(list)
+        for run in runs:
+            for groupe, octets in run[page][1].items():
+                groupes[groupe].append(octets)
+        resultats[page] = {
+            "octets_par_session": statistics.mean(run[page][0] for run in runs),
+            "detail": {groupe: statistics.mean(valeurs) for groupe, valeurs in sorted(groupes.items())}
+        }
+        detail = ", ".join(f"{groupe} {octets:.0f}" for groupe, octets in resultats[page]["detail"].items())
+        print(f"{page:<14} {resultats[page]['octets_par_session']:8.0f} octets par session ({detail})")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
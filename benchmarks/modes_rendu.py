@@ -0,0 +1,137 @@
+"""Comparaison des modes de rendu sur une évaluation complète
+
+Usage :
+    python benchmarks/modes_rendu.py [--evaluations 5] [--json resultats.json]
+
+Un auditeur simulé remplit tout le questionnaire au moyen du harnais de test
+intégré de Streamlit (AppTest, sans navigateur), dans chacun des modes
+`complet`, `fragments` et `formulaire`. On compte les exécutions du script
+côté serveur et le temps CPU consommé par évaluation terminée.
+
+AppTest réexécute toujours le script entier : en mode `fragments`, le temps
+mesuré majore donc le coût réel d'une réponse, seul le nombre d'exécutions
+est comparable.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+# Les évaluations simulées sont enregistrées dans une base jetable
+os.environ.setdefault("IFS_BASE", os.path.join(tempfile.mkdtemp(), "evaluations.db"))
+
+from streamlit.testing.v1 import AppTest
+
+from ifs_eligibilite.questionnaire import QUESTIONS
+
+MODES = ["complet", "fragments", "formulaire"]
+BOUTONS_SUIVANT = ("Suivant ➡️", "🎯 Voir les résultats")
+
+class Compteur:
+    """Exécute l'application en comptant les exécutions et le temps CPU"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.executions = 0
+        self.cpu = 0.0
+    
+    def executer(self, element=None):
+        debut = time.process_time()
+        (element or self.app).run()
+        self.cpu += time.process_time() - debut
+        self.executions += 1
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+def repondre_page(app, alea):
+    """Choisit une réponse pour chaque widget de la page ; retourne les widgets modifiés"""
+    # Après un st.rerun(), AppTest conserve en fin d'arbre des widgets de la page
+    # précédente dont l'état a disparu : on leur donne une valeur neutre pour que
+    # l'exécution suivante puisse les sérialiser, et on ne répond qu'à la page affichée
+    categorie = list(QUESTIONS)[app.session_state["etape"] - 1]
+    modifies = []
+    
+    # Les widgets à choix ont pour valeur l'indice de l'option
+    for widget in list(app.radio) + list(app.selectbox):
+        if widget.key.startswith(f"{categorie}_"):
+            widget.set_value(alea.randrange(len(widget.options)))
+            modifies.append(widget)
+        else:
+            widget.set_value(0)
+    for widget in app.text_input:
+        if widget.key.startswith(f"{categorie}_"):
+            widget.input(f"Entreprise {alea.randrange(10_000)}")
+            modifies.append(widget)
+        else:
+            widget.input("")
+    for widget in app.number_input:
+        if widget.key.startswith(f"{categorie}_"):
+            widget.set_value(alea.randrange(1, 500))
+            modifies.append(widget)
+        else:
+            widget.set_value(0)
+    return modifies
+
+def evaluer(mode, alea):
+    """Déroule une évaluation complète dans un mode et retourne ses mesures"""
+    os.environ["IFS_MODE_RENDU"] = mode
+    app = AppTest.from_file(os.path.join(RACINE, "app.py"), default_timeout=60)
+    compteur = Compteur(app)
+    compteur.executer()
+    
+    while not any(b.label == "🔄 Nouvelle évaluation" for b in app.button):
+        if mode == "formulaire":
+            # Les valeurs restent dans le formulaire jusqu'à la validation
+            repondre_page(app, alea)
+        else:
+            # Chaque réponse modifiée déclenche une exécution
+            for _ in repondre_page(app, alea):
+                compteur.executer()
+        suivant = next(b for b in app.button if b.label in BOUTONS_SUIVANT)
+        compteur.executer(suivant.click())
+    
+    return {
+        "executions": compteur.executions,
+        "cpu_ms": compteur.cpu * 1000,
+        "reponses": len(app.session_state["reponses"])
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare les modes de rendu de l'assistant.")
+    parser.add_argument("--evaluations", type=int, default=5, help="évaluations par mode")
+    parser.add_argument("--graine", type=int, default=0, help="graine des réponses simulées")
+    parser.add_argument("--json", help="fichier où écrire les mesures")
+    args = parser.parse_args(argv)
+    
+    logging.getLogger("ifs_eligibilite.rendu").disabled = True
+    # Avertissements répétés sur les libellés masqués des questions
+    logging.getLogger("streamlit.elements.lib.policies").disabled = True
+    
+    mesures = {}
+    for mode in MODES:
+        alea = random.Random(args.graine)
+        runs = [evaluer(mode, alea) for _ in range(args.evaluations)]
+        mesures[mode] = {
+            "executions_par_evaluation": statistics.mean(r["executions"] for r in runs),
+            "cpu_ms_par_evaluation": statistics.mean(r["cpu_ms"] for r in runs),
+            "reponses_enregistrees": min(r["reponses"] for r in runs),
+        }
+        print(f"{mode:<11} {mesures[mode]['executions_par_evaluation']:6.1f} exécutions "
+              f"{mesures[mode]['cpu_ms_par_evaluation']:8.1f} ms CPU par évaluation")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(mesures, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""Suite de benchmarks du moteur de calcul et des réexécutions de l'assistant
+
+Usage :
+    python benchmarks/suite.py [--sortie resultats.json] [--reference base.json]
+                               [--tolerance 0.25] [--filtre rerun] [--repetitions 30]
+
+Cas mesurés :
+    score.*        calculer_score / determiner_eligibilite, unitaire et en lot
+    plan.*         plans vers les seuils d'éligibilité (programmation dynamique)
+    calibrage.*    tirage et notation vectorisés d'évaluations simulées
+    groupe.*       évaluation et consolidation d'un groupe multi-sites
+    evenements.*   ajout au journal des réponses et rejeu des segments
+    archive.*      requêtes sur l'archive en colonnes projetée en mémoire
+    reevaluation.* nouveaux statuts de l'archive après un changement de points
+    population.*   position d'un score dans la distribution des évaluations enregistrées
+    reprise.*      écriture et lecture du point de reprise d'une session
+    rapport.*      construction du rapport et mise en forme JSON
+    rerun.*        réexécution complète du script sur chaque étape de
+                   l'assistant, pilotée par AppTest (sans navigateur)
+
+Chaque cas est répété ; on retient la médiane, le minimum et le 95e centile
+du temps par appel. Les mesures sont écrites dans un fichier JSON. Avec
+`--reference`, chaque médiane est comparée à celle d'un fichier produit par
+une exécution précédente et le script échoue si un cas ralentit de plus que
+la tolérance.
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+# Les réexécutions ne doivent pas écrire dans la base de production
+os.environ.setdefault("IFS_BASE", os.path.join(tempfile.mkdtemp(), "evaluations.db"))
+
+from ifs_eligibilite import (
+    compiler_questionnaire, calculer_score, determiner_eligibilite, construire_rapport, scorer_lot,
+    score_initial, mettre_a_jour_score, compacter_reponses
+)
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.rapports import rapport_json
+from ifs_eligibilite.cache import rapport_jsonl_en_cache
+from ifs_eligibilite.amelioration import plans_amelioration
+from ifs_eligibilite.calibrage import tables_points, probabilites_uniformes, ko_conformes, simuler
+from ifs_eligibilite.groupe import evaluer_sites, consolider
+from ifs_eligibilite import evenements
+from ifs_eligibilite.archive import construire_archive, ouvrir_archive, selectionner, repartition
+from ifs_eligibilite.reevaluation import reevaluer
+from ifs_eligibilite.stockage import position_population
+from ifs_eligibilite import reprise
+
+TAILLE_LOT = 1000
+TIRAGES_CALIBRAGE = 100_000
+SITES_GROUPE = 200
+EVENEMENTS_REJEU = 10_000
+LIGNES_ARCHIVE = 100_000
+DATE_FIXE = datetime.datetime(2024, 1, 1)
+
+def generer_reponses(alea, questions):
+    """Jeu de réponses complet et plausible : les exigences KO sont le plus souvent satisfaites"""
+    reponses = {}
+    for categorie in questions.values():
+        for question in categorie["questions"]:
+            if question["type"] == "text":
+                reponses[question["id"]] = f"Entreprise {alea.randrange(10_000)}"
+            elif question["type"] == "number":
+                reponses[question["id"]] = alea.randrange(1, 500)
+            elif question.get("ko") and alea.random() < 0.97:
+                reponses[question["id"]] = question["options"][0]
+            else:
+                reponses[question["id"]] = alea.choice(question["options"])
+    return reponses
+
+def chronometrer(fonction, repetitions, duree_min=0.02):
+    """Temps par appel (µs) sur `repetitions` séries, chaque série durant au moins `duree_min` s"""
+    # Calibrage du nombre d'appels par série, à la manière de timeit
+    nombre = 1
+    while True:
+        debut = time.perf_counter()
+        for _ in range(nombre):
+            fonction()
+        if time.perf_counter() - debut >= duree_min:
+            break
+        nombre *= 2
+    
+    temps = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        for _ in range(nombre):
+            fonction()
+        temps.append((time.perf_counter() - debut) / nombre * 1e6)
+    return temps
+
+def resumer(temps):
+    """Statistiques d'un cas à partir des temps par appel (µs)"""
+    temps = sorted(temps)
+    return {
+        "mediane_us": statistics.median(temps),
+        "min_us": temps[0],
+        "p95_us": temps[min(len(temps) - 1, int(len(temps) * 0.95))],
+        "repetitions": len(temps)
+    }
+
+def cas_moteur(alea, repetitions):
+    """Mesures du moteur de calcul et des rapports"""
+    questions = questionnaire_actif()["questions"]
+    lot = [generer_reponses(alea, questions) for _ in range(TAILLE_LOT)]
+    reponses = lot[0]
+    resultats = calculer_score(reponses)
+    eligibilite = determiner_eligibilite(resultats)
+    rapport = construire_rapport(resultats, eligibilite, reponses, date=DATE_FIXE)
+    
+    # Évaluation loin des seuils : chaque question notée est à sa plus faible réponse
+    index = questionnaire_actif()["compile"]["index"]
+    faible = {question_id: min(q["points"], key=q["points"].get) for question_id, q in index.items()}
+    efforts = {question_id: {option: alea.randint(1, 9) for option in q["points"]} for question_id, q in index.items()}
+    
+    tables = tables_points()
+    probabilites = ko_conformes(probabilites_uniformes(tables), tables)
+    sites = [{"site": f"Site {i}", "reponses": r} for i, r in enumerate(lot[:SITES_GROUPE])]
+    
+    # Journaux hors de IFS_EVENEMENTS ; celui du rejeu reçoit les parcours du lot
+    session = evenements.identifiant_session("benchmark")
+    empreinte = questionnaire_actif()["empreinte"]
+    options = questionnaire_actif()["compile"]["options"]
+    parcours = []
+    for numero, r in enumerate(lot, 1):
+        parcours.append(evenements.encoder_debut(session, empreinte, numero))
+        for question_id, valeur in r.items():
+            if question_id in options:
+                parcours.append(evenements.encoder_reponse(session, question_id, options[question_id].index(valeur), False))
+            else:
+                parcours.append(evenements.encoder_reponse(session, question_id, valeur, True))
+    journal_rejeu = evenements.JournalEvenements(tempfile.mkdtemp())
+    for evenement in parcours[:EVENEMENTS_REJEU]:
+        journal_rejeu.ajouter(evenement)
+    journal_rejeu.vider()
+    journal = evenements.JournalEvenements(tempfile.mkdtemp())
+    
+    # Archive : le lot répété, une évaluation par minute
+    repertoire_archive = tempfile.mkdtemp()
+    construire_archive(repertoire_archive, (
+        {
+            "id": i + 1, "entreprise": None, "statut": "NON_ELIGIBLE", "score": 0, "pourcentage": 0.0,
+            "date_evaluation": (DATE_FIXE + datetime.timedelta(minutes=i)).isoformat(timespec="seconds"),
+            "reponses": lot[i % TAILLE_LOT]
+        }
+        for i in range(LIGNES_ARCHIVE)
+    ))
+    archive = ouvrir_archive(repertoire_archive)
+    periode = (DATE_FIXE + datetime.timedelta(days=7), DATE_FIXE + datetime.timedelta(days=30))
+    
+    # Barème modifié : la première question notée compte double
+    questions = copy.deepcopy(questionnaire_actif()["questions"])
+    premiere = next(q for data in questions.values() for q in data["questions"] if q.get("points"))
+    premiere["points"] = [points * 2 for points in premiere["points"]]
+    nouveau = compiler_questionnaire(questions)
+    
+    # Point de reprise d'une évaluation à mi-parcours, dans une base jetable
+    base_reprise = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    reponses_session = compacter_reponses(reponses)
+    jeton = reprise.nouveau_jeton()
+    reprise.enregistrer_point(jeton, empreinte, 3, reponses_session, 1, chemin=base_reprise)
+    
+    def lot_boucle():
+        for r in lot:
+            determiner_eligibilite(calculer_score(r))
+    
+    def lot_jsonl_cache():
+        for r in lot:
+            rapport_jsonl_en_cache(r, DATE_FIXE)
+    
+    cas = {
+        "score.calculer_score": lambda: calculer_score(reponses),
+        "score.determiner_eligibilite": lambda: determiner_eligibilite(resultats),
+        f"score.lot_{TAILLE_LOT}_boucle": lot_boucle,
+        f"score.lot_{TAILLE_LOT}_vectorise": lambda: scorer_lot(lot),
+        "rapport.construction": lambda: construire_rapport(resultats, eligibilite, reponses, date=DATE_FIXE),
+        "rapport.json": lambda: rapport_json(rapport),
+        # Après le premier passage, toutes les combinaisons sont dans le cache partagé
+        f"rapport.lot_{TAILLE_LOT}_jsonl_cache": lot_jsonl_cache,
+        "plan.seuils": lambda: plans_amelioration(faible),
+        "plan.seuils_efforts": lambda: plans_amelioration(faible, efforts),
+        f"calibrage.simulation_{TIRAGES_CALIBRAGE}": lambda: simuler(probabilites, tables, TIRAGES_CALIBRAGE),
+        f"groupe.sites_{SITES_GROUPE}": lambda: consolider(evaluer_sites(sites)),
+        "evenements.ajout": lambda: journal.ajouter(evenements.encoder_reponse(session, "ko_1", 0, False)),
+        f"evenements.rejeu_{EVENEMENTS_REJEU}": lambda: evenements.rejouer(evenements.lire_evenements(journal_rejeu.repertoire)),
+        f"archive.ko_periode_{LIGNES_ARCHIVE}": lambda: selectionner(archive, *periode, ko=["ko_7"]),
+        f"archive.repartition_{LIGNES_ARCHIVE}": lambda: repartition(archive, "haccp"),
+        f"reevaluation.archive_{LIGNES_ARCHIVE}": lambda: reevaluer(archive, nouveau, questionnaire_actif()["compile"]),
+        # Distribution en cache : la lecture de la base n'a lieu que toutes les DUREE_DISTRIBUTION secondes
+        "population.position": lambda: position_population(resultats),
+        "reprise.ecriture": lambda: reprise.enregistrer_point(jeton, empreinte, 3, reponses_session, 1, chemin=base_reprise),
+        "reprise.lecture": lambda: reprise.charger_point(jeton, chemin=base_reprise),
+    }
+    for nom, fonction in cas.items():
+        yield nom, lambda fonction=fonction: resumer(chronometrer(fonction, repetitions))
+
+def cas_reruns(alea, repetitions):
+    """Réexécutions complètes du script, une mesure par étape de l'assistant"""
+    from streamlit.testing.v1 import AppTest
+    
+    # Avertissements répétés sur les libellés masqués des questions
+    logging.getLogger("streamlit.elements.lib.policies").disabled = True
+    logging.getLogger("ifs_eligibilite.rendu").disabled = True
+    
+    definition = questionnaire_actif()
+    categories = list(definition["questions"])
+    reponses = generer_reponses(alea, definition["questions"])
+    score = score_initial(definition["compile"])
+    for question_id, valeur in reponses.items():
+        mettre_a_jour_score(score, question_id, None, valeur, definition["compile"])
+    
+    def mesurer(etape):
+        # L'état de session est injecté avant la première exécution : la page
+        # s'affiche directement à l'étape voulue, questions déjà répondues
+        app = AppTest.from_file(os.path.join(RACINE, "app.py"), default_timeout=60)
+        app.session_state["etape"] = etape
+        app.session_state["reponses"] = compacter_reponses(reponses, definition["compile"])
+        app.session_state["score_courant"] = copy.deepcopy(score)
+        app.run()
+        temps = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            app.run()
+            temps.append((time.perf_counter() - debut) * 1e6)
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+        return resumer(temps)
+    
+    for etape, categorie in enumerate(categories, 1):
+        yield f"rerun.etape_{etape}_{categorie}", lambda etape=etape: mesurer(etape)
+    yield "rerun.resultats", lambda: mesurer(len(categories) + 1)
+
+def revision_git():
+    """Commit mesuré, si le dépôt est disponible"""
+    try:
+        sortie = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=RACINE, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return sortie.stdout.strip()
+
+def comparer(mesures, reference, tolerance):
+    """Écarts de médiane par rapport à la référence ; retourne les cas en régression"""
+    regressions = []
+    print(f"\n{'cas':<38} {'référence':>12} {'actuel':>12} {'écart':>8}")
+    for nom, mesure in mesures.items():
+        if nom not in reference:
+            continue
+        avant = reference[nom]["mediane_us"]
+        ecart = mesure["mediane_us"] / avant - 1
+        marque = ""
+        if ecart > tolerance:
+            regressions.append(nom)
+            marque = "  RÉGRESSION"
+        print(f"{nom:<38} {avant:10.1f}µs {mesure['mediane_us']:10.1f}µs {ecart:+7.1%}{marque}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du moteur et des réexécutions de l'assistant.")
+    parser.add_argument("--sortie", default=os.path.join(RACINE, "benchmarks", "resultats.json"),
+                        help="fichier JSON des mesures")
+    parser.add_argument("--reference", help="mesures d'une exécution précédente à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="ralentissement toléré sur la médiane (0.25 = +25 %%)")
+    parser.add_argument("--filtre", default="", help="ne mesurer que les cas contenant ce texte")
+    parser.add_argument("--repetitions", type=int, default=30, help="séries de mesure par cas")
+    parser.add_argument("--graine", type=int, default=0, help="graine des réponses simulées")
+    args = parser.parse_args(argv)
+    
+    mesures = {}
+    alea = random.Random(args.graine)
+    for generateur in (cas_moteur, cas_reruns):
+        for nom, mesurer in generateur(alea, args.repetitions):
+            if args.filtre not in nom:
+                continue
+            mesures[nom] = mesurer()
+            print(f"{nom:<38} médiane {mesures[nom]['mediane_us']:10.1f} µs   "
+                  f"p95 {mesures[nom]['p95_us']:10.1f} µs")
+    
+    import streamlit
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump({
+            "contexte": {
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "revision": revision_git(),
+                "python": platform.python_version(),
+                "plateforme": platform.platform(),
+                "streamlit": streamlit.__version__,
+                "questionnaire": questionnaire_actif()["version"],
+                "mode_rendu": os.environ.get("IFS_MODE_RENDU", "fragments"),
+            },
+            "cas": mesures
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nMesures écrites dans {args.sortie}")
+    
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)["cas"]
+        regressions = comparer(mesures, reference, args.tolerance)
+        if regressions:
+            print(f"ÉCHEC : {len(regressions)} cas au-delà de la tolérance ({args.tolerance:.0%})")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
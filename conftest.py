@@ -0,0 +1,6 @@
+"""Configuration pytest : la racine du dépôt est importable (ifs_eligibilite, app.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
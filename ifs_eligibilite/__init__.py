@@ -0,0 +1,28 @@
+"""Outil d'aide à la décision sur le référentiel IFS Food v8"""
+
+from .questionnaire import (
+    QUESTIONS,
+    QUESTIONNAIRE_COMPILE,
+    compiler_questionnaire,
+    valider_questions,
+    charger_definition,
+    charger_version,
+    questionnaire_actif,
+    questionnaire_par_empreinte,
+)
+from .moteur import (
+    SEUILS_ELIGIBILITE,
+    SEUILS_CATEGORIES,
+    calculer_score,
+    determiner_eligibilite,
+    construire_rapport,
+    cle_reponses,
+    scorer_lot,
+    score_initial,
+    mettre_a_jour_score,
+    resultats_score_courant,
+    ReponsesCompactes,
+    compacter_reponses,
+    developper_reponses,
+    libelle_reponse,
+)
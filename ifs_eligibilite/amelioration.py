@@ -0,0 +1,184 @@
+"""Plus petit ensemble de changements de réponses menant à un seuil d'éligibilité
+
+Pour atteindre un seuil, il faut lever toutes les exigences KO manquantes et
+gagner assez de points. Chaque question notée offre quelques améliorations
+possibles (les options mieux notées que la réponse actuelle), chacune avec
+son effort : c'est un sac à dos à choix multiples, résolu par programmation
+dynamique sur le nombre de points gagnés, plafonné au déficit du seuil.
+
+Les points sont ramenés à leur plus grand diviseur commun, ce qui limite la
+table à quelques centaines d'états : un plan se calcule en quelques
+millisecondes.
+"""
+
+import math
+from functools import reduce
+
+from .questionnaire import questionnaire_actif
+from .moteur import SEUILS_ELIGIBILITE, calculer_score, determiner_eligibilite
+
+# Seuils pour lesquels un plan est proposé, du plus bas au plus haut
+SEUILS_PLAN = ("ELIGIBLE_RESERVE", "ELIGIBLE")
+
+INFINI = (math.inf, 0)
+
+def score_cible(seuil, score_max):
+    """Plus petit score entier dont le pourcentage atteint `seuil`, comme le compare determiner_eligibilite"""
+    score = math.ceil(seuil * score_max / 100)
+    while score > 0 and (score - 1) / score_max * 100 >= seuil:
+        score -= 1
+    while score / score_max * 100 < seuil:
+        score += 1
+    return score
+
+def _effort(efforts, question_id, option):
+    """Effort d'un changement : 1 par défaut, par question ou par option ; None si interdit"""
+    effort = efforts.get(question_id, 1)
+    if isinstance(effort, dict):
+        effort = effort.get(option, 1)
+    if effort is not None and (isinstance(effort, bool) or not isinstance(effort, (int, float)) or effort < 0):
+        raise ValueError(f"Effort invalide pour {question_id}: {effort!r}")
+    return effort
+
+def _ameliorations(reponses, efforts, questionnaire):
+    """Améliorations possibles de chaque question notée
+    
+    Une exigence KO répondue sous 100 points doit être changée pour une option
+    à 100 points ; une exigence KO, répondue ou non, n'est jamais changée pour
+    une option sous 100 points, qui la rendrait manquante. Les options
+    dominées (moins de points pour autant ou plus d'effort) sont écartées.
+    """
+    groupes = []
+    for q in questionnaire["index"].values():
+        actuelle = reponses.get(q["id"])
+        points_actuels = q["points"][actuelle] if actuelle is not None else 0
+        obligatoire = q["ko"] and actuelle is not None and points_actuels < 100
+        
+        candidates = []
+        for option, points in q["points"].items():
+            if points <= points_actuels or (q["ko"] and points < 100):
+                continue
+            effort = _effort(efforts, q["id"], option)
+            if effort is not None:
+                candidates.append((effort, -points, option))
+        
+        options = []
+        meilleurs_points = points_actuels
+        for effort, points, option in sorted(candidates):
+            if -points > meilleurs_points:
+                meilleurs_points = -points
+                options.append((-points - points_actuels, effort, option))
+        if options or obligatoire:
+            groupes.append((q, actuelle, obligatoire, options))
+    return groupes
+
+def _resoudre(groupes, deficit):
+    """Améliorations retenues, d'effort total minimal, gagnant au moins `deficit` points
+    
+    À effort égal, le plan qui change le moins de questions est préféré.
+    Retourne None si le déficit ne peut pas être comblé.
+    """
+    pas = reduce(math.gcd, (gain for *_, options in groupes for gain, _, _ in options), 0) or 1
+    besoin = max(0, -(-deficit // pas))
+    
+    # meilleur[g] : (effort, nombre de changements) minimal pour g pas gagnés (plafonné à besoin)
+    meilleur = [INFINI] * (besoin + 1)
+    meilleur[0] = (0, 0)
+    retenus = []
+    for _, _, obligatoire, options in groupes:
+        suivant = [INFINI] * (besoin + 1) if obligatoire else list(meilleur)
+        retenu = [None] * (besoin + 1)
+        atteints = [(etat, valeur) for etat, valeur in enumerate(meilleur) if valeur != INFINI]
+        for gain, effort, option in options:
+            saut = gain // pas
+            for etat, (effort_etat, changements) in atteints:
+                arrivee = min(besoin, etat + saut)
+                candidat = (effort_etat + effort, changements + 1)
+                if candidat < suivant[arrivee]:
+                    suivant[arrivee] = candidat
+                    retenu[arrivee] = (etat, option, gain, effort)
+        retenus.append(retenu)
+        meilleur = suivant
+    
+    if meilleur[besoin] == INFINI:
+        return None
+    
+    # Remontée de la table : chaque groupe indique l'état d'où il est parti
+    choix = [None] * len(groupes)
+    etat = besoin
+    for i in range(len(groupes) - 1, -1, -1):
+        if retenus[i][etat] is not None:
+            etat, option, gain, effort = retenus[i][etat]
+            choix[i] = (option, gain, effort)
+    return choix
+
+def plan_amelioration(reponses, statut, efforts=None, questionnaire=None):
+    """Changements de réponses d'effort minimal pour atteindre le seuil de `statut`
+    
+    `reponses` associe les questions à leurs libellés de réponse, comme pour
+    calculer_score. `efforts` associe à une question l'effort de tout
+    changement de sa réponse, ou un dictionnaire {option: effort} ; un effort
+    None interdit le changement. Sans efforts, le plan minimise le nombre de
+    questions changées.
+    
+    Retourne le seuil, son niveau, le score à atteindre et, s'il est atteignable,
+    la liste des changements dans l'ordre du questionnaire avec le score et
+    l'éligibilité obtenus.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    efforts = efforts or {}
+    seuil = SEUILS_ELIGIBILITE[statut]
+    score = calculer_score(reponses, questionnaire)["score"]
+    cible = score_cible(seuil, questionnaire["max"])
+    
+    groupes = _ameliorations(reponses, efforts, questionnaire)
+    choix = _resoudre(groupes, cible - score)
+    plan = {
+        "statut": statut,
+        "niveau": determiner_eligibilite({"pourcentage": seuil, "ko_manquants": []})["niveau"],
+        "seuil": seuil,
+        "score_actuel": score,
+        "score_cible": cible
+    }
+    if choix is None:
+        return {**plan, "atteignable": False, "changements": []}
+    
+    changements = []
+    for (q, actuelle, obligatoire, _), retenu in zip(groupes, choix):
+        if retenu is None:
+            continue
+        option, gain, effort = retenu
+        changements.append({
+            "question_id": q["id"],
+            "question": q["question"],
+            "reference": q["reference"],
+            "categorie": q["categorie"],
+            "actuelle": actuelle,
+            "cible": option,
+            "points": gain,
+            "effort": effort,
+            "ko": obligatoire
+        })
+    
+    score_atteint = score + sum(c["points"] for c in changements)
+    pourcentage = score_atteint / questionnaire["max"] * 100
+    return {
+        **plan,
+        "atteignable": True,
+        "changements": changements,
+        "effort": sum(c["effort"] for c in changements),
+        "score_atteint": score_atteint,
+        "pourcentage": pourcentage,
+        "eligibilite": determiner_eligibilite({"pourcentage": pourcentage, "ko_manquants": []})
+    }
+
+def plans_amelioration(reponses, efforts=None, questionnaire=None):
+    """Plans vers chacun des seuils de SEUILS_PLAN que l'évaluation n'atteint pas encore"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    resultats = calculer_score(reponses, questionnaire)
+    plans = []
+    for statut in SEUILS_PLAN:
+        if not resultats["ko_manquants"] and resultats["pourcentage"] >= SEUILS_ELIGIBILITE[statut]:
+            continue
+        plans.append(plan_amelioration(reponses, statut, efforts, questionnaire))
+    return plans
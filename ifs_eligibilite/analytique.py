@@ -0,0 +1,204 @@
+"""Agrégats pré-calculés sur les évaluations terminées
+
+Les agrégats sont tenus à jour dans la même transaction que l'enregistrement
+de chaque évaluation : leur lecture ne parcourt jamais l'historique, elle ne
+dépend que du nombre de jours, de statuts, de catégories et de références KO.
+
+La distribution des pourcentages (score total et chaque catégorie) est un
+histogramme au dixième de point : au plus 1 001 cases par série, que l'on
+additionne ou soustrait comme les autres agrégats. La part des évaluations
+qui font mieux qu'un score s'y lit en temps constant.
+"""
+
+import json
+from collections import defaultdict
+
+SCHEMA_AGREGATS = """
+CREATE TABLE IF NOT EXISTS agregats_statut (
+    jour TEXT NOT NULL,
+    statut TEXT NOT NULL,
+    nombre INTEGER NOT NULL,
+    somme_pourcentage REAL NOT NULL,
+    PRIMARY KEY (jour, statut)
+);
+CREATE TABLE IF NOT EXISTS agregats_categories (
+    jour TEXT NOT NULL,
+    categorie TEXT NOT NULL,
+    nombre INTEGER NOT NULL,
+    somme_pourcentage REAL NOT NULL,
+    PRIMARY KEY (jour, categorie)
+);
+CREATE TABLE IF NOT EXISTS agregats_ko (
+    reference TEXT PRIMARY KEY,
+    echecs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS agregats_distribution (
+    serie TEXT NOT NULL,
+    dixieme INTEGER NOT NULL,
+    nombre INTEGER NOT NULL,
+    PRIMARY KEY (serie, dixieme)
+);
+"""
+
+# Série de la distribution du score total ; les autres séries sont les catégories
+SERIE_TOTAL = "total"
+
+# Cases de la distribution : pourcentages de 0 à 100 au dixième de point
+CASES_DISTRIBUTION = 1001
+
+def case_distribution(pourcentage):
+    """Case de la distribution d'un pourcentage"""
+    return min(CASES_DISTRIBUTION - 1, max(0, round(pourcentage * 10)))
+
+def contributions(evaluations):
+    """Somme les contributions d'évaluations terminées aux agrégats
+    
+    Chaque évaluation est un dictionnaire de colonnes de la table `evaluations`
+    (catégories et KO manquants sérialisés en JSON) ; les évaluations en cours
+    sont ignorées.
+    """
+    statuts = defaultdict(lambda: [0, 0.0])
+    categories = defaultdict(lambda: [0, 0.0])
+    ko = defaultdict(int)
+    distribution = defaultdict(int)
+    
+    for evaluation in evaluations:
+        if evaluation["statut"] is None:
+            continue
+        jour = evaluation["date_evaluation"][:10]
+        
+        cumul = statuts[(jour, evaluation["statut"])]
+        cumul[0] += 1
+        cumul[1] += evaluation["pourcentage"]
+        distribution[(SERIE_TOTAL, case_distribution(evaluation["pourcentage"]))] += 1
+        
+        for categorie, data in json.loads(evaluation["categories"]).items():
+            cumul = categories[(jour, categorie)]
+            cumul[0] += 1
+            cumul[1] += data["pourcentage"]
+            distribution[(categorie, case_distribution(data["pourcentage"]))] += 1
+        
+        for manquant in json.loads(evaluation["ko_manquants"]):
+            ko[manquant["reference"]] += 1
+    
+    return {"statuts": statuts, "categories": categories, "ko": ko, "distribution": distribution}
+
+def appliquer_contributions(conn, deltas, signe=1):
+    """Ajoute (signe=1) ou retire (signe=-1) des contributions aux agrégats"""
+    conn.executemany(
+        """INSERT INTO agregats_statut (jour, statut, nombre, somme_pourcentage) VALUES (?, ?, ?, ?)
+           ON CONFLICT (jour, statut) DO UPDATE SET
+               nombre = nombre + excluded.nombre,
+               somme_pourcentage = somme_pourcentage + excluded.somme_pourcentage""",
+        [(jour, statut, signe * n, signe * s) for (jour, statut), (n, s) in deltas["statuts"].items()]
+    )
+    conn.executemany(
+        """INSERT INTO agregats_categories (jour, categorie, nombre, somme_pourcentage) VALUES (?, ?, ?, ?)
+           ON CONFLICT (jour, categorie) DO UPDATE SET
+               nombre = nombre + excluded.nombre,
+               somme_pourcentage = somme_pourcentage + excluded.somme_pourcentage""",
+        [(jour, categorie, signe * n, signe * s) for (jour, categorie), (n, s) in deltas["categories"].items()]
+    )
+    conn.executemany(
+        """INSERT INTO agregats_ko (reference, echecs) VALUES (?, ?)
+           ON CONFLICT (reference) DO UPDATE SET echecs = echecs + excluded.echecs""",
+        [(reference, signe * n) for reference, n in deltas["ko"].items()]
+    )
+    conn.executemany(
+        """INSERT INTO agregats_distribution (serie, dixieme, nombre) VALUES (?, ?, ?)
+           ON CONFLICT (serie, dixieme) DO UPDATE SET nombre = nombre + excluded.nombre""",
+        [(serie, dixieme, signe * n) for (serie, dixieme), n in deltas["distribution"].items()]
+    )
+
+def reconstruire_agregats(conn, taille_lot=10_000):
+    """Recalcule tous les agrégats à partir de l'historique (migration, réparation)"""
+    with conn:
+        conn.execute("DELETE FROM agregats_statut")
+        conn.execute("DELETE FROM agregats_categories")
+        conn.execute("DELETE FROM agregats_ko")
+        conn.execute("DELETE FROM agregats_distribution")
+        curseur = conn.execute(
+            "SELECT date_evaluation, statut, pourcentage, categories, ko_manquants "
+            "FROM evaluations WHERE statut IS NOT NULL"
+        )
+        while True:
+            lignes = curseur.fetchmany(taille_lot)
+            if not lignes:
+                break
+            appliquer_contributions(conn, contributions(dict(ligne) for ligne in lignes))
+
+def lire_agregats(conn):
+    """Lit les agrégats : statuts, taux d'échec par KO, moyennes par catégorie et tendances"""
+    statuts = {}
+    tendance = defaultdict(lambda: {"nombre": 0, "somme_pourcentage": 0.0, "statuts": {}})
+    for jour, statut, nombre, somme in conn.execute(
+        "SELECT jour, statut, nombre, somme_pourcentage FROM agregats_statut WHERE nombre > 0 ORDER BY jour"
+    ):
+        statuts[statut] = statuts.get(statut, 0) + nombre
+        tendance[jour]["nombre"] += nombre
+        tendance[jour]["somme_pourcentage"] += somme
+        tendance[jour]["statuts"][statut] = nombre
+    total = sum(statuts.values())
+    
+    categories = {}
+    for categorie, nombre, somme in conn.execute(
+        "SELECT categorie, SUM(nombre), SUM(somme_pourcentage) FROM agregats_categories GROUP BY categorie"
+    ):
+        if nombre:
+            categories[categorie] = somme / nombre
+    
+    ko = {
+        reference: echecs / total
+        for reference, echecs in conn.execute(
+            "SELECT reference, echecs FROM agregats_ko WHERE echecs > 0 ORDER BY echecs DESC"
+        )
+    } if total else {}
+    
+    return {
+        "total": total,
+        "statuts": statuts,
+        "taux_echec_ko": ko,
+        "moyennes_categories": categories,
+        "tendance": [
+            {
+                "jour": jour,
+                "nombre": data["nombre"],
+                "pourcentage_moyen": data["somme_pourcentage"] / data["nombre"],
+                "statuts": data["statuts"]
+            }
+            for jour, data in tendance.items()
+        ]
+    }
+
+def lire_distribution(conn):
+    """Distribution des pourcentages par série, en nombre cumulé d'évaluations
+    
+    Pour chaque série, `au_moins[c]` est le nombre d'évaluations dont le
+    pourcentage tombe dans la case `c` ou au-dessus ; `au_moins[0]` est donc
+    le nombre total d'évaluations de la série.
+    """
+    comptes = defaultdict(lambda: [0] * CASES_DISTRIBUTION)
+    for serie, dixieme, nombre in conn.execute(
+        "SELECT serie, dixieme, nombre FROM agregats_distribution WHERE nombre > 0"
+    ):
+        comptes[serie][dixieme] = nombre
+    
+    distribution = {}
+    for serie, cases in comptes.items():
+        au_moins = [0] * (CASES_DISTRIBUTION + 1)
+        for c in range(CASES_DISTRIBUTION - 1, -1, -1):
+            au_moins[c] = au_moins[c + 1] + cases[c]
+        distribution[serie] = au_moins
+    return distribution
+
+def part_devant(distribution, serie, pourcentage):
+    """Part (en %) des évaluations d'une série qui font mieux, ou None sans historique
+    
+    Les évaluations de la même case comptent pour moitié : une série où
+    toutes font 100 % place chacune au milieu, et non en tête ou en queue.
+    """
+    au_moins = distribution.get(serie)
+    if not au_moins or not au_moins[0]:
+        return None
+    case = case_distribution(pourcentage)
+    return (au_moins[case + 1] + au_moins[case]) / 2 / au_moins[0] * 100
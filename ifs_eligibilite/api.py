@@ -0,0 +1,292 @@
+"""Service HTTP JSON d'évaluation, sans dépendance hors bibliothèque standard
+
+Usage :
+    python -m ifs_eligibilite.api --port 8502 --concurrence 4
+
+Routes :
+    GET  /questionnaire        définition du questionnaire
+    POST /evaluations          {"reponses": {...}} -> rapport JSON
+    POST /evaluations/lot      {"evaluations": [{...}, ...]} -> {"rapports": [...]}
+    POST /evaluations/plan     {"reponses": {...}, "efforts": {...}} -> {"plans": [...]}
+    GET  /sante                état du service et métriques
+
+Les calculs s'exécutent hors de la boucle asyncio, au plus `concurrence` à la
+fois ; au-delà de `file_max` demandes en attente, le service répond 503. Les
+demandes identiques reçues pendant qu'un calcul est en cours le partagent.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from http import HTTPStatus
+
+from .questionnaire import questionnaire_actif
+from .moteur import cle_reponses
+from .cache import rapport_en_cache, statistiques_caches
+from .amelioration import plans_amelioration
+
+TAILLE_MAX_CORPS = 10 * 1024 * 1024
+TAILLE_MAX_LOT = 10_000
+
+# Valeurs admises pour une réponse : libellé d'option, texte, nombre ou absence
+TYPES_REPONSE = (str, int, float, type(None))
+
+logger = logging.getLogger(__name__)
+
+class ErreurHTTP(Exception):
+    """Erreur renvoyée au client avec un statut HTTP"""
+    
+    def __init__(self, statut, message):
+        super().__init__(message)
+        self.statut = statut
+
+def verifier_reponses(reponses):
+    """Lève ValueError si une réponse n'est pas une valeur simple (liste ou objet JSON)"""
+    for question_id, valeur in reponses.items():
+        if not isinstance(valeur, TYPES_REPONSE):
+            raise ValueError(f"Réponse invalide pour {question_id} : valeur simple attendue")
+
+def evaluer(reponses):
+    """Calcule le rapport JSON d'un jeu de réponses"""
+    verifier_reponses(reponses)
+    return rapport_en_cache(reponses)
+
+def evaluer_tout(evaluations):
+    """Calcule les rapports d'un lot ; une réponse invalide donne un rapport d'erreur"""
+    rapports = []
+    for reponses in evaluations:
+        try:
+            rapports.append(evaluer(reponses))
+        except ValueError as e:
+            rapports.append({"erreur": str(e)})
+    return rapports
+
+class ServiceEvaluation:
+    """Service asyncio d'évaluation exposé en HTTP/1.1"""
+    
+    def __init__(self, concurrence=4, file_max=256):
+        self.semaphore = asyncio.Semaphore(concurrence)
+        self.file_max = file_max
+        self.en_attente = 0
+        self.en_vol = {}
+        self.debut = time.monotonic()
+        self.compteurs = Counter()
+        self.duree_totale = 0.0
+    
+    async def calculer(self, fonction, *args):
+        """Exécute un calcul hors de la boucle, dans la limite de concurrence"""
+        if self.en_attente >= self.file_max:
+            self.compteurs["rejets"] += 1
+            raise ErreurHTTP(HTTPStatus.SERVICE_UNAVAILABLE, "Service saturé, réessayez plus tard")
+        self.en_attente += 1
+        try:
+            async with self.semaphore:
+                return await asyncio.to_thread(fonction, *args)
+        finally:
+            self.en_attente -= 1
+    
+    async def evaluer(self, reponses):
+        """Évalue un jeu de réponses en partageant les calculs identiques en cours"""
+        verifier_reponses(reponses)
+        cle = cle_reponses(reponses)
+        if cle in self.en_vol:
+            self.compteurs["regroupees"] += 1
+            return await asyncio.shield(self.en_vol[cle])
+        
+        tache = asyncio.ensure_future(self.calculer(evaluer, reponses))
+        self.en_vol[cle] = tache
+        try:
+            return await asyncio.shield(tache)
+        finally:
+            if self.en_vol.get(cle) is tache:
+                del self.en_vol[cle]
+    
+    def sante(self):
+        """État du service et métriques de fonctionnement"""
+        nb_requetes = self.compteurs["requetes"]
+        return {
+            "statut": "ok",
+            "uptime_s": round(time.monotonic() - self.debut, 1),
+            "en_attente": self.en_attente,
+            "calculs_en_cours": len(self.en_vol),
+            "duree_moyenne_ms": round(self.duree_totale / nb_requetes * 1000, 3) if nb_requetes else 0.0,
+            "compteurs": dict(self.compteurs),
+            "caches": statistiques_caches()
+        }
+    
+    async def traiter(self, methode, chemin, corps):
+        """Route une requête et retourne le statut et l'objet JSON de la réponse"""
+        if chemin == "/questionnaire":
+            self._verifier_methode(methode, "GET")
+            actif = questionnaire_actif()
+            return HTTPStatus.OK, {"version": actif["version"], "categories": actif["questions"]}
+        
+        if chemin == "/sante":
+            self._verifier_methode(methode, "GET")
+            return HTTPStatus.OK, self.sante()
+        
+        if chemin == "/evaluations":
+            self._verifier_methode(methode, "POST")
+            reponses = self._champ(corps, "reponses", dict)
+            try:
+                return HTTPStatus.OK, await self.evaluer(reponses)
+            except ValueError as e:
+                raise ErreurHTTP(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+        
+        if chemin == "/evaluations/lot":
+            self._verifier_methode(methode, "POST")
+            evaluations = self._champ(corps, "evaluations", list)
+            if len(evaluations) > TAILLE_MAX_LOT:
+                raise ErreurHTTP(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Lot limité à {TAILLE_MAX_LOT} évaluations")
+            if not all(isinstance(reponses, dict) for reponses in evaluations):
+                raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "Chaque évaluation doit être un objet JSON")
+            return HTTPStatus.OK, {"rapports": await self.calculer(evaluer_tout, evaluations)}
+        
+        if chemin == "/evaluations/plan":
+            self._verifier_methode(methode, "POST")
+            reponses = self._champ(corps, "reponses", dict)
+            efforts = json.loads(corps).get("efforts") or {}
+            if not isinstance(efforts, dict):
+                raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "Champ « efforts » invalide")
+            try:
+                verifier_reponses(reponses)
+                return HTTPStatus.OK, {"plans": await self.calculer(plans_amelioration, reponses, efforts)}
+            except ValueError as e:
+                raise ErreurHTTP(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+        
+        raise ErreurHTTP(HTTPStatus.NOT_FOUND, f"Route inconnue : {chemin}")
+    
+    @staticmethod
+    def _verifier_methode(methode, attendue):
+        if methode != attendue:
+            raise ErreurHTTP(HTTPStatus.METHOD_NOT_ALLOWED, f"Méthode {methode} non autorisée")
+    
+    @staticmethod
+    def _champ(corps, nom, type_attendu):
+        """Extrait un champ du corps JSON de la requête"""
+        try:
+            donnees = json.loads(corps or b"{}")
+        except ValueError:
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "Corps JSON invalide")
+        if not isinstance(donnees, dict) or not isinstance(donnees.get(nom), type_attendu):
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, f"Champ « {nom} » manquant ou invalide")
+        return donnees[nom]
+    
+    async def connexion(self, lecteur, ecrivain):
+        """Sert les requêtes d'une connexion, en la gardant ouverte entre deux requêtes"""
+        try:
+            while True:
+                requete = await self._lire_requete(lecteur)
+                if requete is None:
+                    break
+                methode, chemin, entetes, corps = requete
+                
+                debut = time.perf_counter()
+                self.compteurs["requetes"] += 1
+                try:
+                    statut, reponse = await self.traiter(methode, chemin, corps)
+                except ErreurHTTP as e:
+                    self.compteurs[f"erreurs_{e.statut.value}"] += 1
+                    statut, reponse = e.statut, {"erreur": str(e)}
+                except Exception:
+                    # Erreur imprévue : la connexion reste ouverte, le client reçoit un 500
+                    logger.exception("Erreur lors du traitement de %s %s", methode, chemin)
+                    self.compteurs["erreurs_500"] += 1
+                    statut, reponse = HTTPStatus.INTERNAL_SERVER_ERROR, {"erreur": "Erreur interne du service"}
+                self.duree_totale += time.perf_counter() - debut
+                
+                garder = entetes.get("connection", "").lower() != "close"
+                self._ecrire_reponse(ecrivain, statut, reponse, garder)
+                await ecrivain.drain()
+                if not garder:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ErreurHTTP as e:
+            # Requête illisible : on répond puis on ferme la connexion
+            self._ecrire_reponse(ecrivain, e.statut, {"erreur": str(e)}, False)
+        finally:
+            ecrivain.close()
+    
+    @staticmethod
+    async def _lire_ligne(lecteur):
+        """Lit une ligne de la requête ; une ligne plus longue que la limite du flux est refusée"""
+        try:
+            return await lecteur.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "Ligne de requête ou d'en-tête trop longue")
+    
+    async def _lire_requete(self, lecteur):
+        """Lit une requête HTTP/1.1 ; retourne None en fin de connexion"""
+        ligne = await self._lire_ligne(lecteur)
+        if not ligne.strip():
+            return None
+        try:
+            methode, cible, _ = ligne.decode("latin-1").split()
+        except ValueError:
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "Ligne de requête invalide")
+        
+        entetes = {}
+        while True:
+            ligne = await self._lire_ligne(lecteur)
+            if ligne in (b"\r\n", b"\n", b""):
+                break
+            nom, _, valeur = ligne.decode("latin-1").partition(":")
+            entetes[nom.strip().lower()] = valeur.strip()
+        
+        try:
+            longueur = int(entetes.get("content-length", 0) or 0)
+        except ValueError:
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "En-tête Content-Length invalide")
+        if longueur < 0:
+            raise ErreurHTTP(HTTPStatus.BAD_REQUEST, "En-tête Content-Length invalide")
+        if longueur > TAILLE_MAX_CORPS:
+            raise ErreurHTTP(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Corps de requête trop volumineux")
+        corps = await lecteur.readexactly(longueur) if longueur else b""
+        return methode.upper(), cible.split("?", 1)[0], entetes, corps
+    
+    @staticmethod
+    def _ecrire_reponse(ecrivain, statut, reponse, garder):
+        corps = json.dumps(reponse, ensure_ascii=False).encode("utf-8")
+        entetes = (
+            f"HTTP/1.1 {statut.value} {statut.phrase}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(corps)}\r\n"
+            f"Connection: {'keep-alive' if garder else 'close'}\r\n\r\n"
+        )
+        ecrivain.write(entetes.encode("latin-1") + corps)
+
+async def demarrer(hote="127.0.0.1", port=8502, concurrence=4, file_max=256):
+    """Démarre le service et retourne le serveur asyncio"""
+    service = ServiceEvaluation(concurrence, file_max)
+    return await asyncio.start_server(service.connexion, hote, port)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.api",
+        description="Service HTTP JSON d'évaluation de l'éligibilité IFS Food v8."
+    )
+    parser.add_argument("--hote", default="127.0.0.1", help="adresse d'écoute")
+    parser.add_argument("--port", type=int, default=8502, help="port d'écoute")
+    parser.add_argument("--concurrence", type=int, default=4, help="calculs simultanés au plus")
+    parser.add_argument("--file-max", type=int, default=256, help="demandes en attente au plus avant rejet (503)")
+    args = parser.parse_args(argv)
+    
+    async def servir():
+        serveur = await demarrer(args.hote, args.port, args.concurrence, args.file_max)
+        print(f"Service d'évaluation à l'écoute sur http://{args.hote}:{args.port}")
+        async with serveur:
+            await serveur.serve_forever()
+    
+    try:
+        asyncio.run(servir())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
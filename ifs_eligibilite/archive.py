@@ -0,0 +1,365 @@
+"""Archive en colonnes des évaluations terminées, lue par projection en mémoire
+
+Usage :
+    python -m ifs_eligibilite.archive construire archive [--depuis 2024-01-01] [--jusqu-a 2025-01-01]
+    python -m ifs_eligibilite.archive interroger archive [--ko ko_7] [--reponse haccp=Non]
+                                                 [--statut NON_ELIGIBLE] [--depuis ...] [--jusqu-a ...]
+                                                 [--repartition haccp] [--liste 20]
+
+Une archive est un répertoire de fichiers .npy : la matrice des réponses
+(une ligne par évaluation, une colonne par question à choix dans l'ordre du
+questionnaire compilé, un octet par réponse : l'indice de l'option, ou
+SANS_REPONSE), rangée colonne par colonne, et une colonne par métadonnée
+(identifiant, date, statut, score, pourcentage, entreprise). Le manifeste
+décrit les colonnes, les options et les points de chaque question.
+
+Les fichiers sont ouverts par projection en mémoire : une requête ne lit que
+les colonnes qu'elle consulte, par blocs de TAILLE_BLOC lignes, et seules les
+pages touchées sont chargées. Chaque condition sur une réponse est une table
+de 256 booléens indexée par l'octet de la réponse.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from .questionnaire import questionnaire_actif
+from .moteur import ORDRE_STATUTS, ReponsesCompactes
+
+FORMAT = 1
+
+# Nombre de lignes lues à la fois par une requête, et écrites à la fois à la construction
+TAILLE_BLOC = 1_000_000
+BLOC_ECRITURE = 50_000
+
+SANS_REPONSE = ReponsesCompactes.SANS_REPONSE
+
+# Colonnes de métadonnées et leur type numpy
+METADONNEES = {
+    "id": "int64",
+    "date": "datetime64[s]",
+    "statut": "uint8",
+    "score": "int32",
+    "pourcentage": "float32",
+    "entreprise": "uint32"
+}
+
+def _ligne(evaluation, positions, entreprises):
+    """Octets des réponses et métadonnées d'une évaluation enregistrée"""
+    choix = bytearray([SANS_REPONSE]) * len(positions)
+    for question_id, valeur in evaluation["reponses"].items():
+        position = positions.get(question_id)
+        if position is not None:
+            # Une option absente du questionnaire de l'archive (autre version) compte comme sans réponse
+            choix[position[0]] = position[1].get(valeur, SANS_REPONSE)
+    entreprise = evaluation["entreprise"] or ""
+    code = entreprises.setdefault(entreprise, len(entreprises))
+    return choix, (
+        evaluation["id"], evaluation["date_evaluation"], ORDRE_STATUTS.index(evaluation["statut"]),
+        evaluation["score"], evaluation["pourcentage"], code
+    )
+
+def _copier(brut, chemin, dtype, forme, fortran=False):
+    """Convertit un fichier brut ligne à ligne en fichier .npy, par blocs"""
+    import numpy as np
+    
+    if not forme[0]:
+        # Un fichier vide ne peut pas être projeté en mémoire
+        with open(chemin + ".tmp", "wb") as f:
+            np.save(f, np.empty(forme, dtype=dtype))
+    else:
+        destination = np.lib.format.open_memmap(chemin + ".tmp", mode="w+", dtype=dtype, shape=forme,
+                                                fortran_order=fortran)
+        source = np.memmap(brut, dtype=dtype, mode="r", shape=forme)
+        for debut in range(0, forme[0], TAILLE_BLOC):
+            destination[debut:debut + TAILLE_BLOC] = source[debut:debut + TAILLE_BLOC]
+        destination.flush()
+        del source, destination
+    os.remove(brut)
+    os.replace(chemin + ".tmp", chemin)
+
+def construire_archive(repertoire, evaluations=None, questionnaire=None, **filtres):
+    """Écrit l'archive des évaluations terminées dans `repertoire` et retourne son manifeste
+    
+    Les évaluations sont lues une seule fois par stockage.iterer_evaluations
+    (avec les `filtres` statut, depuis, jusqu_a, chemin), ou prises dans
+    l'itérable `evaluations` de lignes de la table. Les colonnes suivent le
+    questionnaire compilé `questionnaire` (l'actif par défaut). Une archive
+    existante est remplacée fichier par fichier, manifeste en dernier.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    if evaluations is None:
+        from .stockage import iterer_evaluations
+        evaluations = iterer_evaluations(**filtres)
+    
+    colonnes = list(questionnaire["positions"])
+    positions = {
+        question_id: (position, {option: i for i, option in enumerate(questionnaire["options"][question_id])})
+        for question_id, position in questionnaire["positions"].items()
+    }
+    entreprises = {}
+    os.makedirs(repertoire, exist_ok=True)
+    
+    # Premier passage : fichiers bruts écrits au fil de la lecture, le nombre de lignes n'étant pas connu
+    bruts = {nom: os.path.join(repertoire, f"{nom}.brut") for nom in ["reponses", *METADONNEES]}
+    fichiers = {nom: open(chemin, "wb") for nom, chemin in bruts.items()}
+    lignes = 0
+    try:
+        bloc, metadonnees = bytearray(), []
+        for evaluation in evaluations:
+            choix, ligne = _ligne(evaluation, positions, entreprises)
+            bloc += choix
+            metadonnees.append(ligne)
+            if len(metadonnees) == BLOC_ECRITURE:
+                _ecrire_bloc(fichiers, bloc, metadonnees)
+                lignes += len(metadonnees)
+                bloc, metadonnees = bytearray(), []
+        _ecrire_bloc(fichiers, bloc, metadonnees)
+        lignes += len(metadonnees)
+    finally:
+        for fichier in fichiers.values():
+            fichier.close()
+    
+    # Second passage : fichiers .npy, la matrice des réponses rangée par colonne
+    _copier(bruts["reponses"], os.path.join(repertoire, "reponses.npy"), "uint8", (lignes, len(colonnes)), fortran=True)
+    for nom, dtype in METADONNEES.items():
+        _copier(bruts[nom], os.path.join(repertoire, f"{nom}.npy"), dtype, (lignes,))
+    
+    with open(os.path.join(repertoire, "entreprises.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(list(entreprises), f, ensure_ascii=False)
+    os.replace(os.path.join(repertoire, "entreprises.json.tmp"), os.path.join(repertoire, "entreprises.json"))
+    
+    manifeste = {
+        "format": FORMAT,
+        "creation": datetime.now().isoformat(timespec="seconds"),
+        "lignes": lignes,
+        "version_questionnaire": questionnaire.get("version"),
+        "empreinte_questionnaire": questionnaire.get("empreinte"),
+        "colonnes": colonnes,
+        "options": {question_id: questionnaire["options"][question_id] for question_id in colonnes},
+        "points": {
+            question_id: list(q["points"].values())
+            for question_id, q in questionnaire["index"].items() if question_id in positions
+        },
+        "ko": [question_id for question_id in questionnaire["ko"] if question_id in positions],
+        "statuts": ORDRE_STATUTS,
+        "metadonnees": METADONNEES
+    }
+    with open(os.path.join(repertoire, "manifeste.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.replace(os.path.join(repertoire, "manifeste.json.tmp"), os.path.join(repertoire, "manifeste.json"))
+    return manifeste
+
+def _ecrire_bloc(fichiers, bloc, metadonnees):
+    """Ajoute un bloc de lignes aux fichiers bruts"""
+    import numpy as np
+    
+    if not metadonnees:
+        return
+    fichiers["reponses"].write(bloc)
+    for nom, valeurs in zip(METADONNEES, zip(*metadonnees)):
+        fichiers[nom].write(np.array(valeurs, dtype=METADONNEES[nom]).tobytes())
+
+def ouvrir_archive(repertoire):
+    """Ouvre une archive par projection en mémoire ; aucune ligne n'est lue à l'ouverture"""
+    import numpy as np
+    
+    with open(os.path.join(repertoire, "manifeste.json"), encoding="utf-8") as f:
+        manifeste = json.load(f)
+    if manifeste["format"] != FORMAT:
+        raise ValueError(f"Format d'archive non pris en charge : {manifeste['format']}")
+    
+    archive = {
+        "repertoire": repertoire,
+        "manifeste": manifeste,
+        "lignes": manifeste["lignes"],
+        "positions": {question_id: i for i, question_id in enumerate(manifeste["colonnes"])}
+    }
+    # Les fichiers d'une archive vide ne peuvent pas être projetés en mémoire
+    mode = "r" if manifeste["lignes"] else None
+    archive["reponses"] = np.load(os.path.join(repertoire, "reponses.npy"), mmap_mode=mode)
+    for nom in manifeste["metadonnees"]:
+        archive[nom] = np.load(os.path.join(repertoire, f"{nom}.npy"), mmap_mode=mode)
+    return archive
+
+def colonne(archive, question_id):
+    """Indices des options choisies à une question, pour toutes les lignes (vue sans copie)"""
+    if question_id not in archive["positions"]:
+        raise ValueError(f"Question absente de l'archive : {question_id}")
+    return archive["reponses"][:, archive["positions"][question_id]]
+
+def _table(archive, question_id, options=None):
+    """Table de 256 booléens : vrai pour les réponses retenues à une question
+    
+    Sans `options`, les réponses retenues sont les échecs de l'exigence KO
+    (réponse donnée à moins de 100 points), comme les compte calculer_score.
+    """
+    import numpy as np
+    
+    manifeste = archive["manifeste"]
+    table = np.zeros(256, dtype=bool)
+    if options is None:
+        if question_id not in manifeste["ko"]:
+            raise ValueError(f"Pas une exigence KO : {question_id}")
+        table[:len(manifeste["points"][question_id])] = np.array(manifeste["points"][question_id]) < 100
+        return table
+    
+    connues = manifeste["options"][question_id]
+    for option in options:
+        if option not in connues:
+            raise ValueError(f"Réponse inconnue pour {question_id}: {option!r}")
+        table[connues.index(option)] = True
+    return table
+
+def selectionner(archive, depuis=None, jusqu_a=None, statuts=None, ko=(), reponses=None):
+    """Lignes qui satisfont toutes les conditions, en tableau d'indices croissants
+    
+    `ko` liste des exigences KO manquées (toutes) ; `reponses` associe une
+    question à une option ou une liste d'options acceptées ; `statuts` liste
+    les statuts acceptés ; la période [depuis, jusqu_a[ porte sur la date de
+    l'évaluation. Les colonnes sont lues par blocs de TAILLE_BLOC lignes.
+    """
+    import numpy as np
+    
+    demandes = [(question_id, None) for question_id in ko]
+    for question_id, options in (reponses or {}).items():
+        demandes.append((question_id, [options] if isinstance(options, str) else options))
+    conditions = []
+    for question_id, options in demandes:
+        if question_id not in archive["positions"]:
+            raise ValueError(f"Question absente de l'archive : {question_id}")
+        conditions.append((archive["positions"][question_id], _table(archive, question_id, options)))
+    
+    codes_statuts = None
+    if statuts is not None:
+        codes_statuts = np.zeros(256, dtype=bool)
+        for statut in statuts:
+            codes_statuts[archive["manifeste"]["statuts"].index(statut)] = True
+    
+    selection = []
+    for debut in range(0, archive["lignes"], TAILLE_BLOC):
+        fin = min(debut + TAILLE_BLOC, archive["lignes"])
+        masque = np.ones(fin - debut, dtype=bool)
+        if depuis is not None:
+            masque &= archive["date"][debut:fin] >= np.datetime64(depuis, "s")
+        if jusqu_a is not None:
+            masque &= archive["date"][debut:fin] < np.datetime64(jusqu_a, "s")
+        if codes_statuts is not None:
+            masque &= codes_statuts[archive["statut"][debut:fin]]
+        for position, table in conditions:
+            masque &= table[archive["reponses"][debut:fin, position]]
+        selection.append(np.flatnonzero(masque) + debut)
+    return np.concatenate(selection) if selection else np.empty(0, dtype=np.int64)
+
+def repartition(archive, question_id, lignes=None):
+    """Nombre de lignes par option d'une question (toutes les lignes, ou les indices `lignes`)"""
+    import numpy as np
+    
+    valeurs = colonne(archive, question_id)
+    if lignes is not None:
+        valeurs = valeurs[lignes]
+    comptes = np.bincount(valeurs, minlength=256)
+    options = archive["manifeste"]["options"][question_id]
+    resultat = {option: int(comptes[i]) for i, option in enumerate(options)}
+    if comptes[SANS_REPONSE]:
+        resultat[None] = int(comptes[SANS_REPONSE])
+    return resultat
+
+def decrire(archive, lignes):
+    """Métadonnées des lignes d'indices `lignes`, sous forme de dictionnaires"""
+    import numpy as np
+    
+    with open(os.path.join(archive["repertoire"], "entreprises.json"), encoding="utf-8") as f:
+        entreprises = json.load(f)
+    statuts = archive["manifeste"]["statuts"]
+    lignes = np.asarray(lignes, dtype=np.int64)
+    if not len(lignes):
+        return []
+    # Une lecture groupée par colonne plutôt qu'un accès par ligne et par colonne
+    return [
+        {
+            "id": identifiant,
+            "date": date,
+            "entreprise": entreprises[entreprise] or None,
+            "statut": statuts[statut],
+            "score": score,
+            "pourcentage": round(pourcentage, 1)
+        }
+        for identifiant, date, entreprise, statut, score, pourcentage in zip(
+            archive["id"][lignes].tolist(),
+            archive["date"][lignes].astype(str).tolist(),
+            archive["entreprise"][lignes].tolist(),
+            archive["statut"][lignes].tolist(),
+            archive["score"][lignes].tolist(),
+            archive["pourcentage"][lignes].tolist()
+        )
+    ]
+
+def _date(texte):
+    return datetime.fromisoformat(texte)
+
+def _reponse(texte):
+    question_id, separateur, option = texte.partition("=")
+    if not separateur:
+        raise argparse.ArgumentTypeError(f"attendu question=option : {texte!r}")
+    return question_id, option
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.archive",
+        description="Construit et interroge l'archive en colonnes des évaluations terminées."
+    )
+    commandes = parser.add_subparsers(dest="commande", required=True)
+    
+    construire = commandes.add_parser("construire", help="archiver les évaluations de la base (IFS_BASE)")
+    construire.add_argument("repertoire", help="répertoire de l'archive")
+    construire.add_argument("--depuis", type=_date, help="date d'évaluation minimale (incluse)")
+    construire.add_argument("--jusqu-a", type=_date, help="date d'évaluation maximale (exclue)")
+    
+    interroger = commandes.add_parser("interroger", help="compter et lister les évaluations archivées")
+    interroger.add_argument("repertoire", help="répertoire de l'archive")
+    interroger.add_argument("--depuis", type=_date, help="date d'évaluation minimale (incluse)")
+    interroger.add_argument("--jusqu-a", type=_date, help="date d'évaluation maximale (exclue)")
+    interroger.add_argument("--statut", action="append", choices=ORDRE_STATUTS, help="statut accepté (répétable)")
+    interroger.add_argument("--ko", action="append", default=[], help="exigence KO manquée (répétable)")
+    interroger.add_argument("--reponse", action="append", type=_reponse, default=[],
+                            help="réponse donnée, question=option (répétable)")
+    interroger.add_argument("--repartition", action="append", default=[],
+                            help="question dont donner la répartition des réponses (répétable)")
+    interroger.add_argument("--liste", type=int, default=0, help="nombre d'évaluations à lister")
+    args = parser.parse_args(argv)
+    
+    debut = time.perf_counter()
+    if args.commande == "construire":
+        manifeste = construire_archive(args.repertoire, depuis=args.depuis, jusqu_a=args.jusqu_a)
+        print(f"{manifeste['lignes']} évaluation(s), {len(manifeste['colonnes'])} questions, "
+              f"questionnaire {manifeste['version_questionnaire']}")
+        print(f"Durée : {time.perf_counter() - debut:.1f} s", file=sys.stderr)
+        return 0
+    
+    archive = ouvrir_archive(args.repertoire)
+    reponses = {}
+    for question_id, option in args.reponse:
+        reponses.setdefault(question_id, []).append(option)
+    try:
+        lignes = selectionner(archive, args.depuis, args.jusqu_a, args.statut, args.ko, reponses)
+        print(f"{len(lignes)} évaluation(s) sur {archive['lignes']}")
+        for question_id in args.repartition:
+            print(f"\n{question_id}")
+            for option, nombre in repartition(archive, question_id, lignes).items():
+                print(f"  {nombre:>10}  {option if option is not None else '(sans réponse)'}")
+    except ValueError as e:
+        parser.error(str(e))
+    if args.liste:
+        print()
+        for ligne in decrire(archive, lignes[-args.liste:][::-1]):
+            print(f"  {ligne['id']:>8}  {ligne['date']}  {ligne['statut']:<17} {ligne['pourcentage']:>5.1f}%  "
+                  f"{ligne['entreprise'] or ''}")
+    print(f"Requête : {time.perf_counter() - debut:.3f} s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
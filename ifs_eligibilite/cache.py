@@ -0,0 +1,153 @@
+"""Cache partagé des scores et des rapports, commun à toutes les sessions et requêtes du processus
+
+Le score, l'éligibilité et la partie notée du rapport ne dépendent que des
+réponses aux questions notées : ils sont mis en cache sous une clé formée de
+l'empreinte du questionnaire et du tuple de ces réponses. Les informations
+propres à l'entreprise (nom, date) sont ajoutées à chaque appel.
+
+Les objets retournés sont partagés entre appelants et ne doivent pas être
+modifiés. Les deux caches sont vidés quand une nouvelle version du
+questionnaire devient active.
+
+    IFS_CACHE_SCORES     nombre maximal de combinaisons de réponses (défaut 10 000)
+    IFS_CACHE_RAPPORTS   nombre maximal de rapports mis en forme (défaut 500)
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .questionnaire import questionnaire_actif, abonner_changement
+from .moteur import calculer_score, determiner_eligibilite, construire_rapport, cle_reponses
+from .rapports import formater_rapport, nom_fichier
+
+TAILLE_CACHE_SCORES = int(os.environ.get("IFS_CACHE_SCORES", "10000"))
+TAILLE_CACHE_RAPPORTS = int(os.environ.get("IFS_CACHE_RAPPORTS", "500"))
+
+class CacheLRU:
+    """Cache borné, le moins récemment utilisé est évincé en premier"""
+    
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+        self.invalidations = 0
+    
+    def obtenir(self, cle, calculer):
+        """Valeur en cache de `cle`, calculée par `calculer()` en cas d'absence
+        
+        Le calcul a lieu hors du verrou : deux appels simultanés sur une même
+        clé absente peuvent calculer tous deux, le dernier résultat est gardé.
+        """
+        with self._verrou:
+            if cle in self._entrees:
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return self._entrees[cle]
+            self.echecs += 1
+        
+        valeur = calculer()
+        with self._verrou:
+            self._entrees[cle] = valeur
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+        return valeur
+    
+    def vider(self):
+        """Invalide toutes les entrées"""
+        with self._verrou:
+            self._entrees.clear()
+            self.invalidations += 1
+    
+    def statistiques(self):
+        """Taille et compteurs du cache"""
+        with self._verrou:
+            appels = self.succes + self.echecs
+            return {
+                "taille": len(self._entrees),
+                "taille_max": self.taille_max,
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "taux_succes": self.succes / appels if appels else 0.0,
+                "invalidations": self.invalidations
+            }
+
+CACHE_SCORES = CacheLRU(TAILLE_CACHE_SCORES)
+CACHE_RAPPORTS = CacheLRU(TAILLE_CACHE_RAPPORTS)
+
+def _vider_caches(definition):
+    CACHE_SCORES.vider()
+    CACHE_RAPPORTS.vider()
+
+abonner_changement(_vider_caches)
+
+def cle_score(reponses, questionnaire):
+    """Encodage canonique des réponses notées : empreinte et réponse de chaque question notée"""
+    return questionnaire.get("empreinte"), tuple(map(reponses.get, questionnaire["index"]))
+
+def _evaluation(reponses, questionnaire):
+    """Entrée du cache des scores : résultats, éligibilité et partie notée du rapport"""
+    def calculer():
+        resultats = calculer_score(reponses, questionnaire)
+        eligibilite = determiner_eligibilite(resultats)
+        # Rapport sans les champs propres à l'entreprise, sérialisé une fois pour le JSONL
+        rapport = construire_rapport(resultats, eligibilite, {}, datetime.min, questionnaire)
+        note = {cle: rapport[cle] for cle in ("resultats", "categories", "ko_manquants")}
+        return {
+            "resultats": resultats,
+            "eligibilite": eligibilite,
+            "note": note,
+            "note_json": json.dumps(note, ensure_ascii=False)[1:]
+        }
+    
+    return CACHE_SCORES.obtenir(cle_score(reponses, questionnaire), calculer)
+
+def evaluer_en_cache(reponses, questionnaire=None):
+    """Résultats de calculer_score et de determiner_eligibilite, partagés entre appels"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    evaluation = _evaluation(reponses, questionnaire)
+    return evaluation["resultats"], evaluation["eligibilite"]
+
+def rapport_en_cache(reponses, date=None, questionnaire=None):
+    """Rapport identique à celui de construire_rapport, à partir de la partie notée en cache"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    evaluation = _evaluation(reponses, questionnaire)
+    date = date or datetime.now()
+    return {
+        "date_evaluation": date.strftime("%Y-%m-%d %H:%M"),
+        "entreprise": reponses.get("nom_entreprise", "N/A"),
+        **evaluation["note"]
+    }
+
+def rapport_jsonl_en_cache(reponses, date=None, questionnaire=None):
+    """Ligne JSONL du rapport, égale à json.dumps(construire_rapport(...), ensure_ascii=False)"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    evaluation = _evaluation(reponses, questionnaire)
+    date = date or datetime.now()
+    entreprise = json.dumps(reponses.get("nom_entreprise", "N/A"), ensure_ascii=False)
+    return f'{{"date_evaluation": "{date:%Y-%m-%d %H:%M}", "entreprise": {entreprise}, {evaluation["note_json"]}'
+
+def rapport_formate_en_cache(reponses, format, date=None, questionnaire=None):
+    """Rapport mis en forme (json, html ou pdf) et son nom de fichier
+    
+    La date du rapport est à la minute : la même évaluation téléchargée dans
+    la même minute n'est mise en forme qu'une fois.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    date = (date or datetime.now()).replace(second=0, microsecond=0)
+    
+    def calculer():
+        rapport = rapport_en_cache(reponses, date, questionnaire)
+        return formater_rapport(rapport, format), nom_fichier(rapport, format)
+    
+    cle = (questionnaire.get("empreinte"), cle_reponses(reponses), format, date)
+    return CACHE_RAPPORTS.obtenir(cle, calculer)
+
+def statistiques_caches():
+    """Compteurs des deux caches"""
+    return {"scores": CACHE_SCORES.statistiques(), "rapports": CACHE_RAPPORTS.statistiques()}
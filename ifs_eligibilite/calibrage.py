@@ -0,0 +1,340 @@
+"""Calibrage des seuils d'éligibilité par simulation de Monte-Carlo
+
+Usage :
+    python -m ifs_eligibilite.calibrage --tirages 2000000 [--source base] [--ko-conformes]
+                                        [--seuils 90,75,50] [--json calibrage.json]
+
+Des jeux de réponses synthétiques sont tirés sous forme de matrice d'indices
+d'options (une ligne par évaluation, une colonne par question notée), chaque
+option étant équiprobable (`--source uniforme`) ou tirée selon sa fréquence
+dans les évaluations enregistrées (`--source base` ; les questions sont alors
+tirées indépendamment). Avec `--ko-conformes`, les exigences KO sont toujours
+satisfaites. Les réponses sont notées en bloc par indexation des tables de
+points du questionnaire compilé, par blocs de taille bornée.
+
+Les scores totaux et par catégorie étant entiers, on n'en conserve que les
+histogrammes : la proportion de chaque statut se déduit ensuite pour
+n'importe quels seuils, sans nouveau tirage. La sensibilité aux pondérations
+est mesurée en augmentant tour à tour les points de chaque question.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .questionnaire import questionnaire_actif
+from .moteur import SEUILS_ELIGIBILITE, SEUILS_CATEGORIES
+
+# Nombre d'évaluations tirées et notées à la fois (une trentaine d'octets par évaluation et par question)
+TAILLE_BLOC = 250_000
+
+# Seuils dont on trace la proportion d'évaluations qui les atteignent
+SEUILS_COURBE = range(40, 100, 5)
+
+def tables_points(questionnaire=None):
+    """Tables de points des questions notées, sous forme de tableaux numpy
+    
+    Les questions sont dans l'ordre du questionnaire, donc regroupées par
+    catégorie : `debuts` donne la première colonne de chaque catégorie.
+    """
+    import numpy as np
+    
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    questions = list(questionnaire["index"].values())
+    nb_options = max(len(q["points"]) for q in questions)
+    points = np.zeros((len(questions), nb_options), dtype=np.int32)
+    for i, q in enumerate(questions):
+        points[i, :len(q["points"])] = list(q["points"].values())
+    
+    categories = list(questionnaire["categories"])
+    debuts = np.searchsorted([categories.index(q["categorie"]) for q in questions], range(len(categories)))
+    return {
+        "ids": [q["id"] for q in questions],
+        "options": [list(q["points"]) for q in questions],
+        "points": points,
+        "maximums": np.array([q["max"] for q in questions], dtype=np.int64),
+        "ko": np.array([q["ko"] for q in questions]),
+        "categories": categories,
+        "debuts": debuts,
+        "max_categories": np.array([questionnaire["categories"][c]["max"] for c in categories]),
+        "max": questionnaire["max"]
+    }
+
+def probabilites_uniformes(tables):
+    """Probabilités de tirage : options équiprobables pour chaque question"""
+    import numpy as np
+    
+    valides = np.array([[j < len(options) for j in range(tables["points"].shape[1])] for options in tables["options"]])
+    return valides / valides.sum(axis=1, keepdims=True)
+
+def probabilites_observees(evaluations, tables, lissage=1.0):
+    """Probabilités de tirage : fréquence de chaque option dans des évaluations
+    
+    `evaluations` est un itérable de dictionnaires de réponses (libellés). Un
+    lissage additif évite qu'une option jamais choisie ne soit jamais tirée.
+    Retourne les probabilités et le nombre d'évaluations lues.
+    """
+    import numpy as np
+    
+    comptes = probabilites_uniformes(tables) > 0
+    comptes = comptes * lissage
+    positions = [{option: j for j, option in enumerate(options)} for options in tables["options"]]
+    nombre = 0
+    for reponses in evaluations:
+        nombre += 1
+        for i, question_id in enumerate(tables["ids"]):
+            j = positions[i].get(reponses.get(question_id))
+            if j is not None:
+                comptes[i, j] += 1
+    return comptes / comptes.sum(axis=1, keepdims=True), nombre
+
+def ko_conformes(probabilites, tables):
+    """Probabilités conditionnées à l'absence d'exigence KO manquante
+    
+    Les options à moins de 100 points des exigences KO ne sont plus tirées :
+    la simulation ne porte que sur les évaluations que les seuils départagent.
+    """
+    probabilites = probabilites.copy()
+    probabilites[tables["ko"][:, None] & (tables["points"] < 100)] = 0
+    return probabilites / probabilites.sum(axis=1, keepdims=True)
+
+def tirer(probabilites, nombre, generateur):
+    """Matrice (nombre × questions) d'indices d'options tirés selon `probabilites`"""
+    import numpy as np
+    
+    # Cumul normalisé : les options de probabilité nulle en fin de ligne valent exactement 1 et ne sont jamais tirées
+    cumulees = np.cumsum(probabilites, axis=1)
+    cumulees /= cumulees[:, -1:]
+    tirages = generateur.random((nombre, len(probabilites)))
+    indices = np.empty((nombre, len(probabilites)), dtype=np.uint8)
+    for i, cumul in enumerate(cumulees):
+        indices[:, i] = np.searchsorted(cumul, tirages[:, i], side="right")
+    return indices
+
+def noter(indices, tables):
+    """Points par question, score par catégorie, score total et échec KO de chaque évaluation"""
+    import numpy as np
+    
+    points = tables["points"][np.arange(len(tables["ids"])), indices]
+    scores_categories = np.add.reduceat(points, tables["debuts"], axis=1)
+    echec_ko = (points[:, tables["ko"]] < 100).any(axis=1)
+    return points, scores_categories, scores_categories.sum(axis=1), echec_ko
+
+def niveaux(pourcentages, echec_ko, seuils):
+    """Rang du statut de chaque évaluation : 0 non éligible, puis un rang par seuil franchi
+    
+    Même règle que determiner_eligibilite : un seuil est atteint dès que le
+    pourcentage lui est égal, et une exigence KO manquante rend non éligible.
+    """
+    import numpy as np
+    
+    rangs = np.searchsorted(sorted(seuils), pourcentages, side="right")
+    rangs[echec_ko] = 0
+    return rangs
+
+def simuler(probabilites, tables, tirages, graine=0, variation=0.1, seuils=None, taille_bloc=TAILLE_BLOC):
+    """Tire et note `tirages` évaluations ; retourne les histogrammes et la sensibilité
+    
+    `histogramme_sans_ko[s]` compte les évaluations de score total `s` sans
+    exigence KO manquante, `histogramme[s]` toutes les évaluations de score
+    `s`. Pour la sensibilité, les points de chaque question sont augmentés de
+    `variation` (0.1 = +10 %) et les statuts recomptés avec `seuils`.
+    """
+    import numpy as np
+    
+    seuils = seuils or SEUILS_ELIGIBILITE
+    valeurs_seuils = sorted(seuils.values())
+    generateur = np.random.default_rng(graine)
+    score_max = tables["max"]
+    nb_questions = len(tables["ids"])
+    
+    histogramme = np.zeros(score_max + 1, dtype=np.int64)
+    histogramme_sans_ko = np.zeros(score_max + 1, dtype=np.int64)
+    histogrammes_categories = [np.zeros(m + 1, dtype=np.int64) for m in tables["max_categories"]]
+    statuts_modifies = np.zeros((nb_questions, len(valeurs_seuils) + 1), dtype=np.int64)
+    
+    restants = tirages
+    while restants > 0:
+        nombre = min(taille_bloc, restants)
+        restants -= nombre
+        points, scores_categories, scores, echec_ko = noter(tirer(probabilites, nombre, generateur), tables)
+        
+        histogramme += np.bincount(scores, minlength=score_max + 1)
+        histogramme_sans_ko += np.bincount(scores[~echec_ko], minlength=score_max + 1)
+        for c, histogramme_categorie in enumerate(histogrammes_categories):
+            histogramme_categorie += np.bincount(scores_categories[:, c], minlength=len(histogramme_categorie))
+        
+        # Une question pèse (1 + variation) fois plus : score et maximum augmentent de ses points
+        for i in range(nb_questions):
+            pourcentages = (scores + variation * points[:, i]) / (score_max + variation * tables["maximums"][i]) * 100
+            statuts_modifies[i] += np.bincount(
+                niveaux(pourcentages, echec_ko, valeurs_seuils), minlength=len(valeurs_seuils) + 1
+            )
+    
+    return {
+        "tirages": tirages,
+        "histogramme": histogramme,
+        "histogramme_sans_ko": histogramme_sans_ko,
+        "histogrammes_categories": histogrammes_categories,
+        "statuts_modifies": statuts_modifies
+    }
+
+def proportions_statuts(simulation, tables, seuils=None):
+    """Proportion de chaque statut pour des seuils donnés, d'après les histogrammes"""
+    import numpy as np
+    
+    seuils = seuils or SEUILS_ELIGIBILITE
+    pourcentages = np.arange(tables["max"] + 1) / tables["max"] * 100
+    codes = ["NON_ELIGIBLE", *sorted(seuils, key=seuils.get)]
+    rangs = niveaux(pourcentages, np.zeros(len(pourcentages), dtype=bool), seuils.values())
+    comptes = np.bincount(rangs, weights=simulation["histogramme_sans_ko"], minlength=len(codes))
+    # Les évaluations avec une exigence KO manquante sont non éligibles quel que soit leur score
+    comptes[0] += simulation["histogramme"].sum() - simulation["histogramme_sans_ko"].sum()
+    return {code: float(compte / simulation["tirages"]) for code, compte in zip(codes, comptes)}
+
+def quantiles(histogramme, maximum, niveaux_quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """Quantiles (en pourcentage du maximum) d'un histogramme de scores entiers"""
+    import numpy as np
+    
+    cumul = np.cumsum(histogramme)
+    return {
+        f"p{round(q * 100)}": float(np.searchsorted(cumul, q * cumul[-1]) / maximum * 100)
+        for q in niveaux_quantiles
+    }
+
+def rapport_calibrage(simulation, tables, seuils=None, bandes=None, variation=0.1):
+    """Distributions, proportions de statuts et sensibilités tirées d'une simulation"""
+    import numpy as np
+    
+    seuils = seuils or SEUILS_ELIGIBILITE
+    bandes = bandes or SEUILS_CATEGORIES
+    tirages = simulation["tirages"]
+    score_max = tables["max"]
+    pourcentages = np.arange(score_max + 1) / score_max * 100
+    sans_ko = simulation["histogramme_sans_ko"]
+    
+    categories = {}
+    for c, (categorie, histogramme) in enumerate(zip(tables["categories"], simulation["histogrammes_categories"])):
+        pourcentages_categorie = np.arange(len(histogramme)) / tables["max_categories"][c] * 100
+        categories[categorie] = {
+            "quantiles": quantiles(histogramme, tables["max_categories"][c]),
+            "bandes": {
+                nom: float(histogramme[pourcentages_categorie >= seuil].sum() / tirages)
+                for nom, seuil in sorted(bandes.items(), key=lambda b: -b[1])
+            }
+        }
+    
+    # Écart de proportion de chaque statut quand une question pèse plus
+    codes = ["NON_ELIGIBLE", *sorted(seuils, key=seuils.get)]
+    reference = proportions_statuts(simulation, tables, seuils)
+    sensibilite = {}
+    for question_id, comptes in zip(tables["ids"], simulation["statuts_modifies"]):
+        sensibilite[question_id] = {
+            code: float(compte / tirages - reference[code]) for code, compte in zip(codes, comptes)
+        }
+    
+    return {
+        "tirages": tirages,
+        "echec_ko": float(1 - sans_ko.sum() / tirages),
+        "quantiles": quantiles(simulation["histogramme"], score_max),
+        "quantiles_sans_ko": quantiles(sans_ko, score_max) if sans_ko.any() else {},
+        "statuts": reference,
+        "courbe_sans_ko": {
+            seuil: float(sans_ko[pourcentages >= seuil].sum() / tirages) for seuil in SEUILS_COURBE
+        },
+        "categories": categories,
+        "variation": variation,
+        "sensibilite": sensibilite
+    }
+
+def afficher(rapport, sortie=sys.stdout):
+    """Écrit le rapport de calibrage sous forme de tableaux lisibles"""
+    def ecrire(texte=""):
+        sortie.write(texte + "\n")
+    
+    def formater_quantiles(valeurs):
+        return "  ".join(f"{nom} {valeur:5.1f}%" for nom, valeur in valeurs.items())
+    
+    tirages = f"{rapport['tirages']:,}".replace(",", " ")
+    ecrire(f"{tirages} évaluations simulées, {rapport['echec_ko']:.1%} avec une exigence KO manquante")
+    ecrire(f"score            {formater_quantiles(rapport['quantiles'])}")
+    if rapport["quantiles_sans_ko"]:
+        ecrire(f"score sans KO    {formater_quantiles(rapport['quantiles_sans_ko'])}")
+    
+    ecrire("\nStatuts")
+    for code, proportion in rapport["statuts"].items():
+        ecrire(f"  {code:<24} {proportion:7.2%}")
+    
+    ecrire("\nÉvaluations sans KO manquant atteignant chaque seuil")
+    for seuil, proportion in rapport["courbe_sans_ko"].items():
+        ecrire(f"  ≥ {seuil:>3}%  {proportion:7.2%}  {'█' * round(proportion * 50)}")
+    
+    ecrire("\nCatégories")
+    for categorie, donnees in rapport["categories"].items():
+        bandes = "  ".join(f"≥{nom} {proportion:6.1%}" for nom, proportion in donnees["bandes"].items())
+        ecrire(f"  {categorie:<18} médiane {donnees['quantiles']['p50']:5.1f}%  {bandes}")
+    
+    ecrire(f"\nSensibilité : écart de proportion (points) quand une question pèse {rapport['variation']:+.0%}")
+    codes = list(rapport["statuts"])
+    ecrire(f"  {'question':<24}" + "".join(f"{code[:12]:>14}" for code in codes))
+    ordre = sorted(rapport["sensibilite"].items(), key=lambda s: -max(abs(v) for v in s[1].values()))
+    for question_id, ecarts in ordre:
+        ecrire(f"  {question_id:<24}" + "".join(f"{ecarts[code] * 100:+14.3f}" for code in codes))
+
+def lire_seuils(texte, noms):
+    """Seuils donnés en ligne de commande sous la forme 90,75,50 (dans l'ordre de `noms`)"""
+    valeurs = [float(valeur) for valeur in texte.split(",")]
+    if len(valeurs) != len(noms):
+        raise argparse.ArgumentTypeError(f"{len(noms)} valeurs attendues : {', '.join(noms)}")
+    return dict(zip(noms, valeurs))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.calibrage",
+        description="Calibre les seuils d'éligibilité par simulation de Monte-Carlo."
+    )
+    parser.add_argument("-n", "--tirages", type=int, default=1_000_000, help="nombre d'évaluations simulées")
+    parser.add_argument("--source", choices=["uniforme", "base"], default="uniforme",
+                        help="options équiprobables ou fréquences des évaluations enregistrées")
+    parser.add_argument("--ko-conformes", action="store_true",
+                        help="ne simuler que des évaluations sans exigence KO manquante")
+    parser.add_argument("--seuils", type=lambda t: lire_seuils(t, list(SEUILS_ELIGIBILITE)),
+                        help="seuils d'éligibilité à évaluer (défaut : %s)" % ",".join(
+                            str(v) for v in SEUILS_ELIGIBILITE.values()))
+    parser.add_argument("--bandes", type=lambda t: lire_seuils(t, list(SEUILS_CATEGORIES)),
+                        help="bandes de couleur des catégories (défaut : %s)" % ",".join(
+                            str(v) for v in SEUILS_CATEGORIES.values()))
+    parser.add_argument("--variation", type=float, default=0.1,
+                        help="augmentation des points d'une question pour la sensibilité (0.1 = +10 %%)")
+    parser.add_argument("--graine", type=int, default=0, help="graine du générateur aléatoire")
+    parser.add_argument("--json", help="fichier où écrire le rapport complet")
+    args = parser.parse_args(argv)
+    
+    debut = time.perf_counter()
+    tables = tables_points()
+    if args.source == "base":
+        from .stockage import iterer_evaluations
+        evaluations = (evaluation["reponses"] for evaluation in iterer_evaluations())
+        probabilites, nombre = probabilites_observees(evaluations, tables)
+        if nombre == 0:
+            print("Aucune évaluation enregistrée : tirage uniforme", file=sys.stderr)
+        else:
+            print(f"Fréquences des options lues sur {nombre} évaluation(s)", file=sys.stderr)
+    else:
+        probabilites = probabilites_uniformes(tables)
+    if args.ko_conformes:
+        probabilites = ko_conformes(probabilites, tables)
+    
+    simulation = simuler(probabilites, tables, args.tirages, args.graine, args.variation, args.seuils)
+    rapport = rapport_calibrage(simulation, tables, args.seuils, args.bandes, args.variation)
+    afficher(rapport)
+    print(f"\nDurée : {time.perf_counter() - debut:.1f} s", file=sys.stderr)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""Journal des changements de réponses, en ajout seul, et son rejeu
+
+Usage :
+    python -m ifs_eligibilite.evenements [--repertoire evenements] [--evaluation 42] [--session <id>] [--json]
+
+Chaque changement de réponse et chaque changement d'étape de l'assistant est
+un événement binaire de quelques dizaines d'octets : type, horodatage,
+session, puis question et indice de l'option (ou valeur libre), ou étape.
+Les événements sont ajoutés à un tampon en mémoire ; un thread les écrit par
+paquets dans des segments de taille bornée, jamais réécrits. Une exécution
+du script n'attend donc jamais le disque ; si l'écriture prend du retard au
+point de remplir le tampon, les nouveaux événements sont comptés puis perdus.
+
+Le rejeu parcourt les segments une seule fois, par blocs, en fusionnant ceux
+des différents processus dans l'ordre des horodatages : une évaluation reprise
+dans un autre processus est rejouée dans l'ordre de ses réponses. Il sert à
+reconstruire les réponses des évaluations demandées et l'entonnoir des
+étapes (parcours ayant atteint chaque étape, et arrêtés à chacune ; s'arrêter
+sur la page de résultats, c'est terminer). Un parcours va de l'ouverture
+d'une évaluation dans une session à la suivante.
+
+    IFS_EVENEMENTS                répertoire du journal (aucun événement n'est relevé sans lui)
+    IFS_EVENEMENTS_SEGMENT_MO     taille maximale d'un segment (défaut 64 Mo)
+"""
+
+import argparse
+import atexit
+import glob
+import hashlib
+import heapq
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+REPERTOIRE_EVENEMENTS = os.environ.get("IFS_EVENEMENTS")
+TAILLE_SEGMENT = int(float(os.environ.get("IFS_EVENEMENTS_SEGMENT_MO", "64")) * 1024 * 1024)
+
+# Écriture du tampon toutes les INTERVALLE_ECRITURE secondes, ou dès PAQUET événements en attente ;
+# au-delà de TAMPON_MAX événements en attente, les nouveaux sont perdus
+INTERVALLE_ECRITURE = 0.5
+PAQUET = 10_000
+TAMPON_MAX = 100_000
+
+# Types d'événements
+DEBUT = 1     # ouverture d'une évaluation : empreinte du questionnaire, identifiant si reprise
+REPONSE = 2   # changement de réponse : question, indice de l'option ou valeur libre
+ETAPE = 3     # changement d'étape : étape atteinte, identifiant de l'évaluation enregistrée
+
+# En-tête commun : type, horodatage, session, longueur du corps
+ENTETE = struct.Struct("<Bd16sH")
+CORPS_DEBUT = struct.Struct("<8sI")
+CORPS_ETAPE = struct.Struct("<HI")
+
+# Indice d'une réponse libre (texte, nombre), dont la valeur JSON suit
+VALEUR_LIBRE = 255
+
+EXTENSION = ".evt"
+
+# Taille des blocs lus dans un segment au rejeu
+TAILLE_LECTURE = 256 * 1024
+
+logger = logging.getLogger(__name__)
+
+def identifiant_session(session_id):
+    """Session sur 16 octets : l'UUID de Streamlit, ou une empreinte de l'identifiant"""
+    try:
+        return uuid.UUID(session_id).bytes
+    except ValueError:
+        return hashlib.blake2b(session_id.encode(), digest_size=16).digest()
+
+def encoder_debut(session, empreinte, evaluation_id=None, horodatage=None):
+    corps = CORPS_DEBUT.pack(bytes.fromhex(empreinte), evaluation_id or 0)
+    return ENTETE.pack(DEBUT, horodatage or time.time(), session, len(corps)) + corps
+
+def encoder_reponse(session, question_id, valeur, libre, horodatage=None):
+    question = question_id.encode()
+    if libre:
+        corps = bytes((len(question),)) + question + bytes((VALEUR_LIBRE,)) + json.dumps(valeur).encode()
+    else:
+        corps = bytes((len(question),)) + question + bytes((valeur,))
+    return ENTETE.pack(REPONSE, horodatage or time.time(), session, len(corps)) + corps
+
+def encoder_etape(session, etape, evaluation_id=None, horodatage=None):
+    corps = CORPS_ETAPE.pack(etape, evaluation_id or 0)
+    return ENTETE.pack(ETAPE, horodatage or time.time(), session, len(corps)) + corps
+
+class JournalEvenements:
+    """Tampon d'événements en mémoire, écrit par un thread dans des segments tournants"""
+    
+    def __init__(self, repertoire, taille_segment=TAILLE_SEGMENT, intervalle=INTERVALLE_ECRITURE):
+        self.repertoire = repertoire
+        self.taille_segment = taille_segment
+        self.intervalle = intervalle
+        self._tampon = []
+        self._verrou = threading.Lock()
+        self._ecriture = threading.Lock()
+        self._reveil = threading.Event()
+        self._fichier = None
+        self._numero = 0
+        # Segments propres au processus, ordonnés par date de démarrage puis
+        # par processus (identifiant sur 7 chiffres, pour un tri stable)
+        self._prefixe = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid():07d}"
+        self.ecrits = 0
+        self.perdus = 0
+        os.makedirs(repertoire, exist_ok=True)
+        threading.Thread(target=self._boucle, name="ifs-evenements", daemon=True).start()
+        atexit.register(self.vider)
+    
+    def ajouter(self, evenement):
+        """Ajoute un événement encodé au tampon, sans jamais attendre le disque"""
+        with self._verrou:
+            if len(self._tampon) >= TAMPON_MAX:
+                self.perdus += 1
+                return
+            self._tampon.append(evenement)
+            if len(self._tampon) == PAQUET:
+                self._reveil.set()
+    
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.intervalle)
+            self._reveil.clear()
+            try:
+                self.vider()
+            except OSError:
+                logger.exception("Écriture du journal d'événements impossible")
+    
+    def vider(self):
+        """Écrit les événements en attente à la suite du segment courant"""
+        with self._verrou:
+            tampon, self._tampon = self._tampon, []
+        if not tampon:
+            return
+        with self._ecriture:
+            if self._fichier is None or self._fichier.tell() >= self.taille_segment:
+                self._ouvrir_segment()
+            self._fichier.write(b"".join(tampon))
+            self._fichier.flush()
+            self.ecrits += len(tampon)
+    
+    def _ouvrir_segment(self):
+        if self._fichier is not None:
+            self._fichier.close()
+        self._numero += 1
+        chemin = os.path.join(self.repertoire, f"{self._prefixe}-{self._numero:04d}{EXTENSION}")
+        self._fichier = open(chemin, "ab")
+
+_journal = None
+_verrou_journal = threading.Lock()
+
+def journal():
+    """Journal du processus, ou None si IFS_EVENEMENTS n'est pas défini"""
+    global _journal
+    if REPERTOIRE_EVENEMENTS and _journal is None:
+        with _verrou_journal:
+            if _journal is None:
+                _journal = JournalEvenements(REPERTOIRE_EVENEMENTS)
+    return _journal
+
+def segments(repertoire):
+    """Segments du journal, par processus puis dans l'ordre d'écriture de chacun"""
+    return sorted(glob.glob(os.path.join(repertoire, f"*{EXTENSION}")))
+
+def _processus(chemin):
+    """Préfixe commun aux segments d'un même processus (date de démarrage, processus)"""
+    return os.path.basename(chemin).rsplit("-", 1)[0]
+
+def _decoder(type, horodatage, session, corps):
+    """Événement décodé (type, horodatage, session, donnees)"""
+    session = str(uuid.UUID(bytes=session))
+    if type == DEBUT:
+        empreinte, evaluation_id = CORPS_DEBUT.unpack(corps)
+        return type, horodatage, session, (empreinte.hex(), evaluation_id or None)
+    if type == REPONSE:
+        fin_question = 1 + corps[0]
+        question_id = corps[1:fin_question].decode()
+        indice = corps[fin_question]
+        if indice == VALEUR_LIBRE:
+            return type, horodatage, session, (question_id, json.loads(corps[fin_question + 1:]))
+        return type, horodatage, session, (question_id, indice)
+    if type == ETAPE:
+        etape, evaluation_id = CORPS_ETAPE.unpack(corps)
+        return type, horodatage, session, (etape, evaluation_id or None)
+    return None
+
+def lire_segment(chemin):
+    """Itère sur les événements décodés d'un segment, lu par blocs de TAILLE_LECTURE
+    
+    Un enregistrement tronqué en fin de segment (arrêt brutal) est ignoré.
+    """
+    with open(chemin, "rb") as f:
+        contenu = b""
+        while True:
+            bloc = f.read(TAILLE_LECTURE)
+            contenu += bloc
+            position = 0
+            while position + ENTETE.size <= len(contenu):
+                type, horodatage, session, longueur = ENTETE.unpack_from(contenu, position)
+                debut_corps = position + ENTETE.size
+                if debut_corps + longueur > len(contenu):
+                    break
+                corps = contenu[debut_corps:debut_corps + longueur]
+                position = debut_corps + longueur
+                evenement = _decoder(type, horodatage, session, corps)
+                if evenement is not None:
+                    yield evenement
+            contenu = contenu[position:]
+            if not bloc:
+                if contenu:
+                    logger.warning("Événement tronqué à la fin de %s", chemin)
+                return
+
+def lire_evenements(repertoire):
+    """Itère sur les événements décodés de tous les segments, dans l'ordre des horodatages
+    
+    Chaque événement est un tuple (type, horodatage, session, donnees). Les
+    segments d'un processus sont lus à la suite ; ceux des différents
+    processus sont fusionnés par horodatage, un bloc de chacun en mémoire.
+    """
+    par_processus = {}
+    for chemin in segments(repertoire):
+        par_processus.setdefault(_processus(chemin), []).append(chemin)
+    
+    def lire_processus(chemins):
+        for chemin in chemins:
+            yield from lire_segment(chemin)
+    
+    yield from heapq.merge(
+        *(lire_processus(chemins) for chemins in par_processus.values()),
+        key=lambda evenement: evenement[1]
+    )
+
+def rejouer(evenements, evaluations=None, sessions=None):
+    """Rejoue des événements en une passe : réponses reconstruites et entonnoir des étapes
+    
+    Les réponses sont reconstruites pour les évaluations d'identifiant dans
+    `evaluations` et les parcours des sessions de `sessions` ; toutes si les
+    deux sont None. Une évaluation reprise repart des réponses rejouées de
+    ses parcours précédents. Seules sont gardées en mémoire les réponses des
+    parcours retenus et de ceux dont l'évaluation n'est pas encore connue.
+    """
+    tout = evaluations is None and sessions is None
+    evaluations = set(evaluations or ())
+    sessions = set(sessions or ())
+    
+    def retenu(courant):
+        return tout or courant["session"] in sessions or courant["evaluation_id"] in evaluations
+    
+    # Parcours en cours de chaque session, et dernières réponses de chaque évaluation retenue
+    parcours = {}
+    reponses_evaluations = {}
+    etats = []
+    etapes_max = []
+    
+    for type, horodatage, session, donnees in evenements:
+        if type == DEBUT:
+            empreinte, evaluation_id = donnees
+            courant = parcours[session] = {
+                "session": session,
+                "debut": horodatage,
+                "empreinte": empreinte,
+                "evaluation_id": evaluation_id,
+                "reponses": dict(reponses_evaluations.get(evaluation_id, {})),
+                "numero": len(etapes_max)
+            }
+            etapes_max.append(1)
+        else:
+            courant = parcours.get(session)
+            if courant is None:
+                # Session ouverte avant le début du journal
+                continue
+            if type == REPONSE:
+                if courant["reponses"] is not None:
+                    question_id, valeur = donnees
+                    courant["reponses"][question_id] = valeur
+            elif type == ETAPE:
+                etape, evaluation_id = donnees
+                etapes_max[courant["numero"]] = max(etapes_max[courant["numero"]], etape)
+                if courant["evaluation_id"] is None:
+                    courant["evaluation_id"] = evaluation_id
+        
+        courant["fin"] = horodatage
+        if courant["reponses"] is None:
+            continue
+        if retenu(courant):
+            if "retenu" not in courant:
+                courant["retenu"] = True
+                etats.append(courant)
+            if courant["evaluation_id"] is not None:
+                reponses_evaluations[courant["evaluation_id"]] = courant["reponses"]
+        elif courant["evaluation_id"] is not None:
+            # Évaluation connue et non demandée : ses réponses ne serviront pas
+            courant["reponses"] = None
+    
+    for etat in etats:
+        del etat["retenu"], etat["numero"]
+    return {"parcours": etats, "entonnoir": entonnoir(etapes_max)}
+
+def entonnoir(etapes_max):
+    """Nombre de parcours ayant atteint chaque étape, et arrêtés à chaque étape"""
+    if not etapes_max:
+        return []
+    derniere = max(etapes_max)
+    arrets = [0] * (derniere + 1)
+    for etape in etapes_max:
+        arrets[etape] += 1
+    lignes = []
+    atteinte = len(etapes_max)
+    for etape in range(1, derniere + 1):
+        lignes.append({"etape": etape, "atteinte": atteinte, "arrets": arrets[etape]})
+        atteinte -= arrets[etape]
+    return lignes
+
+def developper(etat, definitions):
+    """Réponses d'un parcours avec leurs libellés, si sa version du questionnaire est connue"""
+    definition = definitions.get(etat["empreinte"])
+    if definition is None:
+        return etat["reponses"]
+    options = definition["compile"]["options"]
+    return {
+        question_id: options[question_id][valeur] if question_id in options else valeur
+        for question_id, valeur in etat["reponses"].items()
+    }
+
+def main(argv=None):
+    from .questionnaire import REPERTOIRE_QUESTIONNAIRES, charger_definition
+    
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.evenements",
+        description="Rejoue le journal des réponses : réponses des évaluations et entonnoir des étapes."
+    )
+    parser.add_argument("--repertoire", default=REPERTOIRE_EVENEMENTS or "evenements", help="répertoire du journal")
+    parser.add_argument("--evaluation", type=int, action="append", help="évaluation à reconstruire (répétable)")
+    parser.add_argument("--session", action="append", help="session dont reconstruire les parcours (répétable)")
+    parser.add_argument("--json", action="store_true", help="écrire le résultat en JSON")
+    args = parser.parse_args(argv)
+    
+    debut = time.perf_counter()
+    if args.evaluation or args.session:
+        resultat = rejouer(lire_evenements(args.repertoire), args.evaluation, args.session)
+    else:
+        # Sans filtre, seul l'entonnoir est calculé
+        resultat = rejouer(lire_evenements(args.repertoire), evaluations=(), sessions=())
+    
+    # Libellés des réponses, pour toutes les versions publiées du questionnaire
+    definitions = {}
+    for chemin in glob.glob(os.path.join(REPERTOIRE_QUESTIONNAIRES, "*.json")):
+        definition = charger_definition(chemin)
+        definitions[definition["empreinte"]] = definition
+    for etat in resultat["parcours"]:
+        etat["reponses"] = developper(etat, definitions)
+    
+    if args.json:
+        json.dump(resultat, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        for etat in resultat["parcours"]:
+            print(f"Session {etat['session']} · évaluation {etat['evaluation_id'] or '-'} · "
+                  f"{datetime.fromtimestamp(etat['debut']):%Y-%m-%d %H:%M:%S}")
+            for question_id, valeur in etat["reponses"].items():
+                print(f"  {question_id:<24} {valeur}")
+        # La dernière étape de l'assistant est la page de résultats : s'y arrêter, c'est terminer
+        print(f"{'étape':>6} {'atteinte':>10} {'arrêts':>10}")
+        for ligne in resultat["entonnoir"]:
+            print(f"{ligne['etape']:>6} {ligne['atteinte']:>10} {ligne['arrets']:>10}")
+    print(f"Rejeu : {time.perf_counter() - debut:.2f} s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
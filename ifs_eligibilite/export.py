@@ -0,0 +1,173 @@
+"""Export en masse des rapports d'évaluation dans une archive ZIP
+
+Usage :
+    python -m ifs_eligibilite.export -o rapports.zip --format json --format pdf
+
+Les évaluations sont lues par lots dans la base et chaque rapport est écrit
+dans l'archive dès qu'il est produit. Le répertoire central de l'archive est
+tenu dans un fichier temporaire plutôt qu'en mémoire : la mémoire utilisée
+ne dépend pas du nombre d'évaluations exportées. La sortie peut être un flux
+non adressable (sortie standard, réponse HTTP).
+"""
+
+import argparse
+import struct
+import sys
+import tempfile
+import zlib
+from datetime import datetime
+
+from .questionnaire import questionnaire_actif, questionnaire_par_empreinte
+from .moteur import determiner_eligibilite, construire_rapport
+from .rapports import FORMATS, formater_rapport, nom_fichier
+from . import stockage
+
+def rapport_evaluation(evaluation):
+    """Reconstruit le rapport JSON d'une évaluation terminée enregistrée"""
+    resultats = {
+        "pourcentage": evaluation["pourcentage"],
+        "categories": evaluation["categories"],
+        "ko_manquants": evaluation["ko_manquants"]
+    }
+    date = datetime.fromisoformat(evaluation["date_evaluation"])
+    # Titres de la version du questionnaire qui a noté l'évaluation, si elle est chargée
+    definition = questionnaire_par_empreinte(evaluation.get("empreinte_questionnaire")) or questionnaire_actif()
+    return construire_rapport(
+        resultats, determiner_eligibilite(resultats), evaluation["reponses"], date, definition["compile"]
+    )
+
+# Au-delà de ces limites, l'archive utilise les enregistrements ZIP64
+MAX_ENTREES_ZIP = 0xFFFF
+MAX_OCTETS_ZIP = 0xFFFFFFFF
+
+class ArchiveZipFlux:
+    """Archive ZIP écrite en flux, entrée par entrée, sur une sortie non adressable
+    
+    Chaque entrée est compressée puis écrite immédiatement, suivie d'un
+    descripteur de données ; seuls les enregistrements du répertoire central
+    sont conservés, dans un fichier temporaire, jusqu'à la fermeture.
+    """
+    
+    def __init__(self, sortie, niveau=6):
+        self.sortie = sortie
+        self.niveau = niveau
+        self.position = 0
+        self.nombre = 0
+        self.repertoire = tempfile.TemporaryFile()
+        maintenant = datetime.now()
+        self.heure = (maintenant.hour << 11) | (maintenant.minute << 5) | (maintenant.second // 2)
+        self.date = ((maintenant.year - 1980) << 9) | (maintenant.month << 5) | maintenant.day
+    
+    def _ecrire(self, donnees):
+        self.sortie.write(donnees)
+        self.position += len(donnees)
+    
+    def ajouter(self, nom, contenu):
+        """Ajoute une entrée compressée à l'archive"""
+        nom = nom.encode("utf-8")
+        debut = self.position
+        # Bit 3 : tailles et CRC dans le descripteur qui suit les données ; bit 11 : nom en UTF-8
+        drapeaux = 0x0808
+        
+        compresseur = zlib.compressobj(self.niveau, zlib.DEFLATED, -15)
+        donnees = compresseur.compress(contenu) + compresseur.flush()
+        crc = zlib.crc32(contenu)
+        
+        self._ecrire(struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45, drapeaux, 8, self.heure, self.date,
+            0, 0, 0, len(nom), 0
+        ) + nom)
+        self._ecrire(donnees)
+        self._ecrire(struct.pack("<IIII", 0x08074B50, crc, len(donnees), len(contenu)))
+        
+        extra = b""
+        if debut >= MAX_OCTETS_ZIP:
+            extra = struct.pack("<HHQ", 1, 8, debut)
+            debut = MAX_OCTETS_ZIP
+        self.repertoire.write(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 45, 45, drapeaux, 8, self.heure, self.date,
+            crc, len(donnees), len(contenu), len(nom), len(extra), 0, 0, 0, 0, debut
+        ) + nom + extra)
+        self.nombre += 1
+    
+    def fermer(self):
+        """Écrit le répertoire central et la fin d'archive"""
+        debut_repertoire = self.position
+        self.repertoire.seek(0)
+        while bloc := self.repertoire.read(1024 * 1024):
+            self._ecrire(bloc)
+        self.repertoire.close()
+        taille = self.position - debut_repertoire
+        
+        if self.nombre >= MAX_ENTREES_ZIP or debut_repertoire >= MAX_OCTETS_ZIP or taille >= MAX_OCTETS_ZIP:
+            debut_zip64 = self.position
+            self._ecrire(struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0,
+                self.nombre, self.nombre, taille, debut_repertoire
+            ))
+            self._ecrire(struct.pack("<IIQI", 0x07064B50, 0, debut_zip64, 1))
+            self._ecrire(struct.pack(
+                "<IHHHHIIH", 0x06054B50, 0, 0, MAX_ENTREES_ZIP, MAX_ENTREES_ZIP,
+                MAX_OCTETS_ZIP, MAX_OCTETS_ZIP, 0
+            ))
+        else:
+            self._ecrire(struct.pack(
+                "<IHHHHIIH", 0x06054B50, 0, 0, self.nombre, self.nombre,
+                taille, debut_repertoire, 0
+            ))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.fermer()
+        else:
+            self.repertoire.close()
+
+def exporter_zip(evaluations, sortie, formats=("json",)):
+    """Écrit au fil de l'eau les rapports des évaluations dans une archive ZIP
+    
+    Retourne le nombre d'évaluations exportées.
+    """
+    nombre = 0
+    with ArchiveZipFlux(sortie) as archive:
+        for evaluation in evaluations:
+            rapport = rapport_evaluation(evaluation)
+            for format in formats:
+                contenu = formater_rapport(rapport, format)
+                # L'identifiant évite les collisions entre homonymes du même jour
+                nom = f"{evaluation['id']}_{nom_fichier(rapport, format)}"
+                archive.ajouter(nom, contenu if isinstance(contenu, bytes) else contenu.encode("utf-8"))
+            nombre += 1
+    return nombre
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.export",
+        description="Exporte les rapports des évaluations enregistrées dans une archive ZIP."
+    )
+    parser.add_argument("-o", "--sortie", default="-", help="archive ZIP (défaut : sortie standard)")
+    parser.add_argument("-f", "--format", action="append", choices=sorted(FORMATS),
+                        help="format des rapports, répétable (défaut : json)")
+    parser.add_argument("--statut", help="n'exporter que les évaluations de ce statut")
+    parser.add_argument("--depuis", type=datetime.fromisoformat, help="date de début (AAAA-MM-JJ)")
+    parser.add_argument("--jusqu-a", type=datetime.fromisoformat, help="date de fin exclue (AAAA-MM-JJ)")
+    parser.add_argument("--base", help="chemin de la base (défaut : IFS_BASE ou evaluations.db)")
+    args = parser.parse_args(argv)
+    
+    evaluations = stockage.iterer_evaluations(
+        statut=args.statut, depuis=args.depuis, jusqu_a=args.jusqu_a, chemin=args.base
+    )
+    sortie = sys.stdout.buffer if args.sortie == "-" else open(args.sortie, "wb")
+    try:
+        nombre = exporter_zip(evaluations, sortie, args.format or ["json"])
+    finally:
+        if sortie is not sys.stdout.buffer:
+            sortie.close()
+    
+    print(f"{nombre} évaluation(s) exportée(s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Évaluations multi-sites d'un groupe et leur consolidation
+
+Un groupe (l'entreprise mère) rassemble une évaluation par site. Les sites
+sont évalués par calculer_score et determiner_eligibilite, puis consolidés :
+exigences KO manquantes sur l'ensemble des sites (avec la pire réponse
+donnée), score minimal, moyen et maximal de chaque catégorie, et classement
+des sites.
+
+Les grands groupes sont répartis par lots sur un pool de processus ; en deçà
+de SEUIL_PARALLELE sites, le démarrage du pool coûterait plus que le calcul.
+"""
+
+import statistics
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from .questionnaire import questionnaire_actif
+from .moteur import ORDRE_STATUTS, calculer_score, determiner_eligibilite
+from .lot import decouper
+
+# Nombre de sites à partir duquel l'évaluation est répartie sur plusieurs processus
+SEUIL_PARALLELE = 5000
+
+def _evaluer_lot(sites, questionnaire):
+    """Évalue un lot de sites ; une réponse invalide est signalée avec le nom du site"""
+    evalues = []
+    for site in sites:
+        try:
+            resultats = calculer_score(site["reponses"], questionnaire)
+        except ValueError as e:
+            raise ValueError(f"{site['site']} : {e}") from None
+        except TypeError:
+            # Valeur JSON non scalaire (liste, objet) pour une réponse
+            raise ValueError(f"{site['site']} : réponse invalide, valeur simple attendue") from None
+        evalues.append({**site, "resultats": resultats, "eligibilite": determiner_eligibilite(resultats)})
+    return evalues
+
+def evaluer_sites(sites, processus=1, taille_lot=500, questionnaire=None):
+    """Évalue chaque site d'un groupe
+    
+    `sites` est une liste de dictionnaires {"site": nom, "reponses": {...}}.
+    Retourne ces dictionnaires complétés des résultats et de l'éligibilité,
+    dans le même ordre.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    if processus <= 1 or len(sites) < SEUIL_PARALLELE:
+        return _evaluer_lot(sites, questionnaire)
+    
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        lots = pool.map(_evaluer_lot, decouper(sites, taille_lot), repeat(questionnaire))
+        return [site for lot in lots for site in lot]
+
+def consolider(sites, questionnaire=None):
+    """Vue consolidée d'un groupe à partir de ses sites évalués
+    
+    Le statut du groupe est celui de son site le moins bon. Les exigences KO
+    sont classées par nombre de sites concernés ; le classement des sites va
+    du meilleur statut au moins bon, puis du score le plus haut au plus bas.
+    """
+    if not sites:
+        raise ValueError("Groupe sans site")
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    ko_par_reference = {
+        questionnaire["index"][question_id]["reference"]: questionnaire["index"][question_id]
+        for question_id in questionnaire["ko"]
+    }
+    
+    ko = {}
+    for site in sites:
+        for manquant in site["resultats"]["ko_manquants"]:
+            entree = ko.setdefault(manquant["reference"], {
+                "reference": manquant["reference"],
+                "question": manquant["question"],
+                "sites": [],
+                "pire_reponse": manquant["reponse"]
+            })
+            entree["sites"].append(site["site"])
+            points = ko_par_reference[manquant["reference"]]["points"]
+            if points[manquant["reponse"]] < points[entree["pire_reponse"]]:
+                entree["pire_reponse"] = manquant["reponse"]
+    
+    categories = {}
+    for categorie, data in questionnaire["categories"].items():
+        pourcentages = [(site["resultats"]["categories"][categorie]["pourcentage"], site["site"]) for site in sites]
+        minimum = min(pourcentages, key=lambda p: p[0])
+        maximum = max(pourcentages, key=lambda p: p[0])
+        categories[categorie] = {
+            "titre": data["titre"],
+            "min": minimum[0],
+            "site_min": minimum[1],
+            "moyenne": statistics.fmean(p for p, _ in pourcentages),
+            "max": maximum[0],
+            "site_max": maximum[1]
+        }
+    
+    classes = sorted(
+        sites,
+        key=lambda site: (-ORDRE_STATUTS.index(site["eligibilite"]["statut"]), -site["resultats"]["pourcentage"])
+    )
+    classement = [
+        {
+            "rang": rang,
+            "site": site["site"],
+            "statut": site["eligibilite"]["statut"],
+            "pourcentage": site["resultats"]["pourcentage"],
+            "score": site["resultats"]["score"],
+            "ko_manquants": len(site["resultats"]["ko_manquants"]),
+            **{categorie: data["pourcentage"] for categorie, data in site["resultats"]["categories"].items()}
+        }
+        for rang, site in enumerate(classes, 1)
+    ]
+    
+    return {
+        "sites": len(sites),
+        "statut": classement[-1]["statut"],
+        "statuts": dict(Counter(site["eligibilite"]["statut"] for site in sites)),
+        "pourcentage_moyen": statistics.fmean(site["resultats"]["pourcentage"] for site in sites),
+        "ko": sorted(ko.values(), key=lambda entree: (-len(entree["sites"]), entree["reference"])),
+        "categories": categories,
+        "classement": classement
+    }
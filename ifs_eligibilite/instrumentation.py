@@ -0,0 +1,327 @@
+"""Instrumentation des exécutions du script Streamlit, activée par variables d'environnement
+
+Pour chaque exécution (script complet ou fragment) sont relevés la durée de
+chaque phase, l'étape de l'assistant et la taille de l'état de session,
+sérialisée et en mémoire. Rien n'est mesuré si aucune des variables
+suivantes n'est définie :
+
+    IFS_METRIQUES_PORT          expose /metrics au format texte Prometheus
+    IFS_METRIQUES_HOTE          adresse d'écoute de /metrics (défaut 127.0.0.1)
+    IFS_METRIQUES_JOURNAL       une ligne JSON par exécution dans un journal tournant
+    IFS_PROFILEUR_SEUIL_MS      profil par échantillonnage des exécutions plus lentes
+    IFS_PROFILEUR_INTERVALLE_MS période d'échantillonnage (défaut 5 ms)
+    IFS_PROFILEUR_REPERTOIRE    répertoire des profils (défaut : temporaire)
+
+Les profils sont écrits au format « pile repliée » (une pile par ligne suivie
+du nombre d'échantillons), lisible par flamegraph.pl ou speedscope.
+"""
+
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+from .questionnaire import questionnaire_actif
+from .sessions import memoire_objet
+from .cache import statistiques_caches
+
+PORT_METRIQUES = os.environ.get("IFS_METRIQUES_PORT")
+# Les métriques ne sont exposées qu'en local, sauf adresse d'écoute explicite
+HOTE_METRIQUES = os.environ.get("IFS_METRIQUES_HOTE", "127.0.0.1")
+JOURNAL_METRIQUES = os.environ.get("IFS_METRIQUES_JOURNAL")
+SEUIL_PROFILEUR_MS = os.environ.get("IFS_PROFILEUR_SEUIL_MS")
+INTERVALLE_PROFILEUR = float(os.environ.get("IFS_PROFILEUR_INTERVALLE_MS", "5")) / 1000
+REPERTOIRE_PROFILS = os.environ.get("IFS_PROFILEUR_REPERTOIRE") or os.path.join(tempfile.gettempdir(), "ifs-profils")
+
+ACTIVE = bool(PORT_METRIQUES or JOURNAL_METRIQUES or SEUIL_PROFILEUR_MS)
+
+# Bornes des histogrammes Prometheus
+BORNES_DUREE = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+BORNES_SESSION = [1024, 4096, 16384, 65536, 262144, 1048576]
+
+logger = logging.getLogger(__name__)
+
+class Histogramme:
+    """Histogramme cumulatif au sens de Prometheus"""
+    
+    def __init__(self, bornes):
+        self.bornes = bornes
+        self.comptes = [0] * len(bornes)
+        self.somme = 0.0
+        self.nombre = 0
+    
+    def observer(self, valeur):
+        for i, borne in enumerate(self.bornes):
+            if valeur <= borne:
+                self.comptes[i] += 1
+        self.somme += valeur
+        self.nombre += 1
+    
+    def lignes(self, nom, etiquettes=""):
+        separateur = "," if etiquettes else ""
+        for borne, compte in zip(self.bornes, self.comptes):
+            yield f'{nom}_bucket{{{etiquettes}{separateur}le="{borne}"}} {compte}'
+        yield f'{nom}_bucket{{{etiquettes}{separateur}le="+Inf"}} {self.nombre}'
+        suffixe = f"{{{etiquettes}}}" if etiquettes else ""
+        yield f"{nom}_sum{suffixe} {self.somme}"
+        yield f"{nom}_count{suffixe} {self.nombre}"
+
+class Metriques:
+    """Agrégats de toutes les exécutions du processus"""
+    
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.executions = Counter()
+        self.phases = defaultdict(lambda: Histogramme(BORNES_DUREE))
+        self.session = Histogramme(BORNES_SESSION)
+        self.memoire = Histogramme(BORNES_SESSION)
+        self.profils = 0
+        self.jauges = []
+    
+    def ajouter_jauges(self, fonction):
+        """Ajoute des jauges calculées à chaque lecture : `fonction` retourne {nom: valeur}"""
+        with self._verrou:
+            self.jauges.append(fonction)
+    
+    def enregistrer(self, mesure):
+        with self._verrou:
+            self.executions[(mesure.type, mesure.etape)] += 1
+            self.phases[(mesure.type, "total")].observer(mesure.duree)
+            for phase, duree in mesure.phases.items():
+                self.phases[(mesure.type, phase)].observer(duree)
+            if mesure.taille_session is not None:
+                self.session.observer(mesure.taille_session)
+                self.memoire.observer(mesure.memoire_session)
+            if mesure.profil:
+                self.profils += 1
+    
+    def prometheus(self):
+        """Métriques au format d'exposition texte de Prometheus"""
+        with self._verrou:
+            lignes = [
+                "# HELP ifs_executions_total Exécutions du script par type et étape",
+                "# TYPE ifs_executions_total counter",
+            ]
+            for (type_execution, etape), nombre in sorted(self.executions.items(), key=str):
+                lignes.append(f'ifs_executions_total{{type="{type_execution}",etape="{etape}"}} {nombre}')
+            
+            lignes += [
+                "# HELP ifs_phase_duree_secondes Durée des phases d'une exécution",
+                "# TYPE ifs_phase_duree_secondes histogram",
+            ]
+            for (type_execution, phase), histogramme in sorted(self.phases.items()):
+                lignes += histogramme.lignes(
+                    "ifs_phase_duree_secondes", f'type="{type_execution}",phase="{phase}"'
+                )
+            
+            lignes += [
+                "# HELP ifs_session_octets Taille sérialisée de l'état de session",
+                "# TYPE ifs_session_octets histogram",
+                *self.session.lignes("ifs_session_octets"),
+                "# HELP ifs_session_memoire_octets Mémoire occupée par l'état de session",
+                "# TYPE ifs_session_memoire_octets histogram",
+                *self.memoire.lignes("ifs_session_memoire_octets"),
+                "# HELP ifs_profils_total Exécutions lentes profilées",
+                "# TYPE ifs_profils_total counter",
+                f"ifs_profils_total {self.profils}",
+            ]
+            jauges = list(self.jauges)
+        
+        for fonction in jauges:
+            for nom, valeur in fonction().items():
+                lignes += [f"# TYPE {nom} gauge", f"{nom} {valeur}"]
+        return "\n".join(lignes) + "\n"
+
+METRIQUES = Metriques()
+
+def _jauges_caches():
+    """Compteurs des caches de scores et de rapports"""
+    return {
+        f"ifs_cache_{cache}_{nom}": valeur
+        for cache, statistiques in statistiques_caches().items()
+        for nom, valeur in statistiques.items()
+    }
+
+METRIQUES.ajouter_jauges(_jauges_caches)
+
+class Mesure:
+    """Mesure d'une exécution : durées cumulées par phase et contexte"""
+    
+    def __init__(self, type_execution):
+        self.type = type_execution
+        self.debut = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.echantillons = Counter()
+        self.etape = None
+        self.duree = None
+        self.taille_session = None
+        self.memoire_session = None
+        self.profil = None
+    
+    @contextmanager
+    def phase(self, nom):
+        """Chronomètre un bloc ; une phase répétée cumule ses durées"""
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[nom] += time.perf_counter() - debut
+    
+    def terminer(self, etape, etat_session=None):
+        """Clôt la mesure et la publie"""
+        self.duree = time.perf_counter() - self.debut
+        self.etape = etape
+        if etat_session is not None:
+            self.taille_session = taille_serialisee(etat_session)
+            self.memoire_session = memoire_objet(dict(etat_session.items()), questionnaire_actif()["compile"])
+        _mesures_en_cours.pop(threading.get_ident(), None)
+        
+        if SEUIL_PROFILEUR_MS and self.duree * 1000 >= float(SEUIL_PROFILEUR_MS) and self.echantillons:
+            self.profil = ecrire_profil(self)
+        METRIQUES.enregistrer(self)
+        if JOURNAL_METRIQUES:
+            _journal().info(json.dumps({
+                "date": datetime.now().isoformat(timespec="milliseconds"),
+                "type": self.type,
+                "etape": self.etape,
+                "duree_ms": round(self.duree * 1000, 3),
+                "phases_ms": {nom: round(duree * 1000, 3) for nom, duree in self.phases.items()},
+                "session_octets": self.taille_session,
+                "session_memoire_octets": self.memoire_session,
+                "profil": self.profil,
+            }, ensure_ascii=False))
+
+class MesureInactive:
+    """Mesure sans effet, utilisée quand l'instrumentation est désactivée"""
+    
+    def phase(self, nom):
+        return nullcontext()
+    
+    def terminer(self, etape, etat_session=None):
+        pass
+
+MESURE_INACTIVE = MesureInactive()
+
+# Mesure en cours par fil d'exécution du script (un fil par session Streamlit)
+_mesures_en_cours = {}
+_verrou_demarrage = threading.Lock()
+_services_demarres = False
+
+def demarrer_mesure(type_execution="script"):
+    """Ouvre la mesure de l'exécution en cours dans ce fil"""
+    if not ACTIVE:
+        return MESURE_INACTIVE
+    _demarrer_services()
+    # Une exécution interrompue par une exception laisse sa mesure ouverte :
+    # on oublie celles des fils terminés
+    fils_vivants = {fil.ident for fil in threading.enumerate()}
+    for fil in list(_mesures_en_cours):
+        if fil not in fils_vivants:
+            _mesures_en_cours.pop(fil, None)
+    mesure = Mesure(type_execution)
+    _mesures_en_cours[threading.get_ident()] = mesure
+    return mesure
+
+def mesure_courante():
+    """Mesure ouverte dans ce fil, ou None (réexécution d'un fragment seul)"""
+    return _mesures_en_cours.get(threading.get_ident())
+
+def phase(nom):
+    """Chronomètre un bloc dans la mesure en cours, sans effet s'il n'y en a pas"""
+    mesure = mesure_courante()
+    return mesure.phase(nom) if mesure else nullcontext()
+
+def taille_serialisee(etat):
+    """Taille en octets de l'état sérialisé ; les valeurs non sérialisables sont ignorées"""
+    taille = 0
+    for cle, valeur in etat.items():
+        try:
+            taille += len(pickle.dumps((cle, valeur), protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            continue
+    return taille
+
+def _demarrer_services():
+    """Serveur /metrics et échantillonneur, lancés une fois par processus"""
+    global _services_demarres
+    with _verrou_demarrage:
+        if _services_demarres:
+            return
+        _services_demarres = True
+    
+    if PORT_METRIQUES:
+        serveur = ThreadingHTTPServer((HOTE_METRIQUES, int(PORT_METRIQUES)), GestionnaireMetriques)
+        threading.Thread(target=serveur.serve_forever, name="ifs-metriques", daemon=True).start()
+        logger.info("Métriques exposées sur le port %s", PORT_METRIQUES)
+    if SEUIL_PROFILEUR_MS:
+        threading.Thread(target=_echantillonner, name="ifs-profileur", daemon=True).start()
+
+class GestionnaireMetriques(BaseHTTPRequestHandler):
+    """Point d'accès /metrics pour Prometheus"""
+    
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corps = METRIQUES.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+    
+    def log_message(self, format, *args):
+        pass
+
+def _echantillonner():
+    """Relève périodiquement la pile de chaque fil ayant une mesure en cours"""
+    while True:
+        time.sleep(INTERVALLE_PROFILEUR)
+        piles = sys._current_frames()
+        for fil, mesure in list(_mesures_en_cours.items()):
+            cadre = piles.get(fil)
+            if cadre is None:
+                continue
+            pile = []
+            while cadre is not None:
+                code = cadre.f_code
+                pile.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{cadre.f_lineno})")
+                cadre = cadre.f_back
+            mesure.echantillons[";".join(reversed(pile))] += 1
+
+def ecrire_profil(mesure):
+    """Écrit les piles échantillonnées d'une exécution lente ; retourne le chemin du fichier"""
+    os.makedirs(REPERTOIRE_PROFILS, exist_ok=True)
+    nom = f"profil-{datetime.now():%Y%m%d-%H%M%S-%f}-{mesure.type}-etape{mesure.etape}.txt"
+    chemin = os.path.join(REPERTOIRE_PROFILS, nom)
+    with open(chemin, "w", encoding="utf-8") as f:
+        for pile, nombre in mesure.echantillons.most_common():
+            f.write(f"{pile} {nombre}\n")
+    logger.warning("Exécution lente (%.0f ms, étape %s) : profil écrit dans %s",
+                   mesure.duree * 1000, mesure.etape, chemin)
+    return chemin
+
+_journal_metriques = None
+
+def _journal():
+    """Journal tournant des mesures : 10 Mo par fichier, 5 fichiers conservés"""
+    global _journal_metriques
+    if _journal_metriques is None:
+        journal = logging.getLogger("ifs_eligibilite.metriques")
+        if not journal.handlers:
+            handler = RotatingFileHandler(JOURNAL_METRIQUES, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            journal.addHandler(handler)
+            journal.setLevel(logging.INFO)
+            journal.propagate = False
+        _journal_metriques = journal
+    return _journal_metriques
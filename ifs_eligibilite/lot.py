@@ -0,0 +1,177 @@
+"""Évaluation en lot, sans interface, de fichiers CSV ou JSONL
+
+Usage :
+    python -m ifs_eligibilite.lot evaluations.csv -o rapports.jsonl --processus 8
+
+Chaque ligne d'entrée porte une colonne par `id` de question. Les lignes sont
+lues en flux, regroupées en lots de taille bornée et réparties sur un pool de
+processus ; au plus `2 × processus` lots sont en vol à tout instant, la mémoire
+reste donc constante quelle que soit la taille du fichier. Les rapports sont
+écrits dans l'ordre d'entrée, un objet JSON par ligne.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from .questionnaire import questionnaire_actif
+from .cache import rapport_jsonl_en_cache, statistiques_caches
+
+class LigneInvalide(ValueError):
+    """Ligne d'entrée illisible, rendue à sa place dans le flux des évaluations"""
+
+def _lire_jsonl(flux):
+    """Objets JSON d'un flux JSONL avec leur numéro de ligne ; une ligne illisible donne une LigneInvalide"""
+    for numero, ligne in enumerate(flux, 1):
+        if not ligne.strip():
+            continue
+        try:
+            objet = json.loads(ligne)
+        except ValueError as e:
+            yield numero, LigneInvalide(f"JSON invalide ({e.msg})")
+            continue
+        yield numero, objet if isinstance(objet, dict) else LigneInvalide("objet JSON attendu")
+
+def _lire_csv(flux):
+    """Lignes d'un flux CSV avec leur numéro dans le fichier, l'en-tête étant la ligne 1"""
+    lecteur = csv.DictReader(flux)
+    for ligne in lecteur:
+        yield lecteur.line_num, ligne
+
+def lire_evaluations(flux, format, colonnes=()):
+    """Itère sur les réponses d'un flux CSV ou JSONL, une évaluation à la fois
+    
+    Chaque évaluation est rendue avec le numéro de sa ligne dans le fichier
+    (lignes vides et en-tête CSV compris), sous la forme (numero, reponses).
+    Seules les colonnes des questions sont gardées, ainsi que `colonnes`. Une
+    ligne JSONL illisible est rendue sous forme de LigneInvalide, à sa place,
+    pour être signalée avec son numéro sans interrompre la lecture.
+    """
+    # Identifiants de questions reconnus dans les colonnes d'entrée
+    ids_questions = frozenset(
+        q["id"] for data in questionnaire_actif()["questions"].values() for q in data["questions"]
+    ).union(colonnes)
+    lignes = _lire_csv(flux) if format == "csv" else _lire_jsonl(flux)
+    
+    for numero, ligne in lignes:
+        if isinstance(ligne, LigneInvalide):
+            yield numero, ligne
+            continue
+        # Les cellules vides correspondent à des questions sans réponse
+        yield numero, {
+            cle: valeur for cle, valeur in ligne.items()
+            if cle in ids_questions and valeur not in (None, "")
+        }
+
+def decouper(iterable, taille):
+    """Regroupe un itérable en listes d'au plus `taille` éléments"""
+    iterateur = iter(iterable)
+    while True:
+        lot = list(islice(iterateur, taille))
+        if not lot:
+            return
+        yield lot
+
+def evaluer_lot(lot, date):
+    """Évalue un lot de couples (numero, reponses) et retourne les lignes JSONL et les erreurs"""
+    lignes = []
+    erreurs = []
+    for numero, reponses in lot:
+        if isinstance(reponses, LigneInvalide):
+            erreurs.append(f"ligne {numero}: {reponses}")
+            continue
+        # Les combinaisons de réponses notées déjà vues ne sont ni recalculées ni resérialisées
+        try:
+            lignes.append(rapport_jsonl_en_cache(reponses, date))
+        except ValueError as e:
+            erreurs.append(f"ligne {numero}: {e}")
+        except TypeError:
+            # Valeur JSON non scalaire (liste, objet) pour une réponse
+            erreurs.append(f"ligne {numero}: réponse invalide, valeur simple attendue")
+    return lignes, erreurs
+
+def evaluer_flux(evaluations, sortie, erreurs=None, processus=1, taille_lot=500, date=None):
+    """Évalue un flux de réponses et écrit les rapports JSONL dans `sortie`
+    
+    `evaluations` est un itérable de couples (numero, reponses), tel que rendu
+    par lire_evaluations. Les lignes invalides sont signalées au fil de l'eau dans `erreurs` (sortie
+    d'erreur par défaut). Retourne le nombre de rapports et d'erreurs.
+    """
+    erreurs = erreurs or sys.stderr
+    date = date or datetime.now()
+    lots = decouper(evaluations, taille_lot)
+    nb_rapports = 0
+    nb_erreurs = 0
+    
+    def ecrire(resultat):
+        nonlocal nb_rapports, nb_erreurs
+        lignes, erreurs_lot = resultat
+        for ligne in lignes:
+            sortie.write(ligne + "\n")
+        for erreur in erreurs_lot:
+            erreurs.write(erreur + "\n")
+        nb_rapports += len(lignes)
+        nb_erreurs += len(erreurs_lot)
+    
+    if processus <= 1:
+        for lot in lots:
+            ecrire(evaluer_lot(lot, date))
+        return nb_rapports, nb_erreurs
+    
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        en_vol = deque()
+        for lot in lots:
+            en_vol.append(pool.submit(evaluer_lot, lot, date))
+            # Pression arrière : on attend le plus ancien lot avant d'en lire d'autres
+            if len(en_vol) >= 2 * processus:
+                ecrire(en_vol.popleft().result())
+        while en_vol:
+            ecrire(en_vol.popleft().result())
+    
+    return nb_rapports, nb_erreurs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.lot",
+        description="Évalue en lot l'éligibilité IFS Food v8 à partir d'un fichier CSV ou JSONL."
+    )
+    parser.add_argument("entree", help="fichier CSV ou JSONL d'évaluations (- pour l'entrée standard)")
+    parser.add_argument("-o", "--sortie", default="-", help="fichier JSONL des rapports (défaut : sortie standard)")
+    parser.add_argument("-f", "--format", choices=["csv", "jsonl"], help="format d'entrée (déduit de l'extension par défaut)")
+    parser.add_argument("-p", "--processus", type=int, default=os.cpu_count() or 1, help="nombre de processus de calcul")
+    parser.add_argument("-n", "--taille-lot", type=int, default=500, help="nombre d'évaluations par lot")
+    args = parser.parse_args(argv)
+    
+    format = args.format
+    if format is None:
+        if args.entree == "-":
+            parser.error("--format est obligatoire avec l'entrée standard")
+        format = "csv" if args.entree.lower().endswith(".csv") else "jsonl"
+    
+    entree = sys.stdin if args.entree == "-" else open(args.entree, newline="", encoding="utf-8")
+    sortie = sys.stdout if args.sortie == "-" else open(args.sortie, "w", encoding="utf-8")
+    try:
+        nb_rapports, nb_erreurs = evaluer_flux(
+            lire_evaluations(entree, format), sortie,
+            processus=args.processus, taille_lot=args.taille_lot
+        )
+    finally:
+        if entree is not sys.stdin:
+            entree.close()
+        if sortie is not sys.stdout:
+            sortie.close()
+    
+    print(f"{nb_rapports} rapport(s) écrit(s), {nb_erreurs} erreur(s)", file=sys.stderr)
+    if args.processus <= 1:
+        scores = statistiques_caches()["scores"]
+        print(f"cache des scores : {scores['taux_succes']:.0%} de succès sur {scores['succes'] + scores['echecs']} évaluation(s)", file=sys.stderr)
+    return 1 if nb_erreurs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
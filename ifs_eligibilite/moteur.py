@@ -0,0 +1,355 @@
+"""Moteur de calcul du score et de l'éligibilité IFS Food v8"""
+
+import json
+from collections.abc import MutableMapping
+from datetime import datetime
+
+from .questionnaire import questionnaire_actif
+
+# Seuils d'éligibilité (pourcentage du score total)
+SEUILS_ELIGIBILITE = {
+    "ELIGIBLE": 90,
+    "ELIGIBLE_RESERVE": 75,
+    "AMELIORATIONS_REQUISES": 50
+}
+
+# Statuts du moins bon au meilleur
+ORDRE_STATUTS = ["NON_ELIGIBLE", *sorted(SEUILS_ELIGIBILITE, key=SEUILS_ELIGIBILITE.get)]
+
+# Bandes de couleur des scores par catégorie sur la page de résultats (pourcentage)
+SEUILS_CATEGORIES = {
+    "BON": 80,
+    "MOYEN": 50
+}
+
+def calculer_score(reponses, questionnaire=None):
+    """Calcule le score total et par catégorie"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    score_total = 0
+    scores_categories = {}
+    ko_manquants = []
+    
+    for categorie, data in questionnaire["categories"].items():
+        score_cat = 0
+        
+        for q in data["questions"]:
+            if q["id"] in reponses:
+                reponse = reponses[q["id"]]
+                if reponse not in q["points"]:
+                    raise ValueError(f"Réponse inconnue pour {q['id']}: {reponse!r}")
+                points = q["points"][reponse]
+                score_cat += points
+                
+                # Vérifier les KO
+                if q["ko"] and points < 100:
+                    ko_manquants.append({
+                        "question": q["question"],
+                        "reference": q["reference"],
+                        "reponse": reponse
+                    })
+        
+        scores_categories[categorie] = {
+            "score": score_cat,
+            "max": data["max"],
+            "pourcentage": (score_cat / data["max"]) * 100
+        }
+        score_total += score_cat
+    
+    score_max = questionnaire["max"]
+    pourcentage_total = (score_total / score_max * 100) if score_max > 0 else 0
+    
+    return {
+        "score": score_total,
+        "max": score_max,
+        "pourcentage": pourcentage_total,
+        "categories": scores_categories,
+        "ko_manquants": ko_manquants
+    }
+
+def score_initial(questionnaire=None):
+    """Score courant d'une évaluation sans aucune réponse"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    return {
+        "score": 0,
+        "categories": {categorie: 0 for categorie in questionnaire["categories"]},
+        "ko_manquants": {}
+    }
+
+def mettre_a_jour_score(score, question_id, ancienne, nouvelle, questionnaire=None):
+    """Reporte sur le score courant le changement de réponse d'une question
+    
+    La mise à jour est en temps constant : seuls les points de la question
+    modifiée sont retirés puis ajoutés. `ancienne` ou `nouvelle` valent None
+    quand la question n'avait pas ou plus de réponse.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    q = questionnaire["index"].get(question_id)
+    if q is None:
+        return score
+    if nouvelle is not None and nouvelle not in q["points"]:
+        raise ValueError(f"Réponse inconnue pour {question_id}: {nouvelle!r}")
+    
+    delta = 0
+    if ancienne is not None:
+        delta -= q["points"][ancienne]
+    if nouvelle is not None:
+        delta += q["points"][nouvelle]
+    score["categories"][q["categorie"]] += delta
+    score["score"] += delta
+    
+    # Vérifier les KO
+    if q["ko"]:
+        if nouvelle is not None and q["points"][nouvelle] < 100:
+            score["ko_manquants"][question_id] = nouvelle
+        else:
+            score["ko_manquants"].pop(question_id, None)
+    
+    return score
+
+def resultats_score_courant(score, questionnaire=None):
+    """Met un score courant au format des résultats de calculer_score"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    score_max = questionnaire["max"]
+    
+    return {
+        "score": score["score"],
+        "max": score_max,
+        "pourcentage": (score["score"] / score_max * 100) if score_max > 0 else 0,
+        "categories": {
+            categorie: {
+                "score": score["categories"][categorie],
+                "max": data["max"],
+                "pourcentage": (score["categories"][categorie] / data["max"]) * 100
+            }
+            for categorie, data in questionnaire["categories"].items()
+        },
+        "ko_manquants": [
+            {
+                "question": questionnaire["index"][question_id]["question"],
+                "reference": questionnaire["index"][question_id]["reference"],
+                "reponse": score["ko_manquants"][question_id]
+            }
+            for question_id in questionnaire["ko"]
+            if question_id in score["ko_manquants"]
+        ]
+    }
+
+class ReponsesCompactes(MutableMapping):
+    """Réponses d'une évaluation rangées selon le questionnaire compilé
+    
+    Chaque question à choix occupe un octet : l'indice de l'option choisie,
+    ou SANS_REPONSE. Les réponses libres (texte, nombre) sont conservées dans
+    un dictionnaire à part. Le dictionnaire des positions est celui du
+    questionnaire compilé, partagé par toutes les évaluations.
+    """
+    
+    __slots__ = ("positions", "choix", "libres")
+    
+    SANS_REPONSE = 255
+    
+    def __init__(self, questionnaire=None):
+        questionnaire = questionnaire or questionnaire_actif()["compile"]
+        self.positions = questionnaire["positions"]
+        self.choix = bytearray([self.SANS_REPONSE]) * len(self.positions)
+        self.libres = {}
+    
+    def __getitem__(self, question_id):
+        position = self.positions.get(question_id)
+        if position is None:
+            return self.libres[question_id]
+        indice = self.choix[position]
+        if indice == self.SANS_REPONSE:
+            raise KeyError(question_id)
+        return indice
+    
+    def __setitem__(self, question_id, valeur):
+        position = self.positions.get(question_id)
+        if position is None:
+            self.libres[question_id] = valeur
+        else:
+            self.choix[position] = valeur
+    
+    def __delitem__(self, question_id):
+        position = self.positions.get(question_id)
+        if position is None:
+            del self.libres[question_id]
+        elif self.choix[position] == self.SANS_REPONSE:
+            raise KeyError(question_id)
+        else:
+            self.choix[position] = self.SANS_REPONSE
+    
+    def __iter__(self):
+        for question_id, position in self.positions.items():
+            if self.choix[position] != self.SANS_REPONSE:
+                yield question_id
+        yield from self.libres
+    
+    def __len__(self):
+        return len(self.choix) - self.choix.count(self.SANS_REPONSE) + len(self.libres)
+    
+    def __repr__(self):
+        return f"ReponsesCompactes({dict(self)!r})"
+
+def compacter_reponses(reponses, questionnaire=None):
+    """Remplace les libellés des réponses à choix par leur indice dans les options
+    
+    Les réponses libres (texte, nombre) sont conservées telles quelles.
+    """
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    compactes = ReponsesCompactes(questionnaire)
+    for question_id, valeur in reponses.items():
+        options = questionnaire["options"].get(question_id)
+        if options is None:
+            compactes[question_id] = valeur
+        elif valeur in options:
+            compactes[question_id] = options.index(valeur)
+        else:
+            raise ValueError(f"Réponse inconnue pour {question_id}: {valeur!r}")
+    return compactes
+
+def libelle_reponse(question_id, valeur, questionnaire=None):
+    """Libellé d'une réponse compacte (l'option pour un indice, la valeur sinon)"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    options = questionnaire["options"].get(question_id)
+    if options is None or valeur is None:
+        return valeur
+    return options[valeur]
+
+def developper_reponses(compactes, questionnaire=None):
+    """Réponses avec leurs libellés, à partir de réponses compactes"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    return {
+        question_id: libelle_reponse(question_id, valeur, questionnaire)
+        for question_id, valeur in compactes.items()
+    }
+
+def scorer_lot(evaluations, questionnaire=None):
+    """Calcule les scores et statuts de N évaluations en une seule passe vectorisée
+    
+    `evaluations` est un DataFrame (ou une liste de dictionnaires de réponses) avec
+    une colonne par `id` de question. Retourne un DataFrame aligné sur l'index
+    d'entrée : score et pourcentage par catégorie, total, KO manquants et statut.
+    """
+    # pandas n'est importé qu'à l'usage pour garder un import du moteur léger
+    import pandas as pd
+    
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    if not isinstance(evaluations, pd.DataFrame):
+        evaluations = pd.DataFrame.from_records(list(evaluations))
+    
+    resultat = pd.DataFrame(index=evaluations.index)
+    score_total = pd.Series(0, index=evaluations.index, dtype="int64")
+    nb_ko = pd.Series(0, index=evaluations.index, dtype="int64")
+    
+    for categorie, data in questionnaire["categories"].items():
+        score_cat = pd.Series(0, index=evaluations.index, dtype="int64")
+        
+        for q in data["questions"]:
+            if q["id"] not in evaluations.columns:
+                continue
+            colonne = evaluations[q["id"]]
+            points = colonne.map(q["points"])
+            
+            inconnues = points.isna() & colonne.notna()
+            if inconnues.any():
+                reponse = colonne[inconnues].iloc[0]
+                raise ValueError(f"Réponse inconnue pour {q['id']}: {reponse!r}")
+            
+            score_cat += points.fillna(0).astype("int64")
+            
+            # Masque KO : question répondue avec moins de 100 points
+            if q["ko"]:
+                echec = points.lt(100)
+                resultat[f"ko_{q['id']}"] = echec
+                nb_ko += echec.astype("int64")
+        
+        resultat[f"{categorie}_score"] = score_cat
+        resultat[f"{categorie}_pourcentage"] = score_cat / data["max"] * 100
+        score_total += score_cat
+    
+    score_max = questionnaire["max"]
+    resultat["score"] = score_total
+    resultat["max"] = score_max
+    resultat["pourcentage"] = (score_total / score_max * 100) if score_max > 0 else 0.0
+    resultat["nb_ko_manquants"] = nb_ko
+    resultat["statut"] = statut_lot(resultat["pourcentage"], nb_ko)
+    
+    return resultat
+
+def statut_lot(pourcentages, nb_ko_manquants):
+    """Équivalent vectorisé du statut retourné par determiner_eligibilite"""
+    import pandas as pd
+    
+    statut = pd.Series("NON_ELIGIBLE", index=pourcentages.index, dtype="object")
+    # Du seuil le plus bas au plus haut : le dernier seuil atteint l'emporte
+    for code, seuil in sorted(SEUILS_ELIGIBILITE.items(), key=lambda s: s[1]):
+        statut[pourcentages >= seuil] = code
+    statut[nb_ko_manquants > 0] = "NON_ELIGIBLE"
+    return statut
+
+def determiner_eligibilite(resultats):
+    """Détermine l'éligibilité basée sur le score"""
+    pourcentage = resultats["pourcentage"]
+    ko_manquants = len(resultats["ko_manquants"])
+    
+    if ko_manquants > 0:
+        return {
+            "statut": "NON_ELIGIBLE",
+            "niveau": "❌ NON ÉLIGIBLE",
+            "couleur": "danger",
+            "message": f"**{ko_manquants} exigence(s) KO manquante(s)**. Ces prérequis essentiels sont OBLIGATOIRES pour la certification IFS Food."
+        }
+    elif pourcentage >= SEUILS_ELIGIBILITE["ELIGIBLE"]:
+        return {
+            "statut": "ELIGIBLE",
+            "niveau": "✅ ÉLIGIBLE",
+            "couleur": "success",
+            "message": "Votre entreprise semble prête pour entamer le processus de certification IFS Food v8."
+        }
+    elif pourcentage >= SEUILS_ELIGIBILITE["ELIGIBLE_RESERVE"]:
+        return {
+            "statut": "ELIGIBLE_RESERVE",
+            "niveau": "⚠️ ÉLIGIBLE AVEC RÉSERVES",
+            "couleur": "warning",
+            "message": "Votre entreprise a les bases nécessaires, mais des améliorations sont recommandées avant l'audit."
+        }
+    elif pourcentage >= SEUILS_ELIGIBILITE["AMELIORATIONS_REQUISES"]:
+        return {
+            "statut": "AMELIORATIONS_REQUISES",
+            "niveau": "⚠️ AMÉLIORATIONS IMPORTANTES REQUISES",
+            "couleur": "warning",
+            "message": "Une mise à niveau significative de votre système qualité est nécessaire avant de pouvoir envisager la certification."
+        }
+    else:
+        return {
+            "statut": "NON_ELIGIBLE",
+            "niveau": "❌ NON ÉLIGIBLE",
+            "couleur": "danger",
+            "message": "Les prérequis fondamentaux ne sont pas en place. Un accompagnement est fortement recommandé."
+        }
+
+def construire_rapport(resultats, eligibilite, reponses, date=None, questionnaire=None):
+    """Construit le rapport JSON d'une évaluation"""
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    date = date or datetime.now()
+    return {
+        "date_evaluation": date.strftime("%Y-%m-%d %H:%M"),
+        "entreprise": reponses.get("nom_entreprise", "N/A"),
+        "resultats": {
+            "score_total": f"{resultats['pourcentage']:.1f}%",
+            "eligibilite": eligibilite["niveau"],
+            "statut": eligibilite["statut"]
+        },
+        "categories": {
+            cat_id: {
+                "titre": questionnaire["categories"][cat_id]["titre"],
+                "score": f"{data['pourcentage']:.0f}%"
+            }
+            for cat_id, data in resultats["categories"].items()
+        },
+        "ko_manquants": resultats["ko_manquants"]
+    }
+
+def cle_reponses(reponses):
+    """Encodage canonique d'un jeu de réponses, identique pour des réponses égales"""
+    return json.dumps(reponses, sort_keys=True, ensure_ascii=False)
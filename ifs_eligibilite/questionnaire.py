@@ -0,0 +1,232 @@
+"""Définitions versionnées du questionnaire IFS Food v8 et leur forme compilée
+
+Le questionnaire est lu depuis un fichier JSON de définition (répertoire
+`questionnaires/`, ou chemin donné par IFS_QUESTIONNAIRE), validé puis compilé
+une seule fois par contenu : les formes compilées sont mises en cache sous
+l'empreinte SHA-256 du fichier. Quand le fichier change, la nouvelle version
+devient active sans interrompre les sessions qui utilisent encore l'ancienne.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+REPERTOIRE_QUESTIONNAIRES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questionnaires")
+CHEMIN_QUESTIONNAIRE = os.environ.get(
+    "IFS_QUESTIONNAIRE", os.path.join(REPERTOIRE_QUESTIONNAIRES, "ifs-food-v8.json")
+)
+
+# Délai minimal entre deux vérifications du fichier actif (secondes)
+INTERVALLE_VERIFICATION = 2.0
+
+TYPES_QUESTIONS = {"text", "number", "select", "radio"}
+
+logger = logging.getLogger(__name__)
+
+def compiler_questionnaire(questions):
+    """Compile le questionnaire en tables de points prêtes pour le calcul du score"""
+    categories = {}
+    score_max = 0
+    ko = []
+    index = {}
+    # Libellés des options de toutes les questions à choix, notées ou non, et
+    # position de chaque question : les réponses sont conservées en session
+    # sous forme d'indices dans ces listes (voir ReponsesCompactes)
+    options = {}
+    positions = {}
+    
+    for categorie, data in questions.items():
+        for q in data["questions"]:
+            if "options" in q:
+                options[q["id"]] = list(q["options"])
+                positions[q["id"]] = len(positions)
+        
+        if categorie == "informations":
+            continue
+        
+        questions_notees = []
+        max_cat = 0
+        
+        for q in data["questions"]:
+            if q["type"] in ["radio", "select"] and "points" in q:
+                max_points = max(q["points"])
+                max_cat += max_points
+                question_notee = {
+                    "id": q["id"],
+                    "categorie": categorie,
+                    "question": q["question"],
+                    "reference": q.get("reference", ""),
+                    "points": dict(zip(q["options"], q["points"])),
+                    "max": max_points,
+                    "ko": q.get("ko", False)
+                }
+                questions_notees.append(question_notee)
+                index[q["id"]] = question_notee
+                if q.get("ko", False):
+                    ko.append(q["id"])
+        
+        if max_cat > 0:
+            categories[categorie] = {
+                "titre": data["titre"],
+                "questions": questions_notees,
+                "max": max_cat
+            }
+            score_max += max_cat
+    
+    return {
+        "categories": categories,
+        "max": score_max,
+        "ko": ko,
+        "index": index,
+        "options": options,
+        "positions": positions
+    }
+
+def valider_questions(questions):
+    """Retourne la liste des incohérences d'un questionnaire (vide s'il est valide)"""
+    erreurs = []
+    ids = set()
+    
+    for categorie, data in questions.items():
+        if "titre" not in data or not isinstance(data.get("questions"), list):
+            erreurs.append(f"{categorie} : titre ou liste de questions manquant")
+            continue
+        
+        for q in data["questions"]:
+            nom = f"{categorie}/{q.get('id', '?')}"
+            if "id" not in q or "question" not in q:
+                erreurs.append(f"{nom} : id ou libellé manquant")
+                continue
+            if q["id"] in ids:
+                erreurs.append(f"{nom} : identifiant en double")
+            ids.add(q["id"])
+            
+            if q.get("type") not in TYPES_QUESTIONS:
+                erreurs.append(f"{nom} : type inconnu {q.get('type')!r}")
+                continue
+            if q["type"] in ["radio", "select"]:
+                if not q.get("options"):
+                    erreurs.append(f"{nom} : options manquantes")
+                    continue
+                if len(set(q["options"])) != len(q["options"]):
+                    erreurs.append(f"{nom} : options en double")
+                if len(q["options"]) > 255:
+                    erreurs.append(f"{nom} : 255 options au plus")
+            if "points" in q:
+                if len(q["points"]) != len(q.get("options", [])):
+                    erreurs.append(f"{nom} : {len(q.get('options', []))} options pour {len(q['points'])} points")
+                # bool est un sous-type d'int : true et false ne sont pas des points
+                if not all(isinstance(p, int) and not isinstance(p, bool) and p >= 0 for p in q["points"]):
+                    erreurs.append(f"{nom} : les points doivent être des entiers positifs")
+            if q.get("ko", False) and 100 not in q.get("points", []):
+                erreurs.append(f"{nom} : une exigence KO doit avoir une option à 100 points")
+    
+    return erreurs
+
+def lire_definition(contenu, origine="<questionnaire>"):
+    """Valide et compile une définition à partir du contenu JSON de son fichier"""
+    empreinte = hashlib.sha256(contenu).hexdigest()[:16]
+    definition = json.loads(contenu)
+    questions = definition.get("categories", {})
+    
+    erreurs = valider_questions(questions)
+    if erreurs:
+        raise ValueError(f"Questionnaire invalide ({origine}) : " + " ; ".join(erreurs))
+    
+    version = definition.get("version", empreinte)
+    compile = compiler_questionnaire(questions)
+    compile["version"] = version
+    compile["empreinte"] = empreinte
+    
+    return {
+        "version": version,
+        "empreinte": empreinte,
+        "questions": questions,
+        "compile": compile
+    }
+
+# Formes compilées par empreinte, partagées par toutes les sessions du processus
+_definitions = {}
+_verrou = threading.Lock()
+_actif = {"empreinte": None, "signature": None, "verification": 0.0}
+# Vérification et rechargement de la version active, par un seul fil à la fois
+# (réentrant : un abonné peut relire la version active)
+_verrou_actif = threading.RLock()
+# Fonctions appelées avec la nouvelle définition quand la version active change
+_abonnes = []
+
+def abonner_changement(fonction):
+    """Appelle `fonction(definition)` à chaque activation d'une nouvelle version"""
+    _abonnes.append(fonction)
+
+def charger_definition(chemin):
+    """Charge une définition depuis un fichier, compilée une seule fois par contenu"""
+    with open(chemin, "rb") as f:
+        contenu = f.read()
+    empreinte = hashlib.sha256(contenu).hexdigest()[:16]
+    with _verrou:
+        if empreinte not in _definitions:
+            _definitions[empreinte] = lire_definition(contenu, chemin)
+        return _definitions[empreinte]
+
+def charger_version(version):
+    """Charge la définition d'une version publiée dans le répertoire des questionnaires"""
+    return charger_definition(os.path.join(REPERTOIRE_QUESTIONNAIRES, f"{version}.json"))
+
+def questionnaire_actif():
+    """Définition active, rechargée si son fichier a changé depuis la dernière vérification
+    
+    Le fichier n'est examiné qu'une fois par INTERVALLE_VERIFICATION. Une
+    nouvelle version invalide est ignorée : la précédente reste active. Un
+    fichier momentanément absent (remplacement en cours) ou illisible laisse
+    lui aussi la version active en place ; il est réexaminé à la vérification
+    suivante.
+    """
+    if _actif["empreinte"] is not None and time.monotonic() - _actif["verification"] < INTERVALLE_VERIFICATION:
+        return _definitions[_actif["empreinte"]]
+    
+    with _verrou_actif:
+        # Un autre fil a pu vérifier le fichier pendant l'attente du verrou
+        maintenant = time.monotonic()
+        if _actif["empreinte"] is not None and maintenant - _actif["verification"] < INTERVALLE_VERIFICATION:
+            return _definitions[_actif["empreinte"]]
+        _actif["verification"] = maintenant
+        
+        try:
+            statut = os.stat(CHEMIN_QUESTIONNAIRE)
+            signature = (statut.st_mtime_ns, statut.st_size)
+            if signature != _actif["signature"]:
+                definition = charger_definition(CHEMIN_QUESTIONNAIRE)
+        except OSError:
+            if _actif["empreinte"] is None:
+                raise
+            logger.warning("Fichier du questionnaire illisible, la version active est conservée", exc_info=True)
+            return _definitions[_actif["empreinte"]]
+        except ValueError:
+            if _actif["empreinte"] is None:
+                raise
+            logger.exception("Nouvelle version du questionnaire ignorée")
+            _actif["signature"] = signature
+            return _definitions[_actif["empreinte"]]
+        
+        if signature != _actif["signature"]:
+            precedente = _actif["empreinte"]
+            _actif["empreinte"] = definition["empreinte"]
+            _actif["signature"] = signature
+            if definition["empreinte"] != precedente and precedente is not None:
+                logger.info("Questionnaire %s (%s) activé", definition["version"], definition["empreinte"])
+                for fonction in _abonnes:
+                    fonction(definition)
+        
+        return _definitions[_actif["empreinte"]]
+
+def questionnaire_par_empreinte(empreinte):
+    """Définition déjà chargée d'empreinte donnée, ou None"""
+    return _definitions.get(empreinte)
+
+# Questionnaire chargé à l'import (la version active peut changer ensuite)
+QUESTIONS = questionnaire_actif()["questions"]
+QUESTIONNAIRE_COMPILE = questionnaire_actif()["compile"]
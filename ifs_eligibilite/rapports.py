@@ -0,0 +1,153 @@
+"""Mise en forme des rapports d'évaluation : JSON, HTML et PDF
+
+Le PDF est produit localement, sans dépendance : une mise en page texte sur
+des pages A4 avec la police Helvetica standard.
+"""
+
+import html
+import json
+import textwrap
+
+FORMATS = {
+    "json": "application/json",
+    "html": "text/html",
+    "pdf": "application/pdf"
+}
+
+# Couleur d'encadré du résultat selon le statut
+COULEURS_STATUT = {
+    "ELIGIBLE": ("#d4edda", "#c3e6cb"),
+    "ELIGIBLE_RESERVE": ("#fff3cd", "#ffc107"),
+    "AMELIORATIONS_REQUISES": ("#fff3cd", "#ffc107"),
+    "NON_ELIGIBLE": ("#f8d7da", "#f5c6cb")
+}
+
+def nom_fichier(rapport, format):
+    """Nom de fichier du rapport, comme celui proposé au téléchargement"""
+    entreprise = rapport["entreprise"] if rapport["entreprise"] != "N/A" else "entreprise"
+    date = rapport["date_evaluation"][:10].replace("-", "")
+    return f"evaluation_ifs_{entreprise.replace(' ', '_').replace('/', '_')}_{date}.{format}"
+
+def rapport_json(rapport):
+    """Rapport au format JSON"""
+    return json.dumps(rapport, indent=2, ensure_ascii=False)
+
+def rapport_html(rapport):
+    """Rapport au format HTML autonome"""
+    e = html.escape
+    fond, bordure = COULEURS_STATUT.get(rapport["resultats"]["statut"], COULEURS_STATUT["NON_ELIGIBLE"])
+    
+    lignes_categories = "".join(
+        f"<tr><td>{e(data['titre'])}</td><td>{e(data['score'])}</td></tr>"
+        for data in rapport["categories"].values()
+    )
+    if rapport["ko_manquants"]:
+        ko = "<h2>🚨 Exigences KO manquantes</h2><ol>" + "".join(
+            f"<li><strong>{e(k['question'])}</strong><br>"
+            f"📖 Référence : {e(k['reference'])}<br>➡️ Réponse : <em>{e(k['reponse'])}</em></li>"
+            for k in rapport["ko_manquants"]
+        ) + "</ol>"
+    else:
+        ko = ""
+    
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>Évaluation IFS Food v8 - {e(rapport['entreprise'])}</title>
+<style>
+    body {{ font-family: sans-serif; max-width: 800px; margin: 40px auto; }}
+    .resultat {{ padding: 20px; border-radius: 5px; background-color: {fond}; border: 1px solid {bordure}; }}
+    table {{ border-collapse: collapse; width: 100%; }}
+    td {{ padding: 6px; border-bottom: 1px solid #ddd; }}
+</style>
+</head>
+<body>
+<h1>🎯 Évaluation IFS Food Version 8</h1>
+<p><strong>Entreprise :</strong> {e(rapport['entreprise'])}<br>
+<strong>Date :</strong> {e(rapport['date_evaluation'])}</p>
+<div class="resultat">
+<h2 style="margin:0;">{e(rapport['resultats']['eligibilite'])}</h2>
+<p style="font-size:24px;"><strong>Score : {e(rapport['resultats']['score_total'])}</strong></p>
+</div>
+{ko}
+<h2>📈 Détail par catégorie</h2>
+<table>{lignes_categories}</table>
+</body>
+</html>
+"""
+
+def _lignes_texte(rapport):
+    """Contenu du rapport en lignes de texte brut"""
+    lignes = [
+        "Évaluation IFS Food Version 8",
+        "",
+        f"Entreprise : {rapport['entreprise']}",
+        f"Date : {rapport['date_evaluation']}",
+        "",
+        f"Résultat : {rapport['resultats']['eligibilite']}",
+        f"Score : {rapport['resultats']['score_total']}",
+        ""
+    ]
+    if rapport["ko_manquants"]:
+        lignes.append("Exigences KO manquantes :")
+        for i, ko in enumerate(rapport["ko_manquants"], 1):
+            lignes.append(f"{i}. {ko['question']}")
+            lignes.append(f"   Référence : {ko['reference']} - Réponse : {ko['reponse']}")
+        lignes.append("")
+    lignes.append("Détail par catégorie :")
+    for data in rapport["categories"].values():
+        lignes.append(f"- {data['titre']} : {data['score']}")
+    return lignes
+
+def _texte_pdf(ligne):
+    """Encode une ligne pour une chaîne PDF en WinAnsi ; les emojis sont omis"""
+    octets = b" ".join(ligne.encode("cp1252", errors="ignore").split())
+    return octets.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def rapport_pdf(rapport, lignes_par_page=50):
+    """Rapport au format PDF (texte, pages A4)"""
+    lignes = []
+    for ligne in _lignes_texte(rapport):
+        lignes.extend(textwrap.wrap(ligne, 90, subsequent_indent="   ") or [""])
+    pages = [lignes[i:i + lignes_par_page] for i in range(0, len(lignes), lignes_par_page)]
+    
+    # Objets : 1 catalogue, 2 arbre des pages, 3 police, puis une page et son contenu par page
+    objets = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    ]
+    references_pages = []
+    for page in pages:
+        flux = b"BT /F1 11 Tf 14 TL 50 792 Td " + b" ".join(
+            b"(" + _texte_pdf(ligne) + b") '" for ligne in page
+        ) + b" ET"
+        objets.append(b"<< /Length %d >>\nstream\n" % len(flux) + flux + b"\nendstream")
+        objets.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objets))
+        )
+        references_pages.append(b"%d 0 R" % len(objets))
+    objets[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(references_pages), len(pages))
+    
+    sortie = bytearray(b"%PDF-1.4\n")
+    positions = []
+    for numero, objet in enumerate(objets, 1):
+        positions.append(len(sortie))
+        sortie += b"%d 0 obj\n" % numero + objet + b"\nendobj\n"
+    debut_xref = len(sortie)
+    sortie += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objets) + 1)
+    sortie += b"".join(b"%010d 00000 n \n" % position for position in positions)
+    sortie += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objets) + 1, debut_xref)
+    return bytes(sortie)
+
+def formater_rapport(rapport, format):
+    """Rapport dans le format demandé (json, html ou pdf)"""
+    if format == "json":
+        return rapport_json(rapport)
+    if format == "html":
+        return rapport_html(rapport)
+    if format == "pdf":
+        return rapport_pdf(rapport)
+    raise ValueError(f"Format de rapport inconnu : {format!r}")
@@ -0,0 +1,254 @@
+"""Réévaluation des évaluations archivées après un changement de barème
+
+Usage :
+    python -m ifs_eligibilite.reevaluation archive --nouveau ifs-food-v8.1.json
+                                           [--ancien ifs-food-v8.json] [--seuils 90,75,50]
+                                           [--liste 20] [--json reevaluation.json]
+
+Quand les points des options ou les seuils d'éligibilité changent, le statut
+enregistré des évaluations devient obsolète. Les deux versions du
+questionnaire sont comparées question par question ; seules les catégories
+contenant une question modifiée (points, exigence KO, catégorie, ajout ou
+retrait) sont recalculées, à partir de la matrice des réponses de l'archive
+(voir archive.py) et de tables de points indexées par l'octet de la réponse.
+Le nouveau score est le score enregistré, corrigé de l'écart de ces
+catégories : il suppose les évaluations notées avec l'ancienne version,
+celle de l'archive par défaut.
+
+Le rapport donne les transitions de statut, l'évolution moyenne des
+catégories recalculées et la liste des évaluations dont le statut change.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .questionnaire import charger_definition, charger_version, questionnaire_par_empreinte
+from .moteur import SEUILS_ELIGIBILITE
+from .archive import TAILLE_BLOC, SANS_REPONSE, ouvrir_archive, decrire
+from .calibrage import niveaux, lire_seuils
+
+def differences(ancien, nouveau):
+    """Questions notées dont la contribution au score change entre deux questionnaires compilés
+    
+    Retourne, par question, les modifications constatées (points, ko,
+    categorie, ajoutee, supprimee) et la liste des catégories concernées,
+    dans l'ordre du nouveau questionnaire.
+    """
+    questions = {}
+    categories = set()
+    for question_id in {**ancien["index"], **nouveau["index"]}:
+        avant = ancien["index"].get(question_id)
+        apres = nouveau["index"].get(question_id)
+        if avant is None or apres is None:
+            modifications = ["ajoutee" if avant is None else "supprimee"]
+        else:
+            modifications = [champ for champ in ("points", "ko", "categorie") if avant[champ] != apres[champ]]
+        if modifications:
+            questions[question_id] = modifications
+            categories.update(q["categorie"] for q in (avant, apres) if q is not None)
+    ordre = dict.fromkeys([*nouveau["categories"], *ancien["categories"]])
+    return {"questions": questions, "categories": [c for c in ordre if c in categories]}
+
+def questionnaire_archive(archive):
+    """Questionnaire compilé avec lequel l'archive a été construite"""
+    manifeste = archive["manifeste"]
+    definition = questionnaire_par_empreinte(manifeste["empreinte_questionnaire"])
+    return (definition or charger_version(manifeste["version_questionnaire"]))["compile"]
+
+def tables_points(archive, questionnaire):
+    """Points de chaque colonne de l'archive selon un questionnaire, indexés par l'octet de la réponse
+    
+    Une option que le questionnaire ne connaît pas (ou une question qu'il ne
+    note pas) vaut 0 point. Retourne un tableau (colonnes × 256) et, pour
+    les exigences KO du questionnaire, un tableau de booléens d'échec.
+    """
+    import numpy as np
+    
+    colonnes = archive["manifeste"]["colonnes"]
+    points = np.zeros((len(colonnes), 256), dtype=np.int32)
+    echecs = np.zeros((len(colonnes), 256), dtype=bool)
+    for j, question_id in enumerate(colonnes):
+        q = questionnaire["index"].get(question_id)
+        if q is None:
+            continue
+        for i, option in enumerate(archive["manifeste"]["options"][question_id]):
+            if option in q["points"]:
+                points[j, i] = q["points"][option]
+                echecs[j, i] = q["ko"] and q["points"][option] < 100
+    points[:, SANS_REPONSE] = 0
+    return points, echecs
+
+def reevaluer(archive, nouveau, ancien=None, seuils=None, taille_bloc=TAILLE_BLOC):
+    """Nouveaux scores et statuts des évaluations archivées
+    
+    `nouveau` et `ancien` sont des questionnaires compilés ; l'ancien est par
+    défaut la version avec laquelle l'archive a été construite. `seuils`
+    remplace SEUILS_ELIGIBILITE pour le nouveau statut. Les colonnes lues
+    sont celles des catégories recalculées et des exigences KO.
+    """
+    import numpy as np
+    
+    manifeste = archive["manifeste"]
+    ancien = ancien or questionnaire_archive(archive)
+    for question_id in manifeste["colonnes"]:
+        if question_id in ancien["options"] and ancien["options"][question_id] != manifeste["options"][question_id]:
+            raise ValueError(f"L'archive n'a pas été construite avec l'ancien questionnaire ({question_id})")
+    
+    seuils = seuils or SEUILS_ELIGIBILITE
+    codes = ["NON_ELIGIBLE", *sorted(seuils, key=seuils.get)]
+    ecarts = differences(ancien, nouveau)
+    points_avant, _ = tables_points(archive, ancien)
+    points_apres, echecs = tables_points(archive, nouveau)
+    
+    # Colonnes de l'archive par catégorie recalculée, dans l'un ou l'autre questionnaire
+    positions = archive["positions"]
+    colonnes_avant = {c: [positions[q["id"]] for q in ancien["categories"][c]["questions"] if q["id"] in positions]
+                      for c in ecarts["categories"] if c in ancien["categories"]}
+    colonnes_apres = {c: [positions[q["id"]] for q in nouveau["categories"][c]["questions"] if q["id"] in positions]
+                      for c in ecarts["categories"] if c in nouveau["categories"]}
+    colonnes_ko = [positions[question_id] for question_id in nouveau["ko"] if question_id in positions]
+    
+    lignes = archive["lignes"]
+    scores = np.empty(lignes, dtype=np.int64)
+    statuts = np.empty(lignes, dtype=np.uint8)
+    sommes = {c: [0, 0] for c in ecarts["categories"]}
+    for debut in range(0, lignes, taille_bloc):
+        fin = min(debut + taille_bloc, lignes)
+        reponses = archive["reponses"][debut:fin]
+        score = archive["score"][debut:fin].astype(np.int64)
+        for categorie, colonnes in colonnes_avant.items():
+            somme = sum((points_avant[j][reponses[:, j]] for j in colonnes), np.zeros(fin - debut, dtype=np.int64))
+            score -= somme
+            sommes[categorie][0] += int(somme.sum())
+        for categorie, colonnes in colonnes_apres.items():
+            somme = sum((points_apres[j][reponses[:, j]] for j in colonnes), np.zeros(fin - debut, dtype=np.int64))
+            score += somme
+            sommes[categorie][1] += int(somme.sum())
+        echec_ko = np.zeros(fin - debut, dtype=bool)
+        for j in colonnes_ko:
+            echec_ko |= echecs[j][reponses[:, j]]
+        scores[debut:fin] = score
+        statuts[debut:fin] = niveaux(score / nouveau["max"] * 100, echec_ko, seuils.values())
+    
+    # Statut enregistré, traduit dans l'ordre des codes du nouveau statut
+    correspondance = np.array([codes.index(code) if code in codes else 0 for code in manifeste["statuts"]],
+                              dtype=np.uint8)
+    anciens = correspondance[archive["statut"][:lignes]] if lignes else statuts
+    return {
+        "codes": codes,
+        "differences": ecarts,
+        "scores": scores,
+        "pourcentages": scores / nouveau["max"] * 100,
+        "statuts": statuts,
+        "anciens_statuts": anciens,
+        "moyennes_categories": {
+            categorie: {
+                "avant": avant / lignes / ancien["categories"][categorie]["max"] * 100
+                if lignes and categorie in ancien["categories"] else None,
+                "apres": apres / lignes / nouveau["categories"][categorie]["max"] * 100
+                if lignes and categorie in nouveau["categories"] else None
+            }
+            for categorie, (avant, apres) in sommes.items()
+        }
+    }
+
+def rapport_reevaluation(archive, reevaluation, ancien, nouveau, seuils=None):
+    """Rapport des changements de statut, avec la liste des évaluations concernées"""
+    import numpy as np
+    
+    codes = reevaluation["codes"]
+    nombre = len(codes)
+    transitions = np.bincount(
+        reevaluation["anciens_statuts"].astype(np.int64) * nombre + reevaluation["statuts"],
+        minlength=nombre * nombre
+    ).reshape(nombre, nombre)
+    modifies = np.flatnonzero(reevaluation["anciens_statuts"] != reevaluation["statuts"])
+    
+    evaluations = decrire(archive, modifies)
+    for evaluation, statut, score, pourcentage in zip(
+        evaluations,
+        reevaluation["statuts"][modifies].tolist(),
+        reevaluation["scores"][modifies].tolist(),
+        reevaluation["pourcentages"][modifies].tolist()
+    ):
+        evaluation["ancien_statut"] = evaluation.pop("statut")
+        evaluation["ancien_score"] = evaluation.pop("score")
+        evaluation["ancien_pourcentage"] = evaluation.pop("pourcentage")
+        evaluation["statut"] = codes[statut]
+        evaluation["score"] = score
+        evaluation["pourcentage"] = round(pourcentage, 1)
+    
+    return {
+        "ancien": ancien.get("version"),
+        "nouveau": nouveau.get("version"),
+        "seuils": dict(seuils or SEUILS_ELIGIBILITE),
+        "evaluations_archivees": archive["lignes"],
+        "questions_modifiees": reevaluation["differences"]["questions"],
+        "categories_recalculees": reevaluation["moyennes_categories"],
+        "transitions": {
+            f"{codes[i]} → {codes[j]}": int(transitions[i, j])
+            for i in range(nombre) for j in range(nombre) if i != j and transitions[i, j]
+        },
+        "statuts_modifies": len(modifies),
+        "evaluations": evaluations
+    }
+
+def afficher(rapport, liste=20, sortie=sys.stdout):
+    """Écrit le rapport de réévaluation sous forme lisible"""
+    def ecrire(texte=""):
+        sortie.write(texte + "\n")
+    
+    ecrire(f"{rapport['ancien']} → {rapport['nouveau']}, {rapport['evaluations_archivees']} évaluation(s) archivée(s)")
+    ecrire("\nQuestions modifiées")
+    for question_id, modifications in sorted(rapport["questions_modifiees"].items()):
+        ecrire(f"  {question_id:<24} {', '.join(modifications)}")
+    ecrire("\nCatégories recalculées (moyenne)")
+    for categorie, moyennes in rapport["categories_recalculees"].items():
+        avant, apres = (f"{m:5.1f}%" if m is not None else "    -" for m in moyennes.values())
+        ecrire(f"  {categorie:<24} {avant} → {apres}")
+    ecrire(f"\n{rapport['statuts_modifies']} statut(s) modifié(s)")
+    for transition, nombre in sorted(rapport["transitions"].items(), key=lambda t: -t[1]):
+        ecrire(f"  {nombre:>10}  {transition}")
+    if liste and rapport["evaluations"]:
+        ecrire()
+        for evaluation in rapport["evaluations"][:liste]:
+            ecrire(f"  {evaluation['id']:>8}  {evaluation['entreprise'] or '':<30.30} "
+                   f"{evaluation['ancien_statut']} ({evaluation['ancien_pourcentage']:.1f}%) → "
+                   f"{evaluation['statut']} ({evaluation['pourcentage']:.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ifs_eligibilite.reevaluation",
+        description="Réévalue les évaluations archivées avec un nouveau barème."
+    )
+    parser.add_argument("archive", help="répertoire de l'archive (python -m ifs_eligibilite.archive construire)")
+    parser.add_argument("--nouveau", required=True, help="fichier JSON du nouveau questionnaire")
+    parser.add_argument("--ancien", help="fichier JSON de l'ancien questionnaire (défaut : version de l'archive)")
+    parser.add_argument("--seuils", type=lambda t: lire_seuils(t, list(SEUILS_ELIGIBILITE)),
+                        help="nouveaux seuils d'éligibilité (défaut : %s)" % ",".join(
+                            str(v) for v in SEUILS_ELIGIBILITE.values()))
+    parser.add_argument("--liste", type=int, default=20, help="évaluations modifiées à afficher")
+    parser.add_argument("--json", help="fichier où écrire le rapport complet")
+    args = parser.parse_args(argv)
+    
+    debut = time.perf_counter()
+    archive = ouvrir_archive(args.archive)
+    nouveau = charger_definition(args.nouveau)["compile"]
+    ancien = charger_definition(args.ancien)["compile"] if args.ancien else questionnaire_archive(archive)
+    try:
+        reevaluation = reevaluer(archive, nouveau, ancien, args.seuils)
+    except ValueError as e:
+        parser.error(str(e))
+    rapport = rapport_reevaluation(archive, reevaluation, ancien, nouveau, args.seuils)
+    afficher(rapport, args.liste)
+    print(f"\nDurée : {time.perf_counter() - debut:.1f} s", file=sys.stderr)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Points de reprise des sessions de l'assistant, partagés entre processus
+
+L'étape et les réponses d'une session ne vivent que dans la mémoire du
+processus Streamlit qui la sert. Avec la variable d'environnement
+IFS_SESSIONS (chemin d'une base SQLite accessible à tous les processus),
+chaque changement d'étape écrit un point de reprise compact : empreinte du
+questionnaire, étape, octets des réponses à choix, réponses libres en JSON
+et identifiant de l'évaluation enregistrée. Le point est désigné par un
+jeton aléatoire, placé dans le lien de la page (?session=<jeton>) : n'importe
+quel processus reprend la session depuis ce lien, après un redémarrage ou
+sans affinité de session devant les processus.
+
+Une ligne fait une centaine d'octets ; elle est remplacée à chaque écriture.
+Les points non modifiés depuis IFS_SESSIONS_JOURS jours sont effacés à
+l'ouverture de la base.
+
+    IFS_SESSIONS          base des points de reprise (aucun point n'est écrit sans elle)
+    IFS_SESSIONS_JOURS    durée de conservation d'un point (défaut 30 jours)
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from .moteur import ReponsesCompactes
+from .questionnaire import questionnaire_par_empreinte
+
+CHEMIN_SESSIONS = os.environ.get("IFS_SESSIONS")
+CONSERVATION = float(os.environ.get("IFS_SESSIONS_JOURS", "30")) * 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points_reprise (
+    jeton TEXT PRIMARY KEY,
+    empreinte TEXT NOT NULL,
+    etape INTEGER NOT NULL,
+    choix BLOB NOT NULL,
+    libres TEXT NOT NULL,
+    evaluation_id INTEGER,
+    mise_a_jour REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_connexions = {}
+_verrou = threading.Lock()
+
+def actif():
+    """Indique si les points de reprise sont activés (IFS_SESSIONS)"""
+    return bool(CHEMIN_SESSIONS)
+
+def nouveau_jeton():
+    """Jeton opaque d'une session : 128 bits aléatoires, sans lien avec l'identifiant de l'évaluation"""
+    return secrets.token_urlsafe(16)
+
+def connexion(chemin=None):
+    """Retourne la connexion du processus à la base des points, créée au premier appel"""
+    chemin = chemin or CHEMIN_SESSIONS
+    cle = (os.getpid(), chemin)
+    
+    with _verrou:
+        if cle not in _connexions:
+            conn = sqlite3.connect(chemin, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            with conn:
+                conn.execute("DELETE FROM points_reprise WHERE mise_a_jour < ?", (time.time() - CONSERVATION,))
+            _connexions[cle] = conn
+        return _connexions[cle]
+
+def enregistrer_point(jeton, empreinte, etape, reponses, evaluation_id=None, chemin=None):
+    """Écrit (ou remplace) le point de reprise d'une session
+    
+    `reponses` est l'objet ReponsesCompactes de la session.
+    """
+    conn = connexion(chemin)
+    ligne = (
+        jeton, empreinte, etape, bytes(reponses.choix),
+        json.dumps(reponses.libres, ensure_ascii=False), evaluation_id, time.time()
+    )
+    with _verrou, conn:
+        conn.execute("INSERT OR REPLACE INTO points_reprise VALUES (?, ?, ?, ?, ?, ?, ?)", ligne)
+
+def charger_point(jeton, chemin=None):
+    """Point de reprise d'un jeton, ou None
+    
+    Retourne un dictionnaire (empreinte, etape, reponses, evaluation_id), les
+    réponses en ReponsesCompactes. Un point dont la version du questionnaire
+    n'est pas chargée dans ce processus n'est pas repris : ses octets ne se
+    lisent qu'avec les positions de cette version.
+    """
+    if not jeton:
+        return None
+    conn = connexion(chemin)
+    with _verrou:
+        ligne = conn.execute(
+            "SELECT empreinte, etape, choix, libres, evaluation_id FROM points_reprise WHERE jeton = ?", (jeton,)
+        ).fetchone()
+    if ligne is None:
+        return None
+    empreinte, etape, choix, libres, evaluation_id = ligne
+    definition = questionnaire_par_empreinte(empreinte)
+    if definition is None or len(choix) != len(definition["compile"]["positions"]):
+        return None
+    
+    reponses = ReponsesCompactes(definition["compile"])
+    reponses.choix[:] = choix
+    reponses.libres.update(json.loads(libres))
+    return {"empreinte": empreinte, "etape": etape, "reponses": reponses, "evaluation_id": evaluation_id}
@@ -0,0 +1,92 @@
+"""Suivi de l'activité des sessions et libération des sessions inactives
+
+Un auditeur qui laisse son onglet ouvert garde sa session connectée, et son
+état en mémoire, indéfiniment. Le registre note la dernière activité de
+chaque session ; au-delà du délai d'inactivité, l'état de la session est
+rendu à l'application pour être enregistré puis effacé.
+"""
+
+import sys
+import threading
+import time
+import weakref
+
+# Intervalle minimal entre deux recherches de sessions inactives (secondes)
+INTERVALLE_EXPULSION = 60.0
+
+def _references(objet):
+    """Objets directement référencés par un conteneur"""
+    if isinstance(objet, dict):
+        return [*objet.keys(), *objet.values()]
+    if isinstance(objet, (list, tuple, set, frozenset)):
+        return list(objet)
+    # Objets compacts à attributs fixes (ReponsesCompactes)
+    return [getattr(objet, nom) for nom in getattr(type(objet), "__slots__", ()) if hasattr(objet, nom)]
+
+def _parcourir(objet, exclus=frozenset()):
+    """Objets atteignables depuis `objet`, chacun une seule fois"""
+    vus = set(exclus)
+    a_visiter = [objet]
+    while a_visiter:
+        courant = a_visiter.pop()
+        if id(courant) in vus:
+            continue
+        vus.add(id(courant))
+        yield courant
+        a_visiter.extend(_references(courant))
+
+def memoire_objet(objet, partages=None):
+    """Mémoire occupée par un objet et tout ce qu'il référence, en octets
+    
+    Les objets atteignables depuis `partages` (le questionnaire compilé,
+    commun à toutes les sessions) ne sont pas comptés.
+    """
+    exclus = frozenset(id(o) for o in _parcourir(partages)) if partages is not None else frozenset()
+    return sum(sys.getsizeof(courant) for courant in _parcourir(objet, exclus))
+
+class RegistreSessions:
+    """Dernière activité et état des sessions du processus"""
+    
+    def __init__(self, inactivite):
+        self.inactivite = inactivite
+        self._verrou = threading.Lock()
+        self._sessions = {}
+        self._derniere_recherche = 0.0
+    
+    def signaler(self, session_id, etat):
+        """Note l'activité d'une session ; `etat` n'est référencé que faiblement"""
+        with self._verrou:
+            self._sessions[session_id] = (time.monotonic(), weakref.ref(etat))
+    
+    def inactives(self):
+        """Retire du registre et retourne les états des sessions inactives
+        
+        La recherche est faite au plus une fois par INTERVALLE_EXPULSION ;
+        les sessions déjà fermées par Streamlit sont oubliées au passage.
+        """
+        maintenant = time.monotonic()
+        expulsees = []
+        with self._verrou:
+            if maintenant - self._derniere_recherche < INTERVALLE_EXPULSION:
+                return expulsees
+            self._derniere_recherche = maintenant
+            
+            for session_id, (activite, reference) in list(self._sessions.items()):
+                etat = reference()
+                if etat is None:
+                    del self._sessions[session_id]
+                elif maintenant - activite > self.inactivite:
+                    del self._sessions[session_id]
+                    expulsees.append(etat)
+        return expulsees
+    
+    def statistiques(self, mesurer=memoire_objet):
+        """Nombre de sessions suivies et mémoire de leur état"""
+        with self._verrou:
+            etats = [reference() for _, reference in self._sessions.values()]
+        memoires = [mesurer(etat) for etat in etats if etat is not None]
+        return {
+            "sessions": len(memoires),
+            "memoire_octets": sum(memoires),
+            "memoire_moyenne_octets": sum(memoires) / len(memoires) if memoires else 0.0
+        }
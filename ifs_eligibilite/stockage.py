@@ -0,0 +1,398 @@
+"""Stockage SQLite des évaluations
+
+Une connexion unique par processus, partagée entre les sessions Streamlit
+(threads) derrière un verrou. La base est en mode WAL : les lectures ne sont
+pas bloquées par les écritures des autres processus.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .questionnaire import questionnaire_actif
+from .moteur import calculer_score, determiner_eligibilite
+from .analytique import (
+    SCHEMA_AGREGATS,
+    contributions,
+    appliquer_contributions,
+    reconstruire_agregats,
+    lire_agregats,
+    lire_distribution,
+    part_devant,
+    SERIE_TOTAL,
+)
+
+# Chemin par défaut de la base, surchargé par la variable d'environnement IFS_BASE
+CHEMIN_BASE = os.environ.get("IFS_BASE", "evaluations.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    entreprise TEXT,
+    date_creation TEXT NOT NULL,
+    date_evaluation TEXT NOT NULL,
+    etape INTEGER,
+    statut TEXT,
+    score INTEGER,
+    pourcentage REAL,
+    reponses TEXT NOT NULL,
+    categories TEXT,
+    ko_manquants TEXT,
+    version_questionnaire TEXT,
+    empreinte_questionnaire TEXT,
+    groupe TEXT,
+    site TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_entreprise ON evaluations (entreprise);
+CREATE INDEX IF NOT EXISTS idx_evaluations_date ON evaluations (date_evaluation);
+CREATE INDEX IF NOT EXISTS idx_evaluations_statut ON evaluations (statut, date_evaluation);
+"""
+
+# Colonnes ajoutées depuis la création du schéma, migrées à la connexion
+COLONNES_AJOUTEES = {
+    "version_questionnaire": "TEXT",
+    "empreinte_questionnaire": "TEXT",
+    "groupe": "TEXT",
+    "site": "TEXT",
+    "jeton": "TEXT"
+}
+
+# Index sur les colonnes ajoutées, créés après leur migration
+INDEX_AJOUTES = """
+CREATE INDEX IF NOT EXISTS idx_evaluations_groupe ON evaluations (groupe, site);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_evaluations_jeton ON evaluations (jeton);
+"""
+
+# Colonnes renseignées à l'insertion d'une évaluation terminée
+COLONNES_INSERTION = [
+    "entreprise", "date_creation", "date_evaluation", "etape", "statut", "score",
+    "pourcentage", "reponses", "categories", "ko_manquants",
+    "version_questionnaire", "empreinte_questionnaire", "groupe", "site", "jeton"
+]
+
+# Durée de validité de la distribution lue, pour voir les évaluations des autres processus
+DUREE_DISTRIBUTION = 10.0
+
+_connexions = {}
+_verrou = threading.Lock()
+# Distribution cumulée des pourcentages par base, effacée à chaque enregistrement du processus
+_distributions = {}
+
+def connexion(chemin=None):
+    """Retourne la connexion du processus à la base, créée au premier appel"""
+    chemin = chemin or CHEMIN_BASE
+    cle = (os.getpid(), chemin)
+    
+    with _verrou:
+        if cle not in _connexions:
+            conn = sqlite3.connect(chemin, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            existantes = {ligne["name"] for ligne in conn.execute("PRAGMA table_info(evaluations)")}
+            for nom, type in COLONNES_AJOUTEES.items():
+                if nom not in existantes:
+                    conn.execute(f"ALTER TABLE evaluations ADD COLUMN {nom} {type}")
+            if "jeton" not in existantes:
+                # Évaluations enregistrées avant les jetons : un jeton aléatoire chacune
+                with conn:
+                    conn.execute("UPDATE evaluations SET jeton = lower(hex(randomblob(16))) WHERE jeton IS NULL")
+            conn.executescript(INDEX_AJOUTES)
+            conn.executescript(SCHEMA_AGREGATS)
+            # Base créée avant les agrégats (ou avant la distribution) : on les calcule une fois sur l'historique
+            agregats_vides = (
+                conn.execute("SELECT 1 FROM agregats_statut LIMIT 1").fetchone() is None
+                or conn.execute("SELECT 1 FROM agregats_distribution LIMIT 1").fetchone() is None
+            )
+            if agregats_vides and conn.execute(
+                "SELECT 1 FROM evaluations WHERE statut IS NOT NULL LIMIT 1"
+            ).fetchone():
+                reconstruire_agregats(conn)
+            _connexions[cle] = conn
+        return _connexions[cle]
+
+def nouveau_jeton():
+    """Jeton opaque d'une évaluation, seul moyen de la reprendre depuis un lien"""
+    return secrets.token_urlsafe(16)
+
+def _colonnes(reponses, etape, resultats, eligibilite, date, questionnaire):
+    """Valeurs des colonnes d'une évaluation, en cours ou terminée"""
+    termine = resultats is not None
+    return {
+        "version_questionnaire": questionnaire.get("version"),
+        "empreinte_questionnaire": questionnaire.get("empreinte"),
+        "entreprise": reponses.get("nom_entreprise"),
+        "date_evaluation": date.isoformat(timespec="seconds"),
+        "etape": etape,
+        "statut": eligibilite["statut"] if termine else None,
+        "score": resultats["score"] if termine else None,
+        "pourcentage": resultats["pourcentage"] if termine else None,
+        "reponses": json.dumps(reponses, ensure_ascii=False),
+        "categories": json.dumps(resultats["categories"], ensure_ascii=False) if termine else None,
+        "ko_manquants": json.dumps(resultats["ko_manquants"], ensure_ascii=False) if termine else None
+    }
+
+def sauvegarder_evaluation(reponses, etape=1, resultats=None, eligibilite=None,
+                           evaluation_id=None, questionnaire=None, chemin=None, jeton=None):
+    """Enregistre une évaluation et retourne son identifiant
+    
+    Sans `resultats`, l'évaluation est enregistrée comme en cours (statut nul).
+    Avec un `evaluation_id`, la ligne existante est mise à jour. La version du
+    questionnaire compilé `questionnaire` (l'actif par défaut) est enregistrée.
+    Une nouvelle évaluation reçoit le jeton `jeton`, ou un jeton aléatoire.
+    """
+    conn = connexion(chemin)
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    maintenant = datetime.now()
+    colonnes = _colonnes(reponses, etape, resultats, eligibilite, maintenant, questionnaire)
+    
+    with _verrou, conn:
+        _distributions.clear()
+        # Les agrégats suivent l'évaluation : sa nouvelle contribution est ajoutée,
+        # l'ancienne (évaluation déjà terminée puis modifiée) est retirée
+        appliquer_contributions(conn, contributions([colonnes]))
+        
+        if evaluation_id is not None:
+            ancienne = conn.execute(
+                "SELECT date_evaluation, statut, pourcentage, categories, ko_manquants "
+                "FROM evaluations WHERE id = ?", (evaluation_id,)
+            ).fetchone()
+            if ancienne is not None:
+                appliquer_contributions(conn, contributions([dict(ancienne)]), signe=-1)
+                conn.execute(
+                    f"UPDATE evaluations SET {', '.join(f'{c} = :{c}' for c in colonnes)} WHERE id = :id",
+                    {**colonnes, "id": evaluation_id}
+                )
+                return evaluation_id
+        
+        colonnes["date_creation"] = colonnes["date_evaluation"]
+        colonnes["jeton"] = jeton or nouveau_jeton()
+        curseur = conn.execute(
+            f"INSERT INTO evaluations ({', '.join(colonnes)}) VALUES ({', '.join(':' + c for c in colonnes)})",
+            colonnes
+        )
+        return curseur.lastrowid
+
+def supprimer_evaluation(evaluation_id, chemin=None):
+    """Supprime une évaluation et retire sa contribution aux agrégats
+    
+    Retourne False si l'évaluation n'existe pas.
+    """
+    conn = connexion(chemin)
+    with _verrou, conn:
+        ancienne = conn.execute(
+            "SELECT date_evaluation, statut, pourcentage, categories, ko_manquants "
+            "FROM evaluations WHERE id = ?", (evaluation_id,)
+        ).fetchone()
+        if ancienne is None:
+            return False
+        _distributions.clear()
+        appliquer_contributions(conn, contributions([dict(ancienne)]), signe=-1)
+        conn.execute("DELETE FROM evaluations WHERE id = ?", (evaluation_id,))
+        return True
+
+def inserer_lot(evaluations, chemin=None, date=None, questionnaire=None):
+    """Calcule et insère en une transaction un lot de réponses importées
+    
+    Retourne le nombre d'évaluations insérées.
+    """
+    conn = connexion(chemin)
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    date = date or datetime.now()
+    
+    lignes = []
+    for reponses in evaluations:
+        resultats = calculer_score(reponses, questionnaire)
+        colonnes = _colonnes(reponses, None, resultats, determiner_eligibilite(resultats), date, questionnaire)
+        lignes.append(colonnes)
+    
+    with _verrou, conn:
+        return _inserer(conn, lignes)
+
+def _inserer(conn, lignes):
+    """Insère des évaluations terminées et leurs contributions aux agrégats (sous verrou et transaction)"""
+    _distributions.clear()
+    for colonnes in lignes:
+        colonnes["date_creation"] = colonnes["date_evaluation"]
+        colonnes.setdefault("groupe", None)
+        colonnes.setdefault("site", None)
+        colonnes["jeton"] = nouveau_jeton()
+    curseur = conn.executemany(
+        f"INSERT INTO evaluations ({', '.join(COLONNES_INSERTION)}) "
+        f"VALUES ({', '.join(':' + c for c in COLONNES_INSERTION)})",
+        lignes
+    )
+    appliquer_contributions(conn, contributions(lignes))
+    return curseur.rowcount
+
+def enregistrer_groupe(groupe, sites, chemin=None, date=None, questionnaire=None):
+    """Enregistre les évaluations des sites d'un groupe, en remplaçant les précédentes
+    
+    `sites` est la liste retournée par groupe.evaluer_sites (nom du site,
+    réponses, résultats et éligibilité). Retourne le nombre de sites enregistrés.
+    """
+    conn = connexion(chemin)
+    questionnaire = questionnaire or questionnaire_actif()["compile"]
+    date = date or datetime.now()
+    
+    lignes = []
+    for site in sites:
+        colonnes = _colonnes(site["reponses"], None, site["resultats"], site["eligibilite"], date, questionnaire)
+        colonnes["groupe"] = groupe
+        colonnes["site"] = site["site"]
+        lignes.append(colonnes)
+    
+    with _verrou, conn:
+        anciennes = conn.execute(
+            "SELECT date_evaluation, statut, pourcentage, categories, ko_manquants "
+            "FROM evaluations WHERE groupe = ?", (groupe,)
+        ).fetchall()
+        appliquer_contributions(conn, contributions([dict(ligne) for ligne in anciennes]), signe=-1)
+        conn.execute("DELETE FROM evaluations WHERE groupe = ?", (groupe,))
+        return _inserer(conn, lignes)
+
+def charger_groupe(groupe, chemin=None):
+    """Évaluations des sites d'un groupe, par nom de site"""
+    conn = connexion(chemin)
+    with _verrou:
+        lignes = conn.execute(
+            "SELECT * FROM evaluations WHERE groupe = ? ORDER BY site", (groupe,)
+        ).fetchall()
+    return [_evaluation(ligne) for ligne in lignes]
+
+def lister_groupes(chemin=None):
+    """Groupes enregistrés et leur nombre de sites, par nom"""
+    conn = connexion(chemin)
+    with _verrou:
+        lignes = conn.execute(
+            "SELECT groupe, COUNT(*) AS sites FROM evaluations "
+            "WHERE groupe IS NOT NULL GROUP BY groupe ORDER BY groupe"
+        ).fetchall()
+    return {ligne["groupe"]: ligne["sites"] for ligne in lignes}
+
+def _evaluation(ligne):
+    """Convertit une ligne de la table en dictionnaire"""
+    evaluation = dict(ligne)
+    for champ in ["reponses", "categories", "ko_manquants"]:
+        if evaluation[champ] is not None:
+            evaluation[champ] = json.loads(evaluation[champ])
+    return evaluation
+
+def charger_evaluation(evaluation_id, chemin=None):
+    """Charge une évaluation par son identifiant, ou None si elle n'existe pas"""
+    conn = connexion(chemin)
+    with _verrou:
+        ligne = conn.execute(
+            "SELECT * FROM evaluations WHERE id = ?", (evaluation_id,)
+        ).fetchone()
+    return _evaluation(ligne) if ligne else None
+
+def charger_evaluation_jeton(jeton, chemin=None):
+    """Charge une évaluation par son jeton, ou None si aucune ne le porte"""
+    conn = connexion(chemin)
+    with _verrou:
+        ligne = conn.execute(
+            "SELECT * FROM evaluations WHERE jeton = ?", (jeton,)
+        ).fetchone()
+    return _evaluation(ligne) if ligne else None
+
+def rechercher_evaluations(entreprise=None, statut=None, depuis=None, jusqu_a=None,
+                           limite=100, chemin=None):
+    """Recherche les évaluations par entreprise, statut et période, les plus récentes d'abord"""
+    conditions = []
+    parametres = []
+    if entreprise is not None:
+        conditions.append("entreprise = ?")
+        parametres.append(entreprise)
+    if statut is not None:
+        conditions.append("statut = ?")
+        parametres.append(statut)
+    if depuis is not None:
+        conditions.append("date_evaluation >= ?")
+        parametres.append(depuis.isoformat(timespec="seconds"))
+    if jusqu_a is not None:
+        conditions.append("date_evaluation < ?")
+        parametres.append(jusqu_a.isoformat(timespec="seconds"))
+    
+    requete = "SELECT * FROM evaluations"
+    if conditions:
+        requete += " WHERE " + " AND ".join(conditions)
+    requete += " ORDER BY date_evaluation DESC LIMIT ?"
+    parametres.append(limite)
+    
+    conn = connexion(chemin)
+    with _verrou:
+        lignes = conn.execute(requete, parametres).fetchall()
+    return [_evaluation(ligne) for ligne in lignes]
+
+def iterer_evaluations(statut=None, depuis=None, jusqu_a=None, terminees=True,
+                       taille_lot=1000, chemin=None):
+    """Parcourt les évaluations par lots successifs, sans les charger toutes en mémoire
+    
+    Chaque lot est lu sous le verrou par pagination sur l'identifiant : les
+    enregistrements des autres sessions ne sont bloqués que le temps d'un lot.
+    """
+    conditions = ["id > ?"]
+    parametres = []
+    if terminees:
+        conditions.append("statut IS NOT NULL")
+    if statut is not None:
+        conditions.append("statut = ?")
+        parametres.append(statut)
+    if depuis is not None:
+        conditions.append("date_evaluation >= ?")
+        parametres.append(depuis.isoformat(timespec="seconds"))
+    if jusqu_a is not None:
+        conditions.append("date_evaluation < ?")
+        parametres.append(jusqu_a.isoformat(timespec="seconds"))
+    requete = f"SELECT * FROM evaluations WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+    
+    conn = connexion(chemin)
+    dernier_id = 0
+    while True:
+        with _verrou:
+            lignes = conn.execute(requete, [dernier_id, *parametres, taille_lot]).fetchall()
+        if not lignes:
+            return
+        for ligne in lignes:
+            yield _evaluation(ligne)
+        dernier_id = lignes[-1]["id"]
+
+def agregats(chemin=None):
+    """Agrégats pré-calculés sur l'ensemble des évaluations terminées"""
+    conn = connexion(chemin)
+    with _verrou:
+        return lire_agregats(conn)
+
+def distribution_scores(chemin=None):
+    """Distribution cumulée des pourcentages de chaque série, relue au plus toutes les DUREE_DISTRIBUTION secondes"""
+    conn = connexion(chemin)
+    maintenant = time.monotonic()
+    with _verrou:
+        lecture = _distributions.get(chemin or CHEMIN_BASE)
+        if lecture is None or maintenant - lecture[0] > DUREE_DISTRIBUTION:
+            lecture = (maintenant, lire_distribution(conn))
+            _distributions[chemin or CHEMIN_BASE] = lecture
+        return lecture[1]
+
+def position_population(resultats, chemin=None):
+    """Part des évaluations enregistrées qui font mieux, au total et par catégorie
+    
+    Retourne le nombre d'évaluations de la population et, en pourcentage,
+    la part du score total et de chaque catégorie (None sans historique).
+    """
+    distribution = distribution_scores(chemin)
+    total = distribution.get(SERIE_TOTAL, [0])[0]
+    return {
+        "population": total,
+        "total": part_devant(distribution, SERIE_TOTAL, resultats["pourcentage"]),
+        "categories": {
+            categorie: part_devant(distribution, categorie, data["pourcentage"])
+            for categorie, data in resultats["categories"].items()
+        }
+    }
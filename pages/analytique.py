@@ -0,0 +1,70 @@
+import streamlit as st
+import pandas as pd
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.stockage import agregats
+
+# Configuration de la page
+st.set_page_config(
+    page_title="Analytique IFS Food v8",
+    page_icon="📈",
+    layout="wide"
+)
+
+st.title("📈 Analytique des Évaluations")
+st.markdown("*Vue d'ensemble des évaluations IFS Food v8 terminées*")
+st.markdown("---")
+
+# Les agrégats sont tenus à jour à chaque enregistrement : aucune lecture de l'historique
+data = agregats()
+
+if not data["total"]:
+    st.info("Aucune évaluation terminée pour le moment.")
+    st.stop()
+
+# Répartition des statuts
+st.markdown("### 🎯 Répartition des Statuts")
+st.caption(f"{data['total']} évaluation(s) terminée(s)")
+
+colonnes = st.columns(len(data["statuts"]))
+for col, (statut, nombre) in zip(colonnes, sorted(data["statuts"].items())):
+    with col:
+        st.metric(statut, nombre, f"{nombre / data['total'] * 100:.1f}%", delta_color="off")
+
+st.markdown("---")
+
+# Taux d'échec par exigence KO
+st.markdown("### 🚨 Taux d'Échec par Exigence KO")
+if data["taux_echec_ko"]:
+    taux_ko = pd.DataFrame(
+        [(reference, taux * 100) for reference, taux in data["taux_echec_ko"].items()],
+        columns=["Référence", "Taux d'échec (%)"]
+    )
+    st.dataframe(taux_ko, hide_index=True, use_container_width=True)
+else:
+    st.success("Aucune exigence KO manquante dans les évaluations terminées.")
+
+st.markdown("---")
+
+# Score moyen par catégorie
+st.markdown("### 📊 Score Moyen par Catégorie")
+# Les catégories des anciennes versions du questionnaire gardent leur identifiant
+categories = questionnaire_actif()["compile"]["categories"]
+moyennes = pd.DataFrame(
+    [(categories.get(cat_id, {}).get("titre", cat_id), moyenne) for cat_id, moyenne in data["moyennes_categories"].items()],
+    columns=["Catégorie", "Score moyen (%)"]
+).set_index("Catégorie")
+st.bar_chart(moyennes)
+
+st.markdown("---")
+
+# Tendance dans le temps
+st.markdown("### 📅 Évolution dans le Temps")
+tendance = pd.DataFrame(data["tendance"]).set_index("jour")
+col1, col2 = st.columns(2)
+with col1:
+    st.caption("Évaluations terminées par jour")
+    st.line_chart(tendance["nombre"])
+with col2:
+    st.caption("Score moyen par jour (%)")
+    st.line_chart(tendance["pourcentage_moyen"])
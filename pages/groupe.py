@@ -0,0 +1,157 @@
+import io
+import os
+
+import streamlit as st
+import pandas as pd
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.lot import lire_evaluations, LigneInvalide
+from ifs_eligibilite.groupe import evaluer_sites, consolider
+from ifs_eligibilite.stockage import enregistrer_groupe, charger_groupe, lister_groupes
+
+# Configuration de la page
+st.set_page_config(
+    page_title="Groupe multi-sites IFS Food v8",
+    page_icon="🏭",
+    layout="wide"
+)
+
+st.title("🏭 Évaluation Multi-Sites")
+st.markdown("*Une évaluation par site, consolidée à l'échelle du groupe*")
+st.markdown("---")
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def evaluer_fichier(contenu, format, empreinte):
+    """Sites d'un fichier CSV ou JSONL évalués ; le nom du site est lu dans la colonne « site »"""
+    flux = io.StringIO(contenu.decode("utf-8-sig"), newline="")
+    sites = []
+    for rang, (numero, reponses) in enumerate(lire_evaluations(flux, format, colonnes=("site",)), 1):
+        if isinstance(reponses, LigneInvalide):
+            raise LigneInvalide(f"ligne {numero}: {reponses}")
+        site = reponses.pop("site", None) or reponses.get("nom_entreprise") or f"Site {rang}"
+        sites.append({"site": site, "reponses": reponses})
+    return evaluer_sites(sites, processus=os.cpu_count() or 1)
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def evaluer_groupe_enregistre(groupe, empreinte):
+    """Sites d'un groupe enregistré, réévalués avec le questionnaire actif"""
+    sites = [{"site": evaluation["site"], "reponses": evaluation["reponses"]} for evaluation in charger_groupe(groupe)]
+    return evaluer_sites(sites, processus=os.cpu_count() or 1)
+
+empreinte = questionnaire_actif()["empreinte"]
+groupes = lister_groupes()
+
+source = st.radio("Source", ["Importer un fichier", "Groupe enregistré"], horizontal=True,
+                  index=1 if groupes else 0)
+
+try:
+    if source == "Importer un fichier":
+        groupe = st.text_input("Nom du groupe")
+        fichier = st.file_uploader(
+            "Un site par ligne : colonne « site » et une colonne par identifiant de question",
+            type=["csv", "jsonl"]
+        )
+        if fichier is None:
+            st.stop()
+        format = "csv" if fichier.name.lower().endswith(".csv") else "jsonl"
+        sites = evaluer_fichier(fichier.getvalue(), format, empreinte)
+    else:
+        if not groupes:
+            st.info("Aucun groupe enregistré pour le moment.")
+            st.stop()
+        groupe = st.selectbox("Groupe", list(groupes), format_func=lambda nom: f"{nom} ({groupes[nom]} sites)")
+        sites = evaluer_groupe_enregistre(groupe, empreinte)
+    consolidation = consolider(sites, questionnaire_actif()["compile"])
+except ValueError as e:
+    st.error(f"Évaluation impossible : {e}")
+    st.stop()
+
+categories = consolidation["categories"]
+
+# Synthèse du groupe
+st.markdown("### 🎯 Synthèse du Groupe")
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Sites", consolidation["sites"])
+with col2:
+    st.metric("Statut du groupe (site le moins bon)", consolidation["statut"])
+with col3:
+    st.metric("Score moyen", f"{consolidation['pourcentage_moyen']:.1f}%")
+with col4:
+    eligibles = consolidation["statuts"].get("ELIGIBLE", 0)
+    st.metric("Sites éligibles", eligibles, f"{eligibles / consolidation['sites'] * 100:.0f}%", delta_color="off")
+
+if source == "Importer un fichier":
+    if st.button("💾 Enregistrer le groupe", disabled=not groupe):
+        nombre = enregistrer_groupe(groupe, sites)
+        # Le groupe a pu être enregistré auparavant avec d'autres sites
+        evaluer_groupe_enregistre.clear()
+        st.success(f"{nombre} site(s) enregistré(s) pour le groupe « {groupe} »")
+
+st.markdown("---")
+
+# Exigences KO manquantes, tous sites confondus
+st.markdown("### 🚨 Exigences KO Manquantes sur le Groupe")
+if consolidation["ko"]:
+    ko = pd.DataFrame([
+        {
+            "Référence": entree["reference"],
+            "Exigence": entree["question"],
+            "Sites concernés": len(entree["sites"]),
+            "Pire réponse": entree["pire_reponse"],
+            "Sites": ", ".join(entree["sites"])
+        }
+        for entree in consolidation["ko"]
+    ])
+    st.dataframe(ko, hide_index=True, use_container_width=True)
+else:
+    st.success("Aucune exigence KO manquante sur l'ensemble des sites.")
+
+st.markdown("---")
+
+# Scores par catégorie sur l'ensemble des sites
+st.markdown("### 📊 Scores par Catégorie")
+st.dataframe(
+    pd.DataFrame([
+        {
+            "Catégorie": data["titre"],
+            "Min (%)": data["min"],
+            "Site min": data["site_min"],
+            "Moyenne (%)": data["moyenne"],
+            "Max (%)": data["max"],
+            "Site max": data["site_max"]
+        }
+        for data in categories.values()
+    ]),
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        colonne: st.column_config.NumberColumn(format="%.0f")
+        for colonne in ("Min (%)", "Moyenne (%)", "Max (%)")
+    }
+)
+
+st.markdown("---")
+
+# Classement des sites : un seul tableau, quel que soit le nombre de sites
+st.markdown("### 🏆 Classement des Sites")
+classement = pd.DataFrame(consolidation["classement"]).rename(
+    columns={categorie: data["titre"] for categorie, data in categories.items()}
+)
+st.dataframe(
+    classement,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "rang": st.column_config.NumberColumn("Rang"),
+        "site": st.column_config.TextColumn("Site"),
+        "statut": st.column_config.TextColumn("Statut"),
+        "pourcentage": st.column_config.ProgressColumn("Score", format="%.1f%%", min_value=0, max_value=100),
+        "score": st.column_config.NumberColumn("Points"),
+        "ko_manquants": st.column_config.NumberColumn("KO manquants"),
+        **{
+            data["titre"]: st.column_config.NumberColumn(format="%.0f%%")
+            for data in categories.values()
+        }
+    }
+)
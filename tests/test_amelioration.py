@@ -0,0 +1,48 @@
+"""Les plans d'amélioration mènent bien au seuil visé une fois leurs réponses recalculées"""
+
+import random
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.moteur import calculer_score, determiner_eligibilite
+from ifs_eligibilite.amelioration import SEUILS_PLAN, plans_amelioration
+
+def reponses_aleatoires(alea, index):
+    """Réponses partielles : environ une question notée sur deux reste sans réponse"""
+    return {
+        question_id: alea.choice(list(q["points"]))
+        for question_id, q in index.items()
+        if alea.random() < 0.5
+    }
+
+def efforts_aleatoires(alea, index):
+    """Un effort par option, les options sous 100 points étant souvent les moins coûteuses"""
+    return {
+        question_id: {option: alea.randint(1, 9) if points >= 100 else alea.randint(0, 2) for option, points in q["points"].items()}
+        for question_id, q in index.items()
+    }
+
+def test_plan_recalcule_atteint_le_seuil():
+    index = questionnaire_actif()["compile"]["index"]
+    alea = random.Random(0)
+    for _ in range(1200):
+        reponses = reponses_aleatoires(alea, index)
+        for plan in plans_amelioration(reponses, efforts_aleatoires(alea, index)):
+            if not plan["atteignable"]:
+                continue
+            nouvelles = {**reponses, **{c["question_id"]: c["cible"] for c in plan["changements"]}}
+            resultats = calculer_score(nouvelles)
+            assert not resultats["ko_manquants"]
+            assert resultats["score"] == plan["score_atteint"]
+            statut = determiner_eligibilite(resultats)["statut"]
+            assert statut in SEUILS_PLAN[SEUILS_PLAN.index(plan["statut"]):]
+
+def test_exigence_ko_sans_reponse_jamais_sous_100():
+    index = questionnaire_actif()["compile"]["index"]
+    ko = next(q for q in index.values() if q["ko"] and any(0 < points < 100 for points in q["points"].values()))
+    partielle = max((option for option, points in ko["points"].items() if points < 100), key=ko["points"].get)
+    # L'option sous 100 points est gratuite, l'option conforme coûteuse
+    efforts = {ko["id"]: {option: 0 if option == partielle else 9 for option in ko["points"]}}
+    plans = plans_amelioration({}, efforts)
+    assert plans
+    for plan in plans:
+        assert all(c["cible"] != partielle for c in plan["changements"])
@@ -0,0 +1,90 @@
+"""Service HTTP d'évaluation, démarré sur un port éphémère de localhost"""
+
+import asyncio
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ifs_eligibilite import api
+
+@pytest.fixture
+def port():
+    """Démarre le service dans une boucle asyncio à part et retourne son port"""
+    boucle = asyncio.new_event_loop()
+    serveur = boucle.run_until_complete(api.demarrer(port=0))
+    fil = threading.Thread(target=boucle.run_forever, daemon=True)
+    fil.start()
+    yield serveur.sockets[0].getsockname()[1]
+    boucle.call_soon_threadsafe(boucle.stop)
+    fil.join()
+    serveur.close()
+    boucle.run_until_complete(serveur.wait_closed())
+    boucle.close()
+
+def requete(port, methode, chemin, corps=None):
+    """Statut et corps JSON de la réponse"""
+    connexion = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connexion.request(methode, chemin, json.dumps(corps) if corps is not None else None)
+        reponse = connexion.getresponse()
+        return reponse.status, json.loads(reponse.read())
+    finally:
+        connexion.close()
+
+def test_evaluation(port):
+    statut, rapport = requete(port, "POST", "/evaluations", {"reponses": {"ko_1": "Oui", "nom_entreprise": "ACME"}})
+    assert statut == 200
+    assert rapport["entreprise"] == "ACME"
+    assert "score_total" in rapport["resultats"]
+
+@pytest.mark.parametrize("reponses", [{"ko_1": ["Oui"]}, {"ko_1": {"a": 1}}, {"ko_1": "Peut-être"}])
+def test_reponse_invalide(port, reponses):
+    statut, corps = requete(port, "POST", "/evaluations", {"reponses": reponses})
+    assert statut == 422
+    assert "ko_1" in corps["erreur"]
+
+def test_lot_erreur_par_evaluation(port):
+    evaluations = [{"ko_1": "Oui"}, {"ko_1": ["Oui"]}, {"ko_1": "Peut-être"}, {}]
+    statut, corps = requete(port, "POST", "/evaluations/lot", {"evaluations": evaluations})
+    assert statut == 200
+    rapports = corps["rapports"]
+    assert len(rapports) == 4
+    assert "resultats" in rapports[0] and "resultats" in rapports[3]
+    assert "erreur" in rapports[1] and "erreur" in rapports[2]
+
+def test_ligne_trop_longue(port):
+    connexion = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connexion.putrequest("GET", "/sante")
+    connexion.putheader("X-Long", "a" * 100_000)
+    connexion.endheaders()
+    reponse = connexion.getresponse()
+    assert reponse.status == 400
+    connexion.close()
+
+def test_demandes_identiques_regroupees(port, monkeypatch):
+    evaluer = api.evaluer
+    libere = threading.Event()
+    
+    def evaluer_bloque(reponses):
+        libere.wait(10)
+        return evaluer(reponses)
+    
+    # Le calcul reste en cours tant que les autres demandes ne l'ont pas rejoint
+    monkeypatch.setattr(api, "evaluer", evaluer_bloque)
+    corps = {"reponses": {"ko_1": "Non", "nom_entreprise": "Regroupée"}}
+    with ThreadPoolExecutor(5) as pool:
+        demandes = [pool.submit(requete, port, "POST", "/evaluations", corps) for _ in range(5)]
+        limite = time.monotonic() + 10
+        while requete(port, "GET", "/sante")[1]["compteurs"].get("regroupees", 0) < 4 and time.monotonic() < limite:
+            time.sleep(0.01)
+        libere.set()
+        resultats = [demande.result() for demande in demandes]
+    
+    assert all(statut == 200 for statut, _ in resultats)
+    assert len({json.dumps(rapport, sort_keys=True) for _, rapport in resultats}) == 1
+    _, sante = requete(port, "GET", "/sante")
+    assert sante["compteurs"]["regroupees"] == 4
@@ -0,0 +1,32 @@
+"""Cache LRU partagé des scores et des rapports"""
+
+from ifs_eligibilite.cache import CacheLRU
+
+def test_eviction_du_moins_recemment_utilise():
+    cache = CacheLRU(2)
+    calculs = []
+    
+    def calculer(cle):
+        return lambda: calculs.append(cle) or cle.upper()
+    
+    assert cache.obtenir("a", calculer("a")) == "A"
+    assert cache.obtenir("b", calculer("b")) == "B"
+    # « a » redevient le plus récent : « b » est évincé par « c »
+    assert cache.obtenir("a", calculer("a")) == "A"
+    assert cache.obtenir("c", calculer("c")) == "C"
+    assert cache.obtenir("a", calculer("a")) == "A"
+    assert cache.obtenir("b", calculer("b")) == "B"
+    assert calculs == ["a", "b", "c", "b"]
+    
+    statistiques = cache.statistiques()
+    assert statistiques["taille"] == 2
+    assert (statistiques["succes"], statistiques["echecs"]) == (2, 4)
+    assert statistiques["taux_succes"] == 2 / 6
+
+def test_vider():
+    cache = CacheLRU(4)
+    cache.obtenir("a", lambda: 1)
+    cache.vider()
+    assert cache.obtenir("a", lambda: 2) == 2
+    statistiques = cache.statistiques()
+    assert (statistiques["taille"], statistiques["echecs"], statistiques["invalidations"]) == (1, 2, 1)
@@ -0,0 +1,75 @@
+"""Journal des réponses : segments tournants, fusion des processus et rejeu"""
+
+import os
+
+from ifs_eligibilite import evenements
+from ifs_eligibilite.evenements import (
+    JournalEvenements,
+    encoder_debut,
+    encoder_reponse,
+    encoder_etape,
+    identifiant_session,
+    lire_evenements,
+    rejouer,
+    segments,
+)
+
+EMPREINTE = "0123456789abcdef"
+
+def journal_processus(repertoire, prefixe):
+    """Journal dont le segment tourne à chaque écriture : un événement par segment"""
+    journal = JournalEvenements(str(repertoire), taille_segment=1, intervalle=3600)
+    journal._prefixe = prefixe
+    return journal
+
+def ecrire(journal, *evenements_encodes):
+    for evenement in evenements_encodes:
+        journal.ajouter(evenement)
+        journal.vider()
+
+def test_rejeu_fusionne_les_processus_par_horodatage(tmp_path, monkeypatch):
+    monkeypatch.setattr(evenements, "TAILLE_LECTURE", 50)
+    session_a = identifiant_session("session-a")
+    session_b = identifiant_session("session-b")
+    # Le processus B a démarré avant A : ses segments viennent en tête par nom,
+    # mais l'évaluation y est reprise après avoir été commencée dans A
+    journal_a = journal_processus(tmp_path, "20240101-120000-0000002")
+    journal_b = journal_processus(tmp_path, "20240101-110000-0000001")
+    ecrire(
+        journal_a,
+        encoder_debut(session_a, EMPREINTE, horodatage=100.0),
+        encoder_reponse(session_a, "ko_1", 1, False, horodatage=101.0),
+        encoder_reponse(session_a, "nom_entreprise", "ACME", True, horodatage=102.0),
+        encoder_etape(session_a, 2, 7, horodatage=103.0),
+    )
+    ecrire(
+        journal_b,
+        encoder_debut(session_b, EMPREINTE, 7, horodatage=200.0),
+        encoder_reponse(session_b, "ko_1", 0, False, horodatage=201.0),
+        encoder_etape(session_b, 3, 7, horodatage=202.0),
+    )
+    
+    assert len(segments(tmp_path)) == 7
+    horodatages = [evenement[1] for evenement in lire_evenements(tmp_path)]
+    assert horodatages == sorted(horodatages) and len(horodatages) == 7
+    
+    resultat = rejouer(lire_evenements(tmp_path), evaluations=[7])
+    dernier = resultat["parcours"][-1]
+    assert dernier["evaluation_id"] == 7
+    assert dernier["reponses"] == {"ko_1": 0, "nom_entreprise": "ACME"}
+    assert [ligne["atteinte"] for ligne in resultat["entonnoir"]] == [2, 2, 1]
+
+def test_segment_tronque(tmp_path):
+    session = identifiant_session("session-c")
+    journal = JournalEvenements(str(tmp_path), intervalle=3600)
+    ecrire(
+        journal,
+        encoder_debut(session, EMPREINTE, horodatage=1.0),
+        encoder_reponse(session, "ko_1", 0, False, horodatage=2.0),
+    )
+    chemin = segments(tmp_path)[0]
+    with open(chemin, "ab") as f:
+        f.write(encoder_reponse(session, "ko_2", 0, False, horodatage=3.0)[:-3])
+    
+    assert [evenement[1] for evenement in lire_evenements(tmp_path)] == [1.0, 2.0]
+    assert os.path.basename(chemin).split("-")[2] == f"{os.getpid():07d}"
@@ -0,0 +1,32 @@
+"""Évaluation en lot : erreurs signalées au numéro de ligne du fichier source"""
+
+import io
+from datetime import datetime
+
+import pytest
+
+from ifs_eligibilite.lot import lire_evaluations, evaluer_flux
+
+DATE = datetime(2024, 1, 1)
+
+def erreurs(contenu, format, processus=1):
+    sortie = io.StringIO()
+    journal = io.StringIO()
+    nb_rapports, _ = evaluer_flux(
+        lire_evaluations(io.StringIO(contenu, newline=""), format), sortie, journal,
+        processus=processus, taille_lot=2, date=DATE
+    )
+    return nb_rapports, journal.getvalue().splitlines()
+
+@pytest.mark.parametrize("processus", [1, 2])
+def test_jsonl_lignes_vides_comptees(processus):
+    contenu = '{"ko_1": "Oui"}\n\n{"ko_1": \n\n[1]\n{"ko_1": "Peut-être"}\n{"ko_1": "Non"}\n'
+    nb_rapports, lignes = erreurs(contenu, "jsonl", processus)
+    assert nb_rapports == 2
+    assert [ligne.split(":")[0] for ligne in lignes] == ["ligne 3", "ligne 5", "ligne 6"]
+
+def test_csv_en_tete_compte():
+    contenu = "nom_entreprise,ko_1\nA,Oui\nB,Peut-être\nC,Non\n"
+    nb_rapports, lignes = erreurs(contenu, "csv")
+    assert nb_rapports == 2
+    assert [ligne.split(":")[0] for ligne in lignes] == ["ligne 3"]
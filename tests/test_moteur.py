@@ -0,0 +1,54 @@
+"""Réponses compactes : indices d'options en octets et réponses libres à part"""
+
+import pytest
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.moteur import ReponsesCompactes, compacter_reponses, developper_reponses
+
+def reponses_completes():
+    """Dernière option de chaque question à choix, une valeur pour les autres"""
+    reponses = {}
+    for data in questionnaire_actif()["questions"].values():
+        for q in data["questions"]:
+            if "options" in q:
+                reponses[q["id"]] = q["options"][-1]
+            elif q["type"] == "number":
+                reponses[q["id"]] = 42
+            else:
+                reponses[q["id"]] = "ACME"
+    return reponses
+
+def test_aller_retour():
+    reponses = reponses_completes()
+    compactes = compacter_reponses(reponses)
+    assert len(compactes) == len(reponses)
+    assert developper_reponses(compactes) == reponses
+
+def test_aller_retour_partiel():
+    reponses = dict(list(reponses_completes().items())[::3])
+    compactes = compacter_reponses(reponses)
+    assert developper_reponses(compactes) == reponses
+    assert set(compactes) == set(reponses)
+
+def test_sans_reponse():
+    compile = questionnaire_actif()["compile"]
+    question_id = next(iter(compile["positions"]))
+    compactes = ReponsesCompactes(compile)
+    assert bytes(compactes.choix) == bytes([ReponsesCompactes.SANS_REPONSE]) * len(compile["positions"])
+    assert len(compactes) == 0
+    assert question_id not in compactes
+    
+    compactes[question_id] = 0
+    assert compactes[question_id] == 0
+    assert developper_reponses(compactes) == {question_id: compile["options"][question_id][0]}
+    
+    # Retirer une réponse remet l'octet à SANS_REPONSE
+    del compactes[question_id]
+    assert compactes.choix[compile["positions"][question_id]] == ReponsesCompactes.SANS_REPONSE
+    assert developper_reponses(compactes) == {}
+    with pytest.raises(KeyError):
+        del compactes[question_id]
+
+def test_reponse_inconnue():
+    with pytest.raises(ValueError):
+        compacter_reponses({"ko_1": "Peut-être"})
@@ -0,0 +1,106 @@
+"""Validation des définitions du questionnaire et rechargement de la version active"""
+
+import copy
+import json
+import os
+import threading
+
+import pytest
+
+from ifs_eligibilite import questionnaire
+from ifs_eligibilite.questionnaire import lire_definition, questionnaire_actif
+
+# Fichier de la version active, avant que les tests ne le remplacent par une copie
+CHEMIN_ORIGINE = questionnaire.CHEMIN_QUESTIONNAIRE
+
+def definition_active():
+    with open(CHEMIN_ORIGINE, encoding="utf-8") as f:
+        return json.load(f)
+
+def premiere_notee(definition):
+    return next(
+        q for data in definition["categories"].values() for q in data["questions"]
+        if "points" in q and not q.get("ko")
+    )
+
+def contenu(definition):
+    return json.dumps(definition, ensure_ascii=False).encode("utf-8")
+
+def test_definition_active_valide():
+    assert lire_definition(contenu(definition_active()))["compile"]["max"] > 0
+
+@pytest.mark.parametrize("modifier, message", [
+    (lambda d, q: q.update(points=[True] + q["points"][1:]), "entiers positifs"),
+    (lambda d, q: q.update(points=[-1] + q["points"][1:]), "entiers positifs"),
+    (lambda d, q: q.update(points=q["points"][:-1]), "options pour"),
+    (lambda d, q: q.update(type="slider"), "type inconnu"),
+    (lambda d, q: q.update(options=[q["options"][0]] * len(q["options"])), "options en double"),
+    (lambda d, q: q.update(ko=True, points=[min(p, 99) for p in q["points"]]), "100 points"),
+    (lambda d, q: q.update(id=next(iter(d["categories"].values()))["questions"][0]["id"]), "en double"),
+])
+def test_definition_invalide(modifier, message):
+    definition = copy.deepcopy(definition_active())
+    modifier(definition, premiere_notee(definition))
+    with pytest.raises(ValueError, match=message):
+        lire_definition(contenu(definition))
+
+@pytest.fixture
+def fichier_actif(tmp_path, monkeypatch):
+    """Questionnaire actif lu depuis une copie temporaire, vérifiée à chaque appel"""
+    chemin = tmp_path / "questionnaire.json"
+    chemin.write_bytes(contenu(definition_active()))
+    monkeypatch.setattr(questionnaire, "CHEMIN_QUESTIONNAIRE", str(chemin))
+    monkeypatch.setattr(questionnaire, "INTERVALLE_VERIFICATION", 0.0)
+    monkeypatch.setattr(questionnaire, "_actif", {"empreinte": None, "signature": None, "verification": 0.0})
+    monkeypatch.setattr(questionnaire, "_abonnes", [])
+    return chemin
+
+def nouvelle_version(chemin, version):
+    definition = definition_active()
+    definition["version"] = version
+    chemin.write_bytes(contenu(definition))
+
+def test_rechargement(fichier_actif):
+    initiale = questionnaire_actif()
+    activees = []
+    questionnaire.abonner_changement(activees.append)
+    
+    nouvelle_version(fichier_actif, "v-test-rechargement")
+    active = questionnaire_actif()
+    assert active["version"] == "v-test-rechargement"
+    assert [d["version"] for d in activees] == ["v-test-rechargement"]
+    # L'ancienne version reste disponible pour les sessions qui l'utilisent
+    assert questionnaire.questionnaire_par_empreinte(initiale["empreinte"]) is initiale
+    
+    # Version invalide : la précédente reste active
+    fichier_actif.write_bytes(b'{"categories": {"x": {"titre": "X"}}}')
+    assert questionnaire_actif() is active
+    assert len(activees) == 1
+
+def test_fichier_absent_pendant_le_remplacement(fichier_actif):
+    active = questionnaire_actif()
+    os.remove(fichier_actif)
+    assert questionnaire_actif() is active
+    assert questionnaire_actif() is active
+    
+    nouvelle_version(fichier_actif, "v-test-remplacement")
+    assert questionnaire_actif()["version"] == "v-test-remplacement"
+
+def test_une_seule_activation_par_changement(fichier_actif):
+    questionnaire_actif()
+    activees = []
+    questionnaire.abonner_changement(activees.append)
+    nouvelle_version(fichier_actif, "v-test-concurrence")
+    
+    depart = threading.Barrier(8)
+    
+    def lire():
+        depart.wait()
+        questionnaire_actif()
+    
+    fils = [threading.Thread(target=lire) for _ in range(8)]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    assert [d["version"] for d in activees] == ["v-test-concurrence"]
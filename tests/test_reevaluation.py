@@ -0,0 +1,61 @@
+"""Réévaluation vectorisée de l'archive comparée au calcul évaluation par évaluation"""
+
+import copy
+import random
+
+import pytest
+
+from ifs_eligibilite.questionnaire import questionnaire_actif, compiler_questionnaire
+from ifs_eligibilite.moteur import calculer_score, determiner_eligibilite
+from ifs_eligibilite.archive import construire_archive, ouvrir_archive
+from ifs_eligibilite.reevaluation import reevaluer
+
+pytest.importorskip("numpy")
+
+def evaluations(alea, questionnaire, nombre):
+    """Évaluations archivées : réponses tirées au hasard, quelques questions sans réponse
+    
+    Les exigences KO reçoivent le plus souvent leur meilleure réponse, sans
+    quoi presque toutes les évaluations seraient non éligibles.
+    """
+    lignes = []
+    for i in range(nombre):
+        reponses = {}
+        for question_id, options in questionnaire["options"].items():
+            if alea.random() < 0.05:
+                continue
+            question = questionnaire["index"].get(question_id)
+            if question and question["ko"] and alea.random() < 0.9:
+                reponses[question_id] = max(options, key=question["points"].get)
+            else:
+                reponses[question_id] = alea.choice(options)
+        resultats = calculer_score(reponses, questionnaire)
+        lignes.append({
+            "id": i + 1, "entreprise": f"E{i % 7}", "date_evaluation": "2024-01-01T00:00:00",
+            "statut": determiner_eligibilite(resultats)["statut"], "score": resultats["score"],
+            "pourcentage": resultats["pourcentage"], "reponses": reponses
+        })
+    return lignes
+
+def bareme_modifie():
+    """Première question notée à points doublés, première exigence KO tolérant une réponse partielle"""
+    questions = copy.deepcopy(questionnaire_actif()["questions"])
+    notees = [q for data in questions.values() for q in data["questions"] if q.get("points")]
+    premiere = next(q for q in notees if not q.get("ko"))
+    premiere["points"] = [points * 2 for points in premiere["points"]]
+    ko = next(q for q in notees if q.get("ko") and any(0 < p < 100 for p in q["points"]))
+    ko["points"] = [100 if 0 < p < 100 else p for p in ko["points"]]
+    return compiler_questionnaire(questions)
+
+def test_reevaluation_egale_au_calcul_unitaire(tmp_path):
+    ancien = questionnaire_actif()["compile"]
+    nouveau = bareme_modifie()
+    lignes = evaluations(random.Random(0), ancien, 300)
+    construire_archive(str(tmp_path), lignes, questionnaire=ancien)
+    
+    resultat = reevaluer(ouvrir_archive(str(tmp_path)), nouveau, ancien)
+    for i, ligne in enumerate(lignes):
+        attendus = calculer_score(ligne["reponses"], nouveau)
+        assert int(resultat["scores"][i]) == attendus["score"]
+        assert resultat["codes"][resultat["statuts"][i]] == determiner_eligibilite(attendus)["statut"]
+        assert resultat["codes"][resultat["anciens_statuts"][i]] == ligne["statut"]
@@ -0,0 +1,29 @@
+"""Points de reprise des sessions, sur une base temporaire"""
+
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.moteur import compacter_reponses
+from ifs_eligibilite.reprise import enregistrer_point, charger_point, nouveau_jeton
+
+def test_point_relu(tmp_path):
+    chemin = str(tmp_path / "sessions.db")
+    definition = questionnaire_actif()
+    reponses = compacter_reponses({"ko_1": "Oui", "nom_entreprise": "Exemple"}, definition["compile"])
+    jeton = nouveau_jeton()
+    enregistrer_point(jeton, definition["empreinte"], 3, reponses, 12, chemin=chemin)
+    
+    point = charger_point(jeton, chemin=chemin)
+    assert point["etape"] == 3
+    assert point["evaluation_id"] == 12
+    assert point["reponses"].choix == reponses.choix
+    assert dict(point["reponses"]) == dict(reponses)
+    assert charger_point(nouveau_jeton(), chemin=chemin) is None
+    assert charger_point("", chemin=chemin) is None
+
+def test_point_d_une_version_non_chargee(tmp_path):
+    """Les octets d'une autre version du questionnaire ne sont pas relus avec les positions de l'actif"""
+    chemin = str(tmp_path / "sessions.db")
+    reponses = compacter_reponses({"ko_1": "Oui"})
+    jeton = nouveau_jeton()
+    enregistrer_point(jeton, "ffffffffffffffff", 2, reponses, chemin=chemin)
+    
+    assert charger_point(jeton, chemin=chemin) is None
@@ -0,0 +1,109 @@
+"""Stockage SQLite des évaluations, sur une base temporaire"""
+
+import sqlite3
+
+from ifs_eligibilite import stockage
+from ifs_eligibilite.questionnaire import questionnaire_actif
+from ifs_eligibilite.moteur import calculer_score, determiner_eligibilite
+from ifs_eligibilite.analytique import reconstruire_agregats
+from ifs_eligibilite.stockage import (
+    sauvegarder_evaluation,
+    supprimer_evaluation,
+    charger_evaluation,
+    charger_evaluation_jeton,
+    inserer_lot,
+    connexion,
+)
+
+def test_reprise_par_jeton(tmp_path):
+    chemin = str(tmp_path / "evaluations.db")
+    evaluation_id = sauvegarder_evaluation({"ko_1": "Oui"}, 2, chemin=chemin, jeton="jeton-connu")
+    
+    evaluation = charger_evaluation_jeton("jeton-connu", chemin=chemin)
+    assert evaluation["id"] == evaluation_id
+    assert evaluation["reponses"] == {"ko_1": "Oui"}
+    assert evaluation["etape"] == 2
+    
+    # La mise à jour garde le jeton du premier enregistrement
+    sauvegarder_evaluation({"ko_1": "Non"}, 3, evaluation_id=evaluation_id, chemin=chemin, jeton="autre")
+    assert charger_evaluation_jeton("jeton-connu", chemin=chemin)["reponses"] == {"ko_1": "Non"}
+    assert charger_evaluation_jeton("autre", chemin=chemin) is None
+
+def test_identifiant_sequentiel_refuse(tmp_path):
+    chemin = str(tmp_path / "evaluations.db")
+    evaluation_id = sauvegarder_evaluation({"ko_1": "Oui"}, chemin=chemin)
+    inserer_lot([{"ko_1": "Oui"}, {"ko_1": "Non"}], chemin=chemin)
+    
+    for identifiant in range(1, evaluation_id + 3):
+        assert charger_evaluation_jeton(str(identifiant), chemin=chemin) is None
+    jetons = [ligne["jeton"] for ligne in connexion(chemin).execute("SELECT jeton FROM evaluations")]
+    assert len(set(jetons)) == 3
+    assert all(jeton and len(jeton) >= 16 for jeton in jetons)
+
+def test_jetons_des_evaluations_anciennes(tmp_path):
+    chemin = str(tmp_path / "ancienne.db")
+    # Base créée avant les colonnes ajoutées : le schéma d'origine seul
+    ancienne = sqlite3.connect(chemin)
+    ancienne.executescript(stockage.SCHEMA)
+    ancienne.executemany(
+        "INSERT INTO evaluations (date_creation, date_evaluation, etape, reponses) VALUES (?, ?, ?, ?)",
+        [("2024-01-01T10:00:00", "2024-01-01T10:00:00", 2, '{"ko_1": "Oui"}')] * 3
+    )
+    ancienne.commit()
+    ancienne.close()
+    
+    conn = connexion(chemin)
+    lignes = conn.execute("SELECT id, jeton FROM evaluations ORDER BY id").fetchall()
+    jetons = [ligne["jeton"] for ligne in lignes]
+    assert None not in jetons
+    assert len(set(jetons)) == 3
+    for ligne in lignes:
+        assert charger_evaluation_jeton(ligne["jeton"], chemin=chemin)["id"] == ligne["id"]
+        assert charger_evaluation(ligne["id"], chemin=chemin)["jeton"] == ligne["jeton"]
+
+def _agregats(conn):
+    """Contenu des tables d'agrégats, sans les lignes ramenées à zéro par les retraits"""
+    return {
+        "statut": {
+            (jour, statut): (nombre, round(somme, 6))
+            for jour, statut, nombre, somme in conn.execute("SELECT * FROM agregats_statut WHERE nombre != 0")
+        },
+        "categories": {
+            (jour, categorie): (nombre, round(somme, 6))
+            for jour, categorie, nombre, somme in conn.execute("SELECT * FROM agregats_categories WHERE nombre != 0")
+        },
+        "ko": dict(conn.execute("SELECT reference, echecs FROM agregats_ko WHERE echecs != 0").fetchall()),
+        "distribution": {
+            (serie, dixieme): nombre
+            for serie, dixieme, nombre in conn.execute("SELECT * FROM agregats_distribution WHERE nombre != 0")
+        },
+    }
+
+def _terminer(reponses, evaluation_id=None, chemin=None):
+    resultats = calculer_score(reponses)
+    return sauvegarder_evaluation(
+        reponses, 6, resultats, determiner_eligibilite(resultats), evaluation_id=evaluation_id, chemin=chemin
+    )
+
+def test_agregats_egaux_au_recalcul(tmp_path):
+    chemin = str(tmp_path / "evaluations.db")
+    index = questionnaire_actif()["compile"]["index"]
+    conformes = {question_id: max(q["points"], key=q["points"].get) for question_id, q in index.items()}
+    faibles = {question_id: min(q["points"], key=q["points"].get) for question_id, q in index.items()}
+    
+    _terminer(conformes, chemin=chemin)
+    modifiee = _terminer(conformes, chemin=chemin)
+    supprimee = _terminer(faibles, chemin=chemin)
+    en_cours = sauvegarder_evaluation(faibles, 3, chemin=chemin)
+    # Réenregistrement avec d'autres réponses, en cours puis terminée
+    _terminer(faibles, evaluation_id=modifiee, chemin=chemin)
+    _terminer({**faibles, **{q: conformes[q] for q in list(conformes)[:5]}}, evaluation_id=modifiee, chemin=chemin)
+    _terminer(faibles, evaluation_id=en_cours, chemin=chemin)
+    assert supprimer_evaluation(supprimee, chemin=chemin)
+    assert not supprimer_evaluation(supprimee, chemin=chemin)
+    
+    conn = connexion(chemin)
+    incrementaux = _agregats(conn)
+    assert sum(nombre for nombre, _ in incrementaux["statut"].values()) == 3
+    reconstruire_agregats(conn)
+    assert incrementaux == _agregats(conn)